@@ -0,0 +1,200 @@
+"""
+Async versions of the hot read endpoints and the drive time proxy.
+
+Served through backend/asgi.py (SERVER_INTERFACE=asgi in gunicorn.conf.py),
+a request waiting on the remote Postgres server or on Esri here holds no
+worker thread, so one process keeps serving other requests meanwhile. Data
+is read with the async ORM and Esri is called through httpx's AsyncClient
+(see drive_time.aget_polygons). Django's async ORM still runs each query on
+a thread of the request's own, so the gain is largest for upstream calls
+and for many slow requests in flight at once. Under WSGI these views work
+too, but each then runs in an event loop of its own.
+
+The responses are the plain JSON of the matching sync endpoints, and the
+project-scoped ones share the per-project response cache. DRF's APIView is
+sync only, so these are plain Django views; async_api_view() provides the
+parts of DRF they need: JWT authentication, JSON error bodies and
+rendering. TopoJSON and the browsable API stay on the sync endpoints.
+"""
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db.models import Prefetch
+from django.http import Http404, HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated
+
+from .authentication import CachedJWTAuthentication
+from .drive_time import RoutingError, get_drive_time_service
+from .fast_serializers import amarket_area_list_response
+from .models import LabelPosition, MapConfiguration, MarketArea, Project
+from .parsers import orjson
+from .renderers import FastJSONRenderer
+from .response_cache import cached_response, response_cache_key, store_response, store_when_sent
+from .serializers import (
+    LabelPositionSerializer, MapConfigurationSerializer, ProjectDetailSerializer, with_raw_json,
+)
+from .views import drive_time_batch, drive_time_polygons_body, order_market_areas
+
+
+loads = orjson.loads if orjson is not None else json.loads
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    return HttpResponse(FastJSONRenderer().render(data), content_type='application/json', status=status)
+
+
+def _error_response(exc):
+    detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    return json_response(detail, status=exc.status_code)
+
+
+def async_api_view(*methods):
+    """
+    Decorator for async views that require an authenticated user, as
+    IsAuthenticated does for the DRF views. Authentication is JWT only,
+    so like DRF's views they are exempt from CSRF checks.
+    """
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                response = json_response(
+                    {'detail': f'Method "{request.method}" not allowed.'},
+                    status=status.HTTP_405_METHOD_NOT_ALLOWED,
+                )
+                response['Allow'] = ', '.join(methods)
+                return response
+
+            authenticator = CachedJWTAuthentication()
+            try:
+                result = await authenticator.aauthenticate(request)
+                if result is None:
+                    raise NotAuthenticated()
+            except APIException as e:
+                response = _error_response(e)
+                response.status_code = status.HTTP_401_UNAUTHORIZED
+                response['WWW-Authenticate'] = authenticator.authenticate_header(request)
+                return response
+            request.user, request.auth = result
+
+            try:
+                return await view(request, *args, **kwargs)
+            except Http404:
+                return json_response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+            except APIException as e:
+                return _error_response(e)
+        return wrapper
+    return decorator
+
+
+def _cache_lookup(request, project_id):
+    key = response_cache_key(project_id, request)
+    return key, cached_response(request, key)
+
+
+async def project_cached(request, project_id, build):
+    """
+    Response from the project's response cache, or `await build()` stored
+    there. A None project skips the cache, as with cache_project_response.
+    """
+    if project_id is None:
+        return await build()
+
+    key, response = await sync_to_async(_cache_lookup)(request, project_id)
+    if response is not None:
+        return response
+
+    response = await build()
+    if response.status_code == 200 and response.streaming:
+        store_when_sent(key, response)
+        response['X-Cache'] = 'MISS'
+    elif response.status_code == 200:
+        response = await sync_to_async(store_response)(request, key, response)
+        response['X-Cache'] = 'MISS'
+    return response
+
+
+@async_api_view('GET')
+async def project_detail(request, pk):
+    """Project bundle: the project with its market areas and users."""
+    async def build():
+        market_areas = Prefetch('market_areas', queryset=with_raw_json(MarketArea.objects.all(), 'geometry'))
+        try:
+            project = await Project.objects.prefetch_related(market_areas, 'users').aget(pk=pk)
+        except Project.DoesNotExist:
+            raise Http404
+        return json_response(ProjectDetailSerializer(project).data)
+
+    return await project_cached(request, pk, build)
+
+
+@async_api_view('GET')
+async def market_area_list(request, project_id):
+    async def build():
+        project_number = await Project.objects.filter(id=project_id).values_list(
+            'project_number', flat=True
+        ).afirst()
+        queryset = order_market_areas(MarketArea.objects.filter(project_id=project_id), request.GET.get('ordering'))
+        return await amarket_area_list_response(queryset, project_number)
+
+    return await project_cached(request, project_id, build)
+
+
+@async_api_view('GET')
+async def map_configuration_list(request):
+    project_id = request.GET.get('project')
+
+    async def build():
+        if not project_id:
+            return json_response([])
+        configurations = [
+            configuration async for configuration in
+            MapConfiguration.objects.filter(project_id=project_id).order_by('order')
+        ]
+        return json_response(MapConfigurationSerializer(configurations, many=True).data)
+
+    return await project_cached(request, project_id, build)
+
+
+@async_api_view('GET')
+async def label_position_list(request):
+    project_id = request.GET.get('project')
+    map_config_id = request.GET.get('map_configuration')
+
+    async def build():
+        queryset = LabelPosition.objects.all()
+        if project_id:
+            queryset = queryset.filter(project_id=project_id)
+        if map_config_id:
+            queryset = queryset.filter(map_configuration_id=map_config_id)
+        labels = [label async for label in queryset]
+        return json_response(LabelPositionSerializer(labels, many=True).data)
+
+    return await project_cached(request, project_id, build)
+
+
+@async_api_view('POST')
+async def drive_time_polygons(request):
+    """Async DriveTimePolygonView: polygons missing from the cache are solved concurrently."""
+    try:
+        data = loads(request.body or b'{}')
+    except ValueError as e:
+        return json_response({'detail': f'JSON parse error - {e}'}, status=status.HTTP_400_BAD_REQUEST)
+
+    batch, error = drive_time_batch(data.get('points', []) if isinstance(data, dict) else None)
+    if error is not None:
+        return json_response(error, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        results = await get_drive_time_service().aget_polygons(batch)
+    except RoutingError as e:
+        return json_response({
+            'error': 'Failed to calculate drive time polygons',
+            'details': str(e)
+        }, status=status.HTTP_502_BAD_GATEWAY)
+
+    return json_response(drive_time_polygons_body(batch, results))
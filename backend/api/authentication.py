@@ -0,0 +1,100 @@
+"""
+JWT authentication with a short-lived cache of resolved users.
+
+simplejwt's JWTAuthentication loads the user row on every request. Here the
+user is kept in Django's cache for AUTH_USER_CACHE['TIMEOUT'] seconds under
+its id, and dropped by a signal whenever the user is saved or deleted, so
+deactivating a user or resetting their password takes effect on the next
+request. The active and password checks still run against the cached user.
+aauthenticate() is the same for async views. With a database-backed cache a
+cache hit costs as much as loading the user, so the cache is skipped then.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.db import DatabaseCache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+DEFAULT_SETTINGS = {
+    'TIMEOUT': 300,
+}
+
+
+def get_auth_cache_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'AUTH_USER_CACHE', {})}
+
+
+def _cache_timeout():
+    """Seconds to keep a user, or 0 when the cache would not save a query."""
+    if isinstance(caches[DEFAULT_CACHE_ALIAS], DatabaseCache):
+        return 0
+    return get_auth_cache_settings()['TIMEOUT']
+
+
+def _user_key(user_id):
+    return f'auth_user:{user_id}'
+
+
+def invalidate_user(user_id):
+    """Forget a cached user, now and again once the write commits."""
+    key = _user_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        timeout = _cache_timeout()
+        if user_id is None or not timeout:
+            return super().get_user(validated_token)
+
+        key = _user_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(validated_token)
+            cache.set(key, user, timeout)
+            return user
+
+        self.check_cached_user(user, validated_token)
+        return user
+
+    def check_cached_user(self, user, validated_token):
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN and (
+            validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)
+        ):
+            raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        timeout = _cache_timeout()
+        if user_id is None or not timeout:
+            return await sync_to_async(super().get_user)(validated_token)
+
+        key = _user_key(user_id)
+        user = await cache.aget(key)
+        if user is None:
+            user = await sync_to_async(super().get_user)(validated_token)
+            await cache.aset(key, user, timeout)
+            return user
+
+        self.check_cached_user(user, validated_token)
+        return user
@@ -0,0 +1,190 @@
+"""
+National baseline (benchmark) values for reports.
+
+A baseline vintage is a directory holding a float64 `values.npy` matrix laid
+out one contiguous row per variable (variables x geographies, NaN where
+missing) plus an `index.json` mapping variable keys and geography names to
+row and column. Files are written once by the load_baseline command and
+memory-mapped on read, so every worker shares the same pages and a lookup
+is a dict hit and an array index. A `CURRENT` pointer file names the active
+vintage; swapping it switches all workers without a redeploy.
+"""
+import csv
+import io
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+from django.conf import settings
+
+from .utils import write_atomic
+
+
+DEFAULT_GEOGRAPHY = 'USA'
+LAYOUT_FILE = os.path.join(os.path.dirname(__file__), 'data', 'usa_data_layout.json')
+
+
+def get_baseline_dir():
+    return getattr(settings, 'BASELINE_DATA_DIR', os.path.join(settings.BASE_DIR, 'baseline_data'))
+
+
+def short_key(variable):
+    """'AtRisk.TOTPOP_CY' -> 'TOTPOP_CY', the key reports and USA Data.csv use."""
+    return variable.split('.')[-1]
+
+
+def parse_number(value):
+    value = (value or '').strip().replace(',', '').replace('$', '').rstrip('%')
+    if not value:
+        return np.nan
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+class BaselineLayoutError(ValueError):
+    pass
+
+
+def read_baseline_csv(path):
+    """
+    Parse a baseline CSV into (geographies, variables, rows).
+
+    Two layouts are accepted: the legacy single-column `USA Data.csv`
+    (values in the order of data/usa_data_layout.json) or a wide table with
+    a header of variable keys and one row per geography, the geography name
+    in the first column. A legacy file whose value count differs from the
+    layout raises BaselineLayoutError: its values would no longer line up
+    with their variables.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        rows = [row for row in csv.reader(f)]
+
+    if all(len(row) <= 1 for row in rows):
+        with open(LAYOUT_FILE) as f:
+            layout = json.load(f)
+        cells = [row[0] if row else '' for row in rows]
+        geography = cells[0].strip() or DEFAULT_GEOGRAPHY
+        values = [parse_number(cell) for cell in cells[layout['header_rows']:]]
+        if len(values) != len(layout['variables']):
+            raise BaselineLayoutError(
+                f"{path} has {len(values)} values but data/usa_data_layout.json lists "
+                f"{len(layout['variables'])} variables"
+            )
+        return [geography], layout['variables'], [values]
+
+    header = rows[0]
+    variables = [column.strip() for column in header[1:]]
+    geographies, table = [], []
+    for row in rows[1:]:
+        if not row or not row[0].strip():
+            continue
+        geographies.append(row[0].strip())
+        cells = row[1:] + [''] * (len(variables) - len(row) + 1)
+        table.append([parse_number(cell) for cell in cells[:len(variables)]])
+    return geographies, variables, table
+
+
+def write_baseline(geographies, variables, rows, vintage, directory=None):
+    """
+    Write a vintage as values.npy + index.json and point CURRENT at it.
+    Vintages are never rewritten, as workers may have one memory-mapped:
+    FileExistsError is raised when `vintage` already exists.
+    """
+    directory = directory or get_baseline_dir()
+    vintage_dir = os.path.join(directory, vintage)
+    os.makedirs(directory, exist_ok=True)
+    os.mkdir(vintage_dir)
+
+    # One contiguous row per variable, so a lookup touches a single page
+    values = np.ascontiguousarray(np.asarray(rows, dtype=np.float64).reshape(len(geographies), -1).T)
+    buffer = io.BytesIO()
+    np.save(buffer, values)
+    write_atomic(os.path.join(vintage_dir, 'values.npy'), buffer.getvalue())
+
+    index = {'variables': {}, 'geographies': {name: i for i, name in enumerate(geographies)}}
+    for row, variable in enumerate(variables):
+        index['variables'][variable] = row
+        # Short keys resolve to the first variable that uses them, as in the export
+        index['variables'].setdefault(short_key(variable), row)
+    index.update({
+        'vintage': vintage,
+        'variable_count': len(variables),
+        'loaded_at': datetime.now(timezone.utc).isoformat(),
+    })
+    write_atomic(os.path.join(vintage_dir, 'index.json'), json.dumps(index).encode())
+    write_atomic(os.path.join(directory, 'CURRENT'), vintage.encode())
+    return index
+
+
+class BaselineStore:
+    """Read-only view of one memory-mapped baseline vintage."""
+
+    def __init__(self, vintage_dir):
+        with open(os.path.join(vintage_dir, 'index.json')) as f:
+            index = json.load(f)
+        self.vintage = index['vintage']
+        self.loaded_at = index.get('loaded_at')
+        self.variables = index['variables']
+        self.geographies = index['geographies']
+        self.values = np.load(os.path.join(vintage_dir, 'values.npy'), mmap_mode='r')
+
+    def rows(self, variables):
+        return np.array([self.variables.get(key, -1) for key in variables], dtype=np.intp)
+
+    def lookup(self, variables, geography=DEFAULT_GEOGRAPHY):
+        """Baseline values for `variables` (full ids or short keys); NaN when unknown."""
+        column = self.geographies.get(geography)
+        rows = self.rows(variables)
+        result = np.full(len(rows), np.nan)
+        if column is None:
+            return result
+        known = rows >= 0
+        result[known] = self.values[rows[known], column]
+        return result
+
+    def ratio(self, variables, matrix, geography=DEFAULT_GEOGRAPHY, scale=100.0):
+        """
+        Index of an (areas x variables) matrix against the baseline:
+        value / baseline * scale, NaN where the baseline is missing or zero.
+        """
+        baseline = self.lookup(variables, geography)
+        matrix = np.atleast_2d(np.asarray(matrix, dtype=float))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = matrix / baseline * scale
+        ratio[:, ~(np.isfinite(baseline) & (baseline != 0))] = np.nan
+        return ratio
+
+
+_store = None
+_store_key = None
+_store_lock = threading.Lock()
+
+
+def get_baseline_store():
+    """
+    The active baseline vintage, reopened when CURRENT changes. Returns None
+    until load_baseline has been run.
+    """
+    global _store, _store_key
+    pointer = os.path.join(get_baseline_dir(), 'CURRENT')
+    try:
+        stat = os.stat(pointer)
+    except FileNotFoundError:
+        return None
+    key = (pointer, stat.st_ino, stat.st_mtime_ns)
+    if key != _store_key:
+        with _store_lock:
+            if key != _store_key:
+                with open(pointer) as f:
+                    vintage = f.read().strip()
+                _store = BaselineStore(os.path.join(get_baseline_dir(), vintage))
+                _store_key = key
+    return _store
+
+
+def to_json_values(array):
+    return [None if not np.isfinite(value) else float(value) for value in array]
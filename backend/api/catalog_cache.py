@@ -0,0 +1,174 @@
+"""
+In-process cache of small, read-mostly catalogs (colour keys, TCG themes,
+global style and variable presets).
+
+Each catalog is held fully serialized, together with its JSON encoding and
+an ETag, and tagged with a version counter stored in CacheVersion. Signals
+bump the counter on every write. The current version is mirrored in
+Django's cache, so a request is answered from memory without touching the
+database (with the in-memory or Redis cache of CACHES; a database-backed
+cache would cost a query per lookup). The mirror lives in the cache every
+worker shares, is dropped there when a bump commits and otherwise expires
+after VERSION_TIMEOUT. Compressed copies of the JSON are kept on the entry, one
+per encoding.
+"""
+import hashlib
+import heapq
+import json
+import threading
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .compression import compress, etag_matches, mark_encoded, negotiate, worth_compressing
+from .models import CacheVersion, ColorKey, StylePreset, TcgTheme, VariablePreset
+from .serializers import ColorKeySerializer, StylePresetSerializer, TcgThemeSerializer, VariablePresetSerializer
+
+
+VERSION_TIMEOUT = 60
+
+
+def _version_key(name):
+    return f'cache_version:{name}'
+
+
+def get_version(name):
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        version = CacheVersion.objects.filter(name=name).values_list('version', flat=True).first() or 0
+        cache.set(key, version, VERSION_TIMEOUT)
+    return version
+
+
+def bump_version(*names):
+    """Increment catalog versions; readers see the new version once the write commits."""
+    for name in names:
+        if not CacheVersion.objects.filter(name=name).update(version=F('version') + 1):
+            try:
+                with transaction.atomic():
+                    CacheVersion.objects.create(name=name, version=1)
+            except IntegrityError:
+                CacheVersion.objects.filter(name=name).update(version=F('version') + 1)
+    keys = [_version_key(name) for name in names]
+    # Once now for this connection, again after commit for workers that re-read in between
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class CachedEntry:
+    def __init__(self, version, payload, content, etag, by_id):
+        self.version = version
+        self.payload = payload
+        self.content = content
+        self.etag = etag
+        self.by_id = by_id
+        self.encoded = {}
+
+    def encode(self, encoding):
+        """The JSON body in `encoding`, compressed on first use."""
+        compressed = self.encoded.get(encoding)
+        if compressed is None:
+            compressed = self.encoded[encoding] = compress(self.content, encoding, stored=True)
+        return compressed
+
+
+class VersionedCatalog:
+    """A serialized catalog rebuilt by `build()` whenever its version changes."""
+
+    def __init__(self, name, build):
+        self.name = name
+        self.build = build
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        version = get_version(self.name)
+        entry = self._entry
+        if entry is None or entry.version != version:
+            with self._lock:
+                entry = self._entry
+                if entry is None or entry.version != version:
+                    content = JSONRenderer().render(self.build())
+                    # Plain dicts/lists, so cached rows can't be mutated through a serializer
+                    payload = json.loads(content)
+                    etag = f'"{self.name}-{version}-{hashlib.md5(content).hexdigest()[:12]}"'
+                    by_id = {str(item.get('id')): item for item in payload if isinstance(item, dict)}
+                    entry = self._entry = CachedEntry(version, payload, content, etag, by_id)
+        return entry
+
+
+def catalog_response(request, catalog, pk=None):
+    """
+    Answer a list (or, with `pk`, a retrieve) request from the catalog
+    cache, honouring If-None-Match.
+    """
+    entry = catalog.get()
+    if etag_matches(request, entry.etag):
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    elif pk is not None:
+        item = entry.by_id.get(str(pk))
+        if item is None:
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        response = Response(item)
+    elif getattr(request, 'accepted_renderer', None) is not None and request.accepted_renderer.format == 'json':
+        # Pre-encoded (and pre-compressed) bytes; skips serializing and rendering altogether
+        encoding = negotiate(request)
+        if encoding is not None and worth_compressing(entry.content):
+            response = HttpResponse(entry.encode(encoding), content_type='application/json')
+            response['ETag'] = entry.etag
+            response['Cache-Control'] = 'private, no-cache'
+            return mark_encoded(response, encoding)
+        response = HttpResponse(entry.content, content_type='application/json')
+    else:
+        response = Response(entry.payload)
+    response['ETag'] = entry.etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+_OLDEST = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def _last_modified(item):
+    # Compared as datetimes: ISO strings differ in precision and offset
+    value = item.get('last_modified')
+    parsed = parse_datetime(value) if isinstance(value, str) else None
+    if parsed is None:
+        return _OLDEST
+    return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=timezone.utc)
+
+
+def merge_by_last_modified(*payloads):
+    """Merge payloads each sorted newest first into one list, newest first."""
+    return list(heapq.merge(*payloads, key=_last_modified, reverse=True))
+
+
+def _color_keys():
+    return ColorKeySerializer(ColorKey.objects.order_by('key_number'), many=True).data
+
+
+def _tcg_themes():
+    return TcgThemeSerializer(TcgTheme.objects.select_related('color_key').order_by('theme_key'), many=True).data
+
+
+def _global_presets(model, serializer_class):
+    def build():
+        queryset = model.objects.filter(is_global=True).select_related('created_by', 'project')
+        return serializer_class(queryset, many=True).data
+    return build
+
+
+COLOR_KEYS = VersionedCatalog('color_keys', _color_keys)
+TCG_THEMES = VersionedCatalog('tcg_themes', _tcg_themes)
+GLOBAL_STYLE_PRESETS = VersionedCatalog('global_style_presets', _global_presets(StylePreset, StylePresetSerializer))
+GLOBAL_VARIABLE_PRESETS = VersionedCatalog(
+    'global_variable_presets', _global_presets(VariablePreset, VariablePresetSerializer)
+)
@@ -0,0 +1,257 @@
+"""
+Class breaks for data-driven (class-breaks) map layers.
+
+Natural breaks use the Ckmeans formulation of Jenks: an exact dynamic
+program that minimizes within-class sum of squares. Each DP row is filled
+with divide and conquer over the monotone optimal split, and every level of
+that recursion is evaluated as one vectorized NumPy step, giving
+O(k * n log n) work in O(k log n) array operations. Repeated values are
+collapsed and weighted first, so integer-valued variables shrink a lot.
+
+Results are cached per (variable, area type, extent, method, class count)
+and data version so every user of a map sees the same breaks. The data
+version is the caller's vintage when one is given, otherwise a digest of
+the values, so changed data is never answered with breaks of older data.
+"""
+import hashlib
+import json
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+
+METHODS = ('natural-breaks', 'quantile', 'equal-interval', 'standard-deviation')
+METHOD_ALIASES = {
+    'natural': 'natural-breaks',
+    'jenks': 'natural-breaks',
+    'natural_breaks': 'natural-breaks',
+    'equal_interval': 'equal-interval',
+    'std_dev': 'standard-deviation',
+    'stddev': 'standard-deviation',
+}
+DEFAULT_SETTINGS = {
+    'MAX_CLASSES': 32,
+    'EXTENT_DECIMALS': 3,  # Extents closer than ~100 m share cached breaks
+    'CACHE_TIMEOUT': 60 * 60 * 24,
+}
+
+
+def get_class_break_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'CLASS_BREAKS', {})}
+
+
+def normalize_method(method):
+    method = METHOD_ALIASES.get(method, method)
+    if method not in METHODS:
+        raise ValueError(f"Unknown classification method '{method}'; expected one of {', '.join(METHODS)}")
+    return method
+
+
+def _first_in_segments(mask, starts):
+    """Offset of the first True of each segment of `mask`, segments beginning at `starts`."""
+    hits = np.flatnonzero(mask)
+    return hits[np.searchsorted(hits, starts)]
+
+
+def ckmeans(values, weights, k):
+    """
+    Optimal 1-D k-means over sorted distinct `values` with `weights`.
+    Returns the index into `values` where each class starts.
+    """
+    n = len(values)
+    sum_w = np.concatenate([[0.0], np.cumsum(weights)])
+    sum_x = np.concatenate([[0.0], np.cumsum(weights * values)])
+    sum_xx = np.concatenate([[0.0], np.cumsum(weights * values * values)])
+
+    def cost(j, i):
+        """Within-class sum of squares of values[j..i]."""
+        w = sum_w[i + 1] - sum_w[j]
+        s = sum_x[i + 1] - sum_x[j]
+        return np.maximum(sum_xx[i + 1] - sum_xx[j] - s * s / w, 0.0)
+
+    index = np.arange(n)
+    previous = cost(np.zeros(n, dtype=np.intp), index)
+    starts = np.zeros((k, n), dtype=np.intp)
+
+    for q in range(1, k):
+        current = np.full(n, np.inf)
+        # Pending (ilo, ihi, jlo, jhi) ranges: fill i in [ilo, ihi] knowing
+        # the best class start lies in [jlo, jhi]
+        tasks = np.array([[q, n - 1, q, n - 1]], dtype=np.intp)
+        while len(tasks):
+            ilo, ihi, jlo, jhi = tasks.T
+            mid = (ilo + ihi) // 2
+            lo = np.maximum(jlo, q)
+            hi = np.minimum(jhi, mid)
+            lengths = hi - lo + 1
+            offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+
+            segment = np.repeat(np.arange(len(tasks)), lengths)
+            j = lo[segment] + (np.arange(lengths.sum()) - offsets[segment])
+            candidates = previous[j - 1] + cost(j, mid[segment])
+
+            best = np.minimum.reduceat(candidates, offsets)
+            best_j = j[_first_in_segments(candidates == best[segment], offsets)]
+            current[mid] = best
+            starts[q, mid] = best_j
+
+            left = np.column_stack([ilo, mid - 1, jlo, best_j])
+            right = np.column_stack([mid + 1, ihi, best_j, jhi])
+            tasks = np.concatenate([left[ilo <= mid - 1], right[mid + 1 <= ihi]])
+        previous = current
+
+    bounds = []
+    i = n - 1
+    for q in range(k - 1, -1, -1):
+        j = starts[q, i] if q else 0
+        bounds.append(j)
+        i = j - 1
+    return bounds[::-1]
+
+
+def natural_breaks(values, classes):
+    distinct, counts = np.unique(values, return_counts=True)
+    classes = min(classes, len(distinct))
+    class_starts = ckmeans(distinct, counts.astype(float), classes)
+    ends = [start - 1 for start in class_starts[1:]] + [len(distinct) - 1]
+    return [float(distinct[0])] + [float(distinct[end]) for end in ends]
+
+
+def quantile_breaks(values, classes):
+    return [float(edge) for edge in np.quantile(values, np.linspace(0, 1, classes + 1))]
+
+
+def equal_interval_breaks(values, classes):
+    return [float(edge) for edge in np.linspace(values.min(), values.max(), classes + 1)]
+
+
+def standard_deviation_breaks(values, classes):
+    """One-standard-deviation classes centered on the mean, outer classes open to the data range."""
+    mean, std = float(values.mean()), float(values.std())
+    if std == 0:
+        return [float(values.min()), float(values.max())]
+    edges = np.clip(mean + std * (np.arange(classes + 1) - classes / 2), values.min(), values.max())
+    edges[0], edges[-1] = values.min(), values.max()
+    return [float(edge) for edge in edges]
+
+
+BREAK_FUNCTIONS = {
+    'natural-breaks': natural_breaks,
+    'quantile': quantile_breaks,
+    'equal-interval': equal_interval_breaks,
+    'standard-deviation': standard_deviation_breaks,
+}
+
+
+def numeric_values(values):
+    """The finite numbers among `values` as a float array."""
+    data = np.asarray([value for value in values if isinstance(value, (int, float))], dtype=float)
+    return data[np.isfinite(data)]
+
+
+def values_digest(values):
+    """Digest of the values that are classified; independent of their order."""
+    return hashlib.md5(np.sort(numeric_values(values)).tobytes()).hexdigest()
+
+
+def compute_class_breaks(values, method='natural-breaks', classes=7):
+    """
+    Class edges (classes + 1 values from min to max) plus per-class counts
+    and summary statistics. Non-numeric and non-finite values are ignored.
+    """
+    method = normalize_method(method)
+    data = numeric_values(values)
+    if data.size == 0:
+        raise ValueError('No numeric values to classify')
+
+    edges = BREAK_FUNCTIONS[method](data, classes)
+    # Duplicate edges (heavy ties, tiny data sets) would make empty classes
+    edges = sorted(set(edges))
+    if len(edges) == 1:
+        edges = edges * 2
+
+    # Classes are (low, high], the first one [min, high], as in classBreakInfos
+    # and the natural-breaks classes; np.histogram's bins are [low, high)
+    classes_of = np.maximum(np.searchsorted(edges, data, side='left') - 1, 0)
+    counts = np.bincount(classes_of, minlength=len(edges) - 1) if edges[0] < edges[-1] else np.array([data.size])
+    return {
+        'method': method,
+        'classes': len(edges) - 1,
+        'breaks': edges,
+        'counts': [int(count) for count in counts],
+        'stats': {
+            'count': int(data.size),
+            'min': float(data.min()),
+            'max': float(data.max()),
+            'mean': float(data.mean()),
+            'std': float(data.std()),
+        },
+    }
+
+
+def class_break_infos(result, existing=None):
+    """
+    Renderer classBreakInfos for computed breaks, keeping the symbols of an
+    existing renderer spec by class index.
+    """
+    existing = existing or []
+    infos = []
+    edges = result['breaks']
+    for index, (low, high) in enumerate(zip(edges, edges[1:])):
+        info = {
+            'minValue': low,
+            'maxValue': high,
+            'label': f'{low:,.6g} - {high:,.6g}',
+            'isLastBreak': index == len(edges) - 2,
+            'dataSource': 'server_class_breaks',
+        }
+        if existing:
+            symbol = existing[min(index, len(existing) - 1)].get('symbol')
+            if symbol is not None:
+                info['symbol'] = symbol
+        infos.append(info)
+    return infos
+
+
+def apply_to_layer_configuration(layer_configuration, variable, result):
+    """Write computed breaks into a MapConfiguration.layer_configuration renderer spec."""
+    configuration = dict(layer_configuration or {})
+    configuration.update({
+        'type': 'class-breaks',
+        'field': configuration.get('field') or variable,
+        'classBreakInfos': class_break_infos(result, configuration.get('classBreakInfos')),
+        'breakType': result['method'],
+        'optimizationStats': result['stats'],
+    })
+    return configuration
+
+
+def class_breaks_cache_key(variable, area_type, extent, method, classes, data_version):
+    decimals = get_class_break_settings()['EXTENT_DECIMALS']
+    extent = [round(float(value), decimals) for value in extent] if extent else None
+    payload = json.dumps([variable, area_type, extent, method, classes, data_version])
+    # v3: keys include the data version
+    return 'class_breaks:v3:' + hashlib.md5(payload.encode()).hexdigest()
+
+
+def get_class_breaks(variable, area_type, extent, method, classes, values=None, vintage=None):
+    """
+    Cached class breaks for `values`, or for the data release `vintage`.
+    With a vintage, `values` are only needed on a cache miss; returns None
+    when nothing is cached and no values were given.
+    """
+    method = normalize_method(method)
+    options = get_class_break_settings()
+    if not 2 <= classes <= options['MAX_CLASSES']:
+        raise ValueError(f"classes must be between 2 and {options['MAX_CLASSES']}")
+    if vintage is None and values is None:
+        return None
+
+    data_version = ['vintage', vintage] if vintage is not None else ['values', values_digest(values)]
+    key = class_breaks_cache_key(variable, area_type, extent, method, classes, data_version)
+    result = cache.get(key)
+    if result is None and values is not None:
+        result = compute_class_breaks(values, method, classes)
+        cache.set(key, result, options['CACHE_TIMEOUT'])
+    return result
@@ -0,0 +1,125 @@
+"""
+Deep copy of a project.
+
+Every related table is read once and written back with one bulk_create, so
+the number of queries stays the same however many market areas, map tabs
+and labels a project has. Market area ids embedded in label ids and layer
+configurations (e.g. 'id-<uuid>') are rewritten to the copies.
+"""
+import json
+import re
+import uuid
+
+from django.db import transaction
+
+from .models import LabelPosition, MapConfiguration, MarketArea, Project, StylePreset, VariablePreset
+from .thumbnails import schedule_thumbnail
+
+
+UUID_PATTERN = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+PROJECT_FIELDS = ('project_number', 'client', 'location', 'description')
+BATCH_SIZE = 200
+
+
+def _remap(text, id_map):
+    return UUID_PATTERN.sub(lambda match: id_map.get(match.group(0), match.group(0)), text)
+
+
+def _remap_json(value, id_map):
+    if value is None or not id_map:
+        return value
+    return json.loads(_remap(json.dumps(value), id_map))
+
+
+def _copy(instance, **changes):
+    """Unsaved copy of a model instance with a fresh primary key."""
+    instance.pk = uuid.uuid4()
+    instance._state.adding = True
+    for field, value in changes.items():
+        setattr(instance, field, value)
+    return instance
+
+
+def _free_name(name, taken):
+    """
+    Non-global presets share one name namespace (unique name + is_global),
+    so copies get the first free '(copy)' suffix.
+    """
+    for index in range(1, len(taken) + 2):
+        suffix = ' (copy)' if index == 1 else f' (copy {index})'
+        candidate = f'{name[:100 - len(suffix)]}{suffix}'
+        if candidate not in taken:
+            taken.add(candidate)
+            return candidate
+
+
+def _copy_presets(model, source, target):
+    presets = list(model.objects.filter(project=source))
+    if not presets:
+        return []
+    taken = set(model.objects.filter(is_global=False).values_list('name', flat=True))
+    return model.objects.bulk_create([
+        _copy(preset, project_id=target.id, name=_free_name(preset.name, taken)) for preset in presets
+    ])
+
+
+def clone_project(source, overrides=None, user=None):
+    """
+    Copy a project with its market areas, map configurations, label
+    positions and project-scoped style and variable presets. `overrides`
+    may replace project_number, client, location or description. Returns
+    the new project and the number of rows copied per table.
+    """
+    overrides = overrides or {}
+    with transaction.atomic():
+        target = Project.objects.create(**{
+            field: overrides.get(field, getattr(source, field)) for field in PROJECT_FIELDS
+        })
+        user_ids = set(source.users.values_list('id', flat=True))
+        if user is not None:
+            user_ids.add(user.id)
+        target.users.add(*user_ids)
+
+        id_map = {}
+        market_areas = []
+        for market_area in MarketArea.objects.filter(project=source):
+            old_id = str(market_area.pk)
+            market_areas.append(_copy(market_area, project_id=target.id))
+            id_map[old_id] = str(market_area.pk)
+        MarketArea.objects.bulk_create(market_areas, batch_size=BATCH_SIZE)
+
+        config_map = {}
+        configurations = []
+        for configuration in MapConfiguration.objects.filter(project=source):
+            old_id = configuration.pk
+            configurations.append(_copy(
+                configuration, project_id=target.id,
+                layer_configuration=_remap_json(configuration.layer_configuration, id_map),
+            ))
+            config_map[old_id] = configuration.pk
+        MapConfiguration.objects.bulk_create(configurations, batch_size=BATCH_SIZE)
+
+        labels = [
+            _copy(
+                label, project_id=target.id,
+                map_configuration_id=config_map.get(label.map_configuration_id),
+                label_id=_remap(label.label_id, id_map),
+            )
+            for label in LabelPosition.objects.filter(project=source)
+        ]
+        LabelPosition.objects.bulk_create(labels, batch_size=BATCH_SIZE)
+
+        style_presets = _copy_presets(StylePreset, source, target)
+        variable_presets = _copy_presets(VariablePreset, source, target)
+
+        # bulk_create sends no post_save, so queue the new project's thumbnail here
+        if market_areas:
+            transaction.on_commit(lambda: schedule_thumbnail(target.id))
+
+    return target, {
+        'market_areas': len(market_areas),
+        'map_configurations': len(configurations),
+        'label_positions': len(labels),
+        'style_presets': len(style_presets),
+        'variable_presets': len(variable_presets),
+    }
@@ -0,0 +1,235 @@
+"""
+Response compression: gzip, and br when the brotli package is installed.
+
+Bodies that are cached anyway (per-project responses, catalogs, vector
+tiles on disk) are compressed once per encoding, stored next to the plain
+body and served as is to clients accepting that encoding, so a cache hit
+costs no compression. CompressionMiddleware compresses the remaining
+responses that are not encoded yet, streamed ones chunk by chunk. Those
+may carry tokens next to reflected input, so as a BREACH mitigation they
+are gzipped with a random-length filename in the gzip header, as Django's
+GZipMiddleware does; brotli has no such field and is only used for the
+stored bodies, which hold no per-user secrets.
+
+Compressed responses get a weak ETag, as Django's GZipMiddleware does;
+etag_matches() compares If-None-Match accordingly.
+"""
+import gzip
+import secrets
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only
+    brotli = None
+
+
+DEFAULT_SETTINGS = {
+    'MIN_LENGTH': 1024,
+    # Per-request compression in the middleware
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 5,
+    # Compressed once and stored with cached bodies, so worth squeezing harder
+    'STORED_GZIP_LEVEL': 9,
+    'STORED_BROTLI_QUALITY': 9,
+    # Upper bound of the random gzip header padding of per-request compression
+    'MAX_RANDOM_BYTES': 100,
+}
+COMPRESSIBLE_TYPES = (
+    'application/json', 'application/topo+json', 'application/vnd.mapbox-vector-tile',
+    'application/javascript', 'image/svg+xml', 'text/',
+)
+
+
+def get_compression_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'RESPONSE_COMPRESSION', {})}
+
+
+def available_encodings():
+    """Supported encodings, preferred first."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(request, encodings=None):
+    """The best of `encodings` (default: all available) the request accepts, or None."""
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    if not header:
+        return None
+    accepted = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding in encodings or available_encodings():
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def is_compressible(content_type):
+    return (content_type or '').split(';')[0].strip().lower().startswith(COMPRESSIBLE_TYPES)
+
+
+def pad_gzip_header(data, max_random_bytes):
+    """
+    The gzip stream `data` with a random-length FNAME field in its header,
+    as django.utils.text.compress_string(max_random_bytes=...) writes it.
+    """
+    if not max_random_bytes:
+        return data
+    header = bytearray(data[:10])
+    header[3] |= gzip.FNAME
+    return bytes(header) + b'a' * secrets.randbelow(max_random_bytes) + b'\x00' + data[10:]
+
+
+def compress(content, encoding, stored=False):
+    """Compress a whole body; per-request (not `stored`) gzip output is padded."""
+    options = get_compression_settings()
+    if encoding == 'br':
+        return brotli.compress(content, quality=options['STORED_BROTLI_QUALITY' if stored else 'BROTLI_QUALITY'])
+    compressor = zlib.compressobj(options['STORED_GZIP_LEVEL' if stored else 'GZIP_LEVEL'], zlib.DEFLATED, 31)
+    compressed = compressor.compress(content) + compressor.flush()
+    return compressed if stored else pad_gzip_header(compressed, options['MAX_RANDOM_BYTES'])
+
+
+def worth_compressing(content):
+    return len(content) >= get_compression_settings()['MIN_LENGTH']
+
+
+class _GzipStream:
+    """Incremental gzip whose header, in the first output, carries random padding."""
+
+    def __init__(self):
+        options = get_compression_settings()
+        self.compressor = zlib.compressobj(options['GZIP_LEVEL'], zlib.DEFLATED, 31)
+        self.max_random_bytes = options['MAX_RANDOM_BYTES']
+        self.started = False
+
+    def _output(self, data):
+        if not self.started and data:
+            self.started = True
+            return pad_gzip_header(data, self.max_random_bytes)
+        return data
+
+    def process(self, chunk):
+        return self._output(self.compressor.compress(chunk) + self.compressor.flush(zlib.Z_SYNC_FLUSH))
+
+    def finish(self):
+        return self._output(self.compressor.flush())
+
+
+def compress_stream(chunks, encoding):
+    """Compress an iterable of byte chunks incrementally, flushing after each so clients see data as it comes."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=get_compression_settings()['BROTLI_QUALITY'])
+        for chunk in chunks:
+            if chunk:
+                yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+    else:
+        gzipped = _GzipStream()
+        for chunk in chunks:
+            if chunk:
+                yield gzipped.process(chunk)
+        yield gzipped.finish()
+
+
+async def compress_stream_async(chunks, encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=get_compression_settings()['BROTLI_QUALITY'])
+        async for chunk in chunks:
+            if chunk:
+                yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+    else:
+        gzipped = _GzipStream()
+        async for chunk in chunks:
+            if chunk:
+                yield gzipped.process(chunk)
+        yield gzipped.finish()
+
+
+def mark_encoded(response, encoding):
+    """Headers for a response whose body is now in `encoding`."""
+    response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response['ETag'] = f'W/{etag}'
+    if not response.streaming:
+        response['Content-Length'] = str(len(response.content))
+    elif response.has_header('Content-Length'):
+        del response['Content-Length']
+    return response
+
+
+def etag_matches(request, etag):
+    """Weak If-None-Match comparison, so W/-prefixed ETags of compressed variants still match."""
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    wanted = etag[2:] if etag.startswith('W/') else etag
+    return any(tag == '*' or (tag[2:] if tag.startswith('W/') else tag) == wanted for tag in parse_etags(header))
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses that are not encoded yet (cached bodies arrive
+    here already compressed) with padded gzip. Streaming responses are
+    compressed chunk by chunk instead of being buffered. Works in both sync
+    and async stacks, so ASGI requests don't switch threads for it.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding') or not is_compressible(response.get('Content-Type')):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        # gzip only: its header can be padded against BREACH, brotli's can't
+        encoding = negotiate(request, ('gzip',))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = compress_stream_async(response.streaming_content, encoding)
+            else:
+                response.streaming_content = compress_stream(response.streaming_content, encoding)
+            return mark_encoded(response, encoding)
+
+        if not worth_compressing(response.content):
+            return response
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        return mark_encoded(response, encoding)
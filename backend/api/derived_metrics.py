@@ -0,0 +1,243 @@
+"""
+Derived report metrics over enriched values.
+
+A VariablePreset declares formulas (shares, per-capita rates, growth,
+index vs. the national baseline, or free arithmetic expressions) that are
+compiled once into closures over whole columns. Evaluating a report is then
+one NumPy operation per formula node over all areas at once, instead of a
+cell-by-cell loop.
+
+Formula spec examples:
+
+    {"key": "POP65_SHARE", "type": "share", "numerator": "POP65_CY", "denominator": "TOTPOP_CY"}
+    {"key": "POP_PER_HH", "type": "per_capita", "numerator": "TOTPOP_CY", "denominator": "TOTHH_CY"}
+    {"key": "POP_CAGR", "type": "growth", "start": "TOTPOP_CY", "end": "TOTPOP_FY", "years": 5}
+    {"key": "INCOME_INDEX", "type": "index", "variable": "MEDHINC_CY"}
+    {"key": "POP_SHARE_OF_TOTAL", "type": "share_of_total", "variable": "TOTPOP_CY"}
+    {"key": "SENIORS", "type": "expression", "expression": "(POP65_CY + POP70_CY) / TOTPOP_CY * 100"}
+
+Variables are matched by full id or short key ('AtRisk.TOTPOP_CY' or
+'TOTPOP_CY'). Divisions by zero and missing inputs give NaN.
+"""
+import ast
+import operator
+
+import numpy as np
+
+from .baseline import get_baseline_store, short_key
+from .utils import LRUCache
+
+
+FORMULA_TYPES = ('share', 'per_capita', 'ratio', 'difference', 'growth', 'index', 'share_of_total', 'expression')
+
+BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: operator.pow,
+}
+
+
+# Larger constant exponents overflow for any base worth raising, and long
+# expressions nest deeply enough to exhaust the stack when compiled
+MAX_EXPONENT = 100
+MAX_EXPRESSION_LENGTH = 500
+
+
+class FormulaError(ValueError):
+    pass
+
+
+class Columns:
+    """Column access over an (areas x variables) matrix by full id or short key."""
+
+    def __init__(self, variables, matrix, geography='USA'):
+        self.matrix = np.atleast_2d(np.asarray(matrix, dtype=float))
+        if self.matrix.shape[1] != len(variables):
+            raise FormulaError(f'Expected {len(variables)} values per area, got {self.matrix.shape[1]}')
+        self.index = {}
+        for i, variable in enumerate(variables):
+            self.index[variable] = i
+            self.index.setdefault(short_key(variable), i)
+        self.variables = variables
+        self.geography = geography
+        self._baseline = None
+
+    def __getitem__(self, name):
+        i = self.index.get(name)
+        if i is None:
+            i = self.index.get(short_key(name))
+        if i is None:
+            return np.full(self.matrix.shape[0], np.nan)
+        return self.matrix[:, i]
+
+    def baseline(self, name):
+        if self._baseline is None:
+            store = get_baseline_store()
+            if store is None:
+                raise FormulaError('No baseline data loaded; run manage.py load_baseline')
+            self._baseline = store
+        return self._baseline.lookup([name], self.geography)[0]
+
+
+def _variable(name):
+    if not isinstance(name, str) or not name:
+        raise FormulaError('Variable names must be non-empty strings')
+    return lambda columns: columns[name]
+
+
+def _compile_node(node):
+    """Turn an expression AST into a closure over Columns."""
+    if isinstance(node, ast.Expression):
+        return _compile_node(node.body)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        # NumPy scalars overflow to inf (then NaN) instead of raising, like the columns
+        value = _constant(node.value)
+        return lambda columns: value
+    if isinstance(node, (ast.Name, ast.Attribute)):
+        return _variable(_dotted_name(node))
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+        if isinstance(node.op, ast.Pow):
+            exponent = _constant_value(node.right)
+            if exponent is not None and abs(exponent) > MAX_EXPONENT:
+                raise FormulaError(f'Exponents are limited to {MAX_EXPONENT}')
+        op = BINARY_OPERATORS[type(node.op)]
+        left, right = _compile_node(node.left), _compile_node(node.right)
+        return lambda columns: op(left(columns), right(columns))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        operand = _compile_node(node.operand)
+        sign = -1.0 if isinstance(node.op, ast.USub) else 1.0
+        return lambda columns: sign * operand(columns)
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and len(node.args) == 1 and not node.keywords:
+        function = node.func.id
+        if function in ('sum', 'mean', 'abs'):
+            argument = _compile_node(node.args[0])
+            reducer = {'sum': np.nansum, 'mean': np.nanmean, 'abs': np.abs}[function]
+            return lambda columns: reducer(argument(columns))
+        if function == 'baseline':
+            name = _dotted_name(node.args[0])
+            return lambda columns: columns.baseline(name)
+    raise FormulaError(f'Unsupported expression element: {ast.dump(node)[:60]}')
+
+
+def _constant(number):
+    try:
+        return np.float64(number)
+    except OverflowError:
+        raise FormulaError(f'Constant {str(number)[:20]}... is too large')
+
+
+def _constant_value(node):
+    """Value of an expression node made of numeric literals only, or None."""
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        value = _constant_value(node.operand)
+        return -value if value is not None and isinstance(node.op, ast.USub) else value
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+        left, right = _constant_value(node.left), _constant_value(node.right)
+        if left is None or right is None:
+            return None
+        with np.errstate(all='ignore'):
+            return BINARY_OPERATORS[type(node.op)](left, right)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return _constant(node.value)
+    return None
+
+
+def _dotted_name(node):
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return f'{_dotted_name(node.value)}.{node.attr}'
+    raise FormulaError('Expected a variable name')
+
+
+def compile_expression(text):
+    if not isinstance(text, str):
+        raise FormulaError('Expressions must be strings')
+    if len(text) > MAX_EXPRESSION_LENGTH:
+        raise FormulaError(f'Expressions are limited to {MAX_EXPRESSION_LENGTH} characters')
+    try:
+        tree = ast.parse(text, mode='eval')
+    except SyntaxError as e:
+        raise FormulaError(f'Invalid expression: {e.msg}')
+    return _compile_node(tree)
+
+
+def _divide(numerator, denominator, scale=1.0):
+    return lambda columns: numerator(columns) / denominator(columns) * scale
+
+
+def compile_formula(spec):
+    """Compile one formula spec into (key, closure). Raises FormulaError when invalid."""
+    if not isinstance(spec, dict):
+        raise FormulaError('Each formula must be an object')
+    key = spec.get('key')
+    if not key or not isinstance(key, str):
+        raise FormulaError('Each formula needs a key')
+    kind = spec.get('type', 'expression')
+
+    try:
+        if kind == 'share':
+            return key, _divide(_variable(spec['numerator']), _variable(spec['denominator']), 100.0)
+        if kind in ('per_capita', 'ratio'):
+            scale = float(spec.get('scale', 1))
+            return key, _divide(_variable(spec['numerator']), _variable(spec['denominator']), scale)
+        if kind == 'difference':
+            left, right = _variable(spec['left']), _variable(spec['right'])
+            return key, lambda columns: left(columns) - right(columns)
+        if kind == 'growth':
+            start, end = _variable(spec['start']), _variable(spec['end'])
+            years = spec.get('years')
+            if years:
+                exponent = 1.0 / float(years)
+                return key, lambda columns: (np.power(end(columns) / start(columns), exponent) - 1) * 100
+            return key, lambda columns: (end(columns) / start(columns) - 1) * 100
+        if kind == 'index':
+            name = spec['variable']
+            value = _variable(name)
+            return key, lambda columns: value(columns) / columns.baseline(name) * 100
+        if kind == 'share_of_total':
+            value = _variable(spec['variable'])
+            return key, lambda columns: value(columns) / np.nansum(value(columns)) * 100
+        if kind == 'expression':
+            return key, compile_expression(spec['expression'])
+    except FormulaError:
+        raise
+    except KeyError as e:
+        raise FormulaError(f"Formula '{key}' is missing {e.args[0]}")
+    except (TypeError, ValueError) as e:
+        raise FormulaError(f"Formula '{key}': {e}")
+    raise FormulaError(f"Formula '{key}' has unknown type '{kind}'; expected one of {', '.join(FORMULA_TYPES)}")
+
+
+class CompiledFormulas:
+    def __init__(self, specs):
+        self.formulas = [compile_formula(spec) for spec in specs or []]
+        keys = [key for key, _ in self.formulas]
+        if len(set(keys)) != len(keys):
+            raise FormulaError('Formula keys must be unique')
+        self.keys = keys
+
+    def evaluate(self, variables, matrix, geography='USA'):
+        """(areas x formulas) array of derived values, NaN where undefined."""
+        columns = Columns(variables, matrix, geography)
+        result = np.empty((columns.matrix.shape[0], len(self.formulas)))
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            for i, (_, function) in enumerate(self.formulas):
+                result[:, i] = function(columns)
+        result[~np.isfinite(result)] = np.nan
+        return result
+
+
+_compiled = LRUCache(256)
+
+
+def get_compiled_formulas(preset):
+    """Formulas of a VariablePreset, compiled once per saved version of the preset."""
+    key = (preset.pk, preset.last_modified)
+    compiled = _compiled.get(key)
+    if compiled is None:
+        compiled = CompiledFormulas(preset.formulas)
+        _compiled.set(key, compiled)
+    return compiled
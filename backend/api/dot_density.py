@@ -0,0 +1,280 @@
+"""
+Dot-density point generation.
+
+Each feature gets round(value / dotValue) points per attribute field, drawn
+uniformly over its area. Sampling happens in the Lambert cylindrical
+equal-area projection so dot density is uniform on the ground. Compact
+shapes use vectorized rejection sampling inside the bounding box; thin or
+sparse shapes, where most draws would be wasted, are ear-clipped into
+triangles and sampled by triangle area instead.
+
+Every (feature, field) pair draws from its own random stream derived from
+the seed, so the output is deterministic and independent of feature order.
+Results are cached per layer configuration and data vintage.
+"""
+import hashlib
+import json
+import math
+import zlib
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .geometry import (
+    EARTH_RADIUS, equal_area_rings, orient_rings, points_in_edges, ring_depths, ring_edges,
+    ring_signed_area, rings_as_lonlat, rings_bbox,
+)
+
+
+DEFAULT_SETTINGS = {
+    'MAX_DOTS': 2_000_000,
+    'MIN_ACCEPTANCE': 0.2,  # Below this polygon/bbox area ratio, sample triangles instead
+    'CACHE_TIMEOUT': 60 * 60 * 24 * 7,
+}
+COORDINATE_DECIMALS = 6
+MAX_REJECTION_ROUNDS = 8
+
+
+def get_dot_density_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'DOT_DENSITY', {})}
+
+
+def dot_fields(config):
+    """Attribute definitions of a dot-density layer config, as built by DotDensityEditor."""
+    attributes = config.get('attributes') or []
+    if not isinstance(attributes, list) or not all(isinstance(attr, dict) for attr in attributes):
+        raise ValueError('attributes must be a list of objects')
+    attributes = [attr for attr in attributes if attr.get('field')]
+    if not attributes and config.get('field'):
+        attributes = [{'field': config['field']}]
+    return attributes
+
+
+def dot_value(config):
+    value = config.get('dotValue')
+    attributes = config.get('attributes')
+    if value is None and isinstance(attributes, list) and attributes and isinstance(attributes[0], dict):
+        value = attributes[0].get('value')
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError('dotValue must be a number')
+    if value <= 0:
+        raise ValueError('dotValue must be positive')
+    return value
+
+
+def dot_count(value, per_dot):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 0
+    if not math.isfinite(value) or value <= 0:
+        return 0
+    return int(round(value / per_dot))
+
+
+def triangulate_ring(ring):
+    """
+    Ear-clip a simple counter-clockwise ring into an (n, 3, 2) array of
+    triangles. Each ear test checks all remaining vertices at once.
+    """
+    points = ring[:-1] if len(ring) > 1 and np.array_equal(ring[0], ring[-1]) else ring
+    remaining = list(range(len(points)))
+    triangles = []
+    i = 0
+    misses = 0
+    while len(remaining) > 3:
+        count = len(remaining)
+        a, b, c = remaining[(i - 1) % count], remaining[i % count], remaining[(i + 1) % count]
+        pa, pb, pc = points[a], points[b], points[c]
+        cross = (pb[0] - pa[0]) * (pc[1] - pa[1]) - (pb[1] - pa[1]) * (pc[0] - pa[0])
+        is_ear = cross > 0
+        if is_ear:
+            others = points[[index for index in remaining if index not in (a, b, c)]]
+            d1 = (pb[0] - pa[0]) * (others[:, 1] - pa[1]) - (pb[1] - pa[1]) * (others[:, 0] - pa[0])
+            d2 = (pc[0] - pb[0]) * (others[:, 1] - pb[1]) - (pc[1] - pb[1]) * (others[:, 0] - pb[0])
+            d3 = (pa[0] - pc[0]) * (others[:, 1] - pc[1]) - (pa[1] - pc[1]) * (others[:, 0] - pc[0])
+            is_ear = not np.any((d1 >= 0) & (d2 >= 0) & (d3 >= 0))
+        if is_ear:
+            triangles.append((pa, pb, pc))
+            remaining.pop(i % count)
+            misses = 0
+        else:
+            i += 1
+            misses += 1
+            if misses > count:
+                # Self-intersecting or degenerate ring: drop a vertex and carry on
+                remaining.pop(i % count)
+                misses = 0
+    if len(remaining) == 3:
+        triangles.append(tuple(points[remaining]))
+    return np.asarray(triangles, dtype=float).reshape(-1, 3, 2)
+
+
+class DotSampler:
+    """Samples uniform points over one feature's area, in equal-area coordinates."""
+
+    def __init__(self, geometry, min_acceptance):
+        rings = [ring for ring in rings_as_lonlat(geometry) if len(ring) >= 4]
+        self.rings = equal_area_rings(orient_rings(rings)) if rings else []
+        self.edges = ring_edges(self.rings) if self.rings else None
+        self.bbox = rings_bbox(self.rings) if self.rings else None
+        self.min_acceptance = min_acceptance
+        self.acceptance = 0.0
+        if self.rings:
+            xmin, ymin, xmax, ymax = self.bbox
+            box_area = (xmax - xmin) * (ymax - ymin)
+            area = sum(ring_signed_area(ring) for ring in self.rings)
+            self.acceptance = area / box_area if box_area > 0 else 0.0
+        self._triangles = None
+
+    @property
+    def triangles(self):
+        if self._triangles is None:
+            depths = ring_depths(self.rings) if len(self.rings) > 1 else [0]
+            parts = [triangulate_ring(ring) for ring, depth in zip(self.rings, depths) if depth % 2 == 0]
+            self._triangles = np.concatenate(parts) if parts else np.empty((0, 3, 2))
+        return self._triangles
+
+    def sample(self, rng, count):
+        if not self.rings or count <= 0 or self.acceptance <= 0:
+            return np.empty((0, 2))
+        if self.acceptance >= self.min_acceptance:
+            points = self._sample_box(rng, count)
+            if len(points) == count:
+                return points
+            return np.vstack([points, self._sample_triangles(rng, count - len(points))])
+        return self._sample_triangles(rng, count)
+
+    def _sample_box(self, rng, count):
+        xmin, ymin, xmax, ymax = self.bbox
+        chunks, found = [], 0
+        for _ in range(MAX_REJECTION_ROUNDS):
+            need = count - found
+            draws = int(need / self.acceptance * 1.1) + 16
+            xs = rng.uniform(xmin, xmax, draws)
+            ys = rng.uniform(ymin, ymax, draws)
+            inside = points_in_edges(xs, ys, self.edges)
+            chunk = np.column_stack([xs[inside], ys[inside]])[:need]
+            chunks.append(chunk)
+            found += len(chunk)
+            if found >= count:
+                break
+        return np.vstack(chunks)
+
+    def _sample_triangles(self, rng, count):
+        triangles = self.triangles
+        if not len(triangles):
+            return np.empty((0, 2))
+        a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+        areas = np.abs((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0]))
+        if areas.sum() <= 0:
+            return np.empty((0, 2))
+        probabilities = areas / areas.sum()
+
+        chunks, found = [], 0
+        for _ in range(MAX_REJECTION_ROUNDS):
+            need = count - found
+            draws = int(need * 1.1) + 16
+            chosen = rng.choice(len(triangles), size=draws, p=probabilities)
+            r1, r2 = rng.random(draws), rng.random(draws)
+            flip = r1 + r2 > 1
+            r1[flip], r2[flip] = 1 - r1[flip], 1 - r2[flip]
+            points = (a[chosen] + r1[:, None] * (b[chosen] - a[chosen]) +
+                      r2[:, None] * (c[chosen] - a[chosen]))
+            # Triangles cover exteriors only; this drops points that land in holes
+            inside = points_in_edges(points[:, 0], points[:, 1], self.edges)
+            chunk = points[inside][:need]
+            chunks.append(chunk)
+            found += len(chunk)
+            if found >= count:
+                break
+        return np.vstack(chunks)
+
+
+def _to_lonlat(points):
+    lon = np.degrees(points[:, 0] / EARTH_RADIUS)
+    lat = np.degrees(np.arcsin(np.clip(points[:, 1] / EARTH_RADIUS, -1, 1)))
+    return lon, lat
+
+
+def feature_rng(seed, feature_id, field_index):
+    return np.random.default_rng([int(seed) & 0xFFFFFFFF, zlib.crc32(str(feature_id).encode()), field_index])
+
+
+def generate_dots(features, config, seed=0):
+    """
+    Random dots for a dot-density layer.
+
+    `features` are dicts with 'id', 'geometry' and 'attributes' (field ->
+    value). Returns one entry per configured attribute with its dots as a
+    flat [lon, lat, lon, lat, ...] list in WGS84.
+    """
+    options = get_dot_density_settings()
+    per_dot = dot_value(config)
+    fields = dot_fields(config)
+    if not fields:
+        raise ValueError('Dot density config has no attribute fields')
+
+    counts = [
+        [dot_count((feature.get('attributes') or {}).get(attr['field']), per_dot) for attr in fields]
+        for feature in features
+    ]
+    total = sum(sum(row) for row in counts)
+    if total > options['MAX_DOTS']:
+        raise ValueError(f"Layer would produce {total} dots; the limit is {options['MAX_DOTS']}")
+
+    collected = [[] for _ in fields]
+    for feature, row in zip(features, counts):
+        if not any(row):
+            continue
+        sampler = DotSampler(feature.get('geometry') or {}, options['MIN_ACCEPTANCE'])
+        for field_index, count in enumerate(row):
+            if count:
+                rng = feature_rng(seed, feature.get('id'), field_index)
+                collected[field_index].append(sampler.sample(rng, count))
+
+    layers = []
+    for attr, chunks in zip(fields, collected):
+        points = np.vstack(chunks) if chunks else np.empty((0, 2))
+        lon, lat = _to_lonlat(points)
+        coordinates = np.round(np.column_stack([lon, lat]), COORDINATE_DECIMALS).ravel()
+        layers.append({
+            'field': attr['field'],
+            'color': attr.get('color'),
+            'label': attr.get('label'),
+            'count': len(points),
+            'coordinates': coordinates.tolist(),
+        })
+
+    return {'dot_value': per_dot, 'seed': seed, 'total': sum(layer['count'] for layer in layers), 'layers': layers}
+
+
+def dot_density_cache_key(features, config, seed, vintage):
+    # Everything generate_dots reads from the config: the resolved fields with
+    # their colours and labels, and the effective dot value
+    layer_fields = dot_fields(config)
+    fields = [attr['field'] for attr in layer_fields]
+    digest = hashlib.md5()
+    for feature in features:
+        attributes = feature.get('attributes') or {}
+        digest.update(json.dumps(
+            [feature.get('id'), feature.get('geometry'), [attributes.get(field) for field in fields]],
+            sort_keys=True, default=str,
+        ).encode())
+    layer = json.dumps(
+        {'dotValue': dot_value(config), 'fields': layer_fields, 'seed': seed}, sort_keys=True, default=str,
+    )
+    return 'dot_density:' + hashlib.md5(f'{layer}:{vintage}:{digest.hexdigest()}'.encode()).hexdigest()
+
+
+def get_dot_density(features, config, seed=0, vintage=None):
+    """generate_dots with results cached per (layer config, data vintage)."""
+    key = dot_density_cache_key(features, config, seed, vintage)
+    result = cache.get(key)
+    if result is None:
+        result = generate_dots(features, config, seed)
+        cache.set(key, result, get_dot_density_settings()['CACHE_TIMEOUT'])
+    return result
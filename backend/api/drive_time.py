@@ -0,0 +1,371 @@
+"""
+Drive time polygon service.
+
+Service area polygons are requested from a routing provider (Esri's
+ServiceArea_World by default) and stored keyed by rounded coordinates,
+travel minutes and travel mode. Lookups go through a bounded in-process LRU
+first, then the DriveTimePolygon table, and only fall through to the
+provider for polygons that have never been solved before.
+
+aget_polygons() is the same lookup for async views: the table is read and
+written through the async ORM, and Esri is called with httpx's AsyncClient
+when httpx is installed, so a batch waits on all its requests concurrently
+without holding a thread per request.
+"""
+import asyncio
+import json
+import math
+import threading
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+try:
+    import httpx
+except ImportError:  # optional; async solves fall back to a thread per request
+    httpx = None
+
+from .models import DriveTimePolygon
+from .utils import LRUCache
+
+
+DEFAULT_SETTINGS = {
+    'PROVIDER': 'api.drive_time.EsriServiceAreaProvider',
+    'API_KEY': '',
+    'SERVICE_URL': (
+        'https://route-api.arcgis.com/arcgis/rest/services/World/'
+        'ServiceAreas/NAServer/ServiceArea_World/solveServiceArea'
+    ),
+    'COORDINATE_PRECISION': 4,
+    'MEMORY_CACHE_SIZE': 512,
+    'MAX_CONCURRENCY': 4,
+    'TIMEOUT': 30,
+    # Request limits: points per batch and travel minutes per point
+    'MAX_BATCH_SIZE': 100,
+    'MAX_MINUTES': 300,
+}
+
+# Same travel mode the frontend sends in calculateDriveTimePolygon
+TRAVEL_MODES = {
+    'driving': {
+        'attributeParameterValues': [],
+        'description': 'Driving time for cars',
+        'impedanceAttributeName': 'TravelTime',
+        'simplificationToleranceUnits': 'esriMeters',
+        'type': 'AUTOMOBILE',
+        'useHierarchy': True,
+        'restrictUTurns': 'esriNFSBAtDeadEndsAndIntersections',
+        'simplificationTolerance': 2,
+        'timeAttributeName': 'TravelTime',
+        'distanceAttributeName': 'Miles',
+        'name': 'Driving Time',
+    },
+}
+
+
+class RoutingError(Exception):
+    pass
+
+
+def get_drive_time_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'DRIVE_TIME', {})}
+
+
+class RoutingProvider:
+    """Interface for anything that can solve a single service area polygon."""
+
+    def solve(self, longitude, latitude, minutes, travel_mode='driving'):
+        """Return an Esri JSON polygon (rings + spatialReference)."""
+        raise NotImplementedError
+
+    async def asolve(self, longitude, latitude, minutes, travel_mode='driving', client=None):
+        """solve() for async callers; `client` is an httpx.AsyncClient when httpx is installed."""
+        return await sync_to_async(self.solve, thread_sensitive=False)(longitude, latitude, minutes, travel_mode)
+
+
+class EsriServiceAreaProvider(RoutingProvider):
+    def __init__(self, api_key=None, service_url=None, timeout=None):
+        config = get_drive_time_settings()
+        self.api_key = api_key if api_key is not None else config['API_KEY']
+        self.service_url = service_url or config['SERVICE_URL']
+        self.timeout = timeout or config['TIMEOUT']
+
+    def build_params(self, longitude, latitude, minutes, travel_mode):
+        if travel_mode not in TRAVEL_MODES:
+            raise RoutingError(f"Unsupported travel mode '{travel_mode}'")
+
+        facilities = {
+            'features': [{
+                'geometry': {
+                    'x': longitude,
+                    'y': latitude,
+                    'spatialReference': {'wkid': 4326},
+                },
+            }],
+        }
+        return {
+            'f': 'json',
+            'token': self.api_key,
+            'facilities': json.dumps(facilities),
+            'defaultBreaks': f"{minutes:g}",
+            'travelMode': json.dumps(TRAVEL_MODES[travel_mode]),
+            'outSR': 4326,
+            'returnPolygons': 'true',
+        }
+
+    def solve(self, longitude, latitude, minutes, travel_mode='driving'):
+        if not self.api_key:
+            raise RoutingError('ArcGIS API key is not configured')
+
+        body = urllib.parse.urlencode(
+            self.build_params(longitude, latitude, minutes, travel_mode)
+        ).encode('utf-8')
+        request = urllib.request.Request(self.service_url, data=body, method='POST')
+
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                payload = json.loads(response.read())
+        except (OSError, ValueError) as e:
+            raise RoutingError(f'Service area request failed: {e}') from e
+        return self.parse_response(payload)
+
+    async def asolve(self, longitude, latitude, minutes, travel_mode='driving', client=None):
+        if client is None:
+            return await super().asolve(longitude, latitude, minutes, travel_mode)
+        if not self.api_key:
+            raise RoutingError('ArcGIS API key is not configured')
+
+        try:
+            response = await client.post(
+                self.service_url, data=self.build_params(longitude, latitude, minutes, travel_mode),
+                timeout=self.timeout,
+            )
+            payload = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            raise RoutingError(f'Service area request failed: {e}') from e
+        return self.parse_response(payload)
+
+    def parse_response(self, payload):
+        if 'error' in payload:
+            raise RoutingError(payload['error'].get('message', 'Service area request failed'))
+
+        features = payload.get('saPolygons', {}).get('features', [])
+        if not features:
+            raise RoutingError('Service area response did not contain polygon data')
+
+        geometry = features[0]['geometry']
+        geometry.setdefault('spatialReference', {'wkid': 4326})
+        return geometry
+
+
+class StubRoutingProvider(RoutingProvider):
+    """
+    Offline provider that approximates a drive time area with a circle of
+    ~800 meters per minute, the same fallback the frontend uses. Counts calls
+    so tests can assert on network usage.
+    """
+
+    def __init__(self, meters_per_minute=800, segments=32):
+        self.meters_per_minute = meters_per_minute
+        self.segments = segments
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def solve(self, longitude, latitude, minutes, travel_mode='driving'):
+        with self._lock:
+            self.calls += 1
+
+        radius = minutes * self.meters_per_minute
+        dlat = radius / 111320.0
+        dlon = dlat / max(math.cos(math.radians(latitude)), 1e-6)
+        ring = []
+        # Clockwise outer ring, as ArcGIS expects
+        for i in range(self.segments):
+            angle = -2 * math.pi * i / self.segments
+            ring.append([longitude + dlon * math.cos(angle), latitude + dlat * math.sin(angle)])
+        ring.append(ring[0])
+        return {'rings': [ring], 'spatialReference': {'wkid': 4326}}
+
+
+class DriveTimeService:
+    def __init__(self, provider=None, precision=None, memory_cache_size=None, max_concurrency=None):
+        config = get_drive_time_settings()
+        self.provider = provider or import_string(config['PROVIDER'])()
+        self.precision = config['COORDINATE_PRECISION'] if precision is None else precision
+        self.max_concurrency = max_concurrency or config['MAX_CONCURRENCY']
+        self.memory = LRUCache(memory_cache_size or config['MEMORY_CACHE_SIZE'])
+
+    def make_key(self, longitude, latitude, minutes, travel_mode='driving'):
+        return (
+            round(float(latitude), self.precision),
+            round(float(longitude), self.precision),
+            float(minutes),
+            travel_mode,
+        )
+
+    def get_polygon(self, longitude, latitude, minutes, travel_mode='driving'):
+        return self.get_polygons([(longitude, latitude, minutes, travel_mode)])[0]
+
+    def get_polygons(self, requests):
+        """
+        Resolve a batch of (longitude, latitude, minutes, travel_mode) tuples.
+
+        Returns a list of (geometry, source) pairs in request order, where
+        source is 'memory', 'database' or 'provider'. Duplicate keys within a
+        batch are solved once.
+        """
+        keys, resolved = self._from_memory(requests)
+
+        missing = {key for key in keys if key not in resolved}
+        if missing:
+            rows = self._database_rows(missing)
+            self._resolve(resolved, self._match_rows(missing, rows), 'database')
+            missing -= resolved.keys()
+
+        if missing:
+            # Polygons solved before a provider failure are kept for the retry
+            solved, error = self._solve(missing)
+            DriveTimePolygon.objects.bulk_create(self._new_rows(solved), ignore_conflicts=True)
+            self._resolve(resolved, solved, 'provider')
+            if error is not None:
+                raise error
+
+        return [resolved[key] for key in keys]
+
+    async def aget_polygons(self, requests):
+        """get_polygons() through the async ORM and, with httpx installed, an async HTTP client."""
+        keys, resolved = self._from_memory(requests)
+
+        missing = {key for key in keys if key not in resolved}
+        if missing:
+            rows = [row async for row in self._database_rows(missing)]
+            self._resolve(resolved, self._match_rows(missing, rows), 'database')
+            missing -= resolved.keys()
+
+        if missing:
+            solved, error = await self._asolve(missing)
+            await DriveTimePolygon.objects.abulk_create(self._new_rows(solved), ignore_conflicts=True)
+            self._resolve(resolved, solved, 'provider')
+            if error is not None:
+                raise error
+
+        return [resolved[key] for key in keys]
+
+    def _from_memory(self, requests):
+        keys = [self.make_key(*request) for request in requests]
+        resolved = {}
+        for key in keys:
+            if key not in resolved:
+                geometry = self.memory.get(key)
+                if geometry is not None:
+                    resolved[key] = (geometry, 'memory')
+        return keys, resolved
+
+    def _resolve(self, resolved, found, source):
+        for key, geometry in found.items():
+            self.memory.set(key, geometry)
+            resolved[key] = (geometry, source)
+
+    def _database_rows(self, keys):
+        # Filter on the coarse columns in SQL and match exact keys in Python
+        return DriveTimePolygon.objects.filter(
+            latitude__in={key[0] for key in keys},
+            longitude__in={key[1] for key in keys},
+            minutes__in={key[2] for key in keys},
+            travel_mode__in={key[3] for key in keys},
+        ).values_list('latitude', 'longitude', 'minutes', 'travel_mode', 'geometry')
+
+    def _match_rows(self, keys, rows):
+        found = {}
+        for latitude, longitude, minutes, travel_mode, geometry in rows:
+            key = (latitude, longitude, minutes, travel_mode)
+            if key in keys:
+                found[key] = geometry
+        return found
+
+    def _new_rows(self, solved):
+        return [
+            DriveTimePolygon(
+                latitude=key[0], longitude=key[1], minutes=key[2],
+                travel_mode=key[3], geometry=geometry,
+            )
+            for key, geometry in solved.items()
+        ]
+
+    def _solve(self, keys):
+        """
+        Solve keys with the provider. Returns (solved, error): the geometries
+        of the keys that succeeded and the first failure, if any.
+        """
+        keys = list(keys)
+
+        def solve_one(key):
+            latitude, longitude, minutes, travel_mode = key
+            return self.provider.solve(longitude, latitude, minutes, travel_mode)
+
+        solved = {}
+        if len(keys) == 1 or self.max_concurrency <= 1:
+            for key in keys:
+                try:
+                    solved[key] = solve_one(key)
+                except Exception as e:
+                    return solved, e
+            return solved, None
+
+        error = None
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(keys))) as executor:
+            futures = {executor.submit(solve_one, key): key for key in keys}
+            for future in as_completed(futures):
+                try:
+                    solved[futures[future]] = future.result()
+                except Exception as e:
+                    error = error or e
+        return solved, error
+
+    async def _asolve(self, keys):
+        """_solve() with concurrent async requests; returns the same (solved, error) pair."""
+        keys = list(keys)
+        # Same cap on concurrent upstream requests as the thread pool
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def solve_one(key, client):
+            latitude, longitude, minutes, travel_mode = key
+            async with semaphore:
+                return await self.provider.asolve(longitude, latitude, minutes, travel_mode, client=client)
+
+        if httpx is None:
+            results = await asyncio.gather(*(solve_one(key, None) for key in keys), return_exceptions=True)
+        else:
+            async with httpx.AsyncClient() as client:
+                results = await asyncio.gather(*(solve_one(key, client) for key in keys), return_exceptions=True)
+
+        solved, error = {}, None
+        for key, result in zip(keys, results):
+            if isinstance(result, BaseException):
+                error = error or result
+            else:
+                solved[key] = result
+        return solved, error
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_drive_time_service():
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = DriveTimeService()
+        return _service
+
+
+def reset_drive_time_service():
+    """Drop the shared service so the next call picks up current settings."""
+    global _service
+    with _service_lock:
+        _service = None
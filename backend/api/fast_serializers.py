@@ -0,0 +1,161 @@
+"""
+Read path for market area lists that skips model instances.
+
+Rows come from values_list() with the JSON columns read as text: geometry
+is passed through as is, the smaller columns are decoded with the fast
+parser's loads(). Every other value goes through the same serializer
+field's to_representation(), and the JSON is rendered and streamed in
+chunks. The decoded JSON matches MarketAreaSerializer output; the bytes
+need not, since geometry keeps the database's text form (Postgres jsonb
+has its own spacing and key order). Only model construction, attribute
+lookup and the per-row serializer machinery are skipped. The a-prefixed versions read the rows
+through the async ORM, for async views.
+"""
+import itertools
+import json
+
+from asgiref.sync import sync_to_async
+from django.db import models
+from django.db.models import TextField
+from django.db.models.functions import Cast
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework import serializers
+
+from .models import MarketArea
+from .renderers import FastJSONRenderer, RawJSON, orjson
+from .serializers import MarketAreaSerializer
+
+
+CHUNK_SIZE = 200
+loads = orjson.loads if orjson is not None else json.loads
+
+
+def _market_area_columns():
+    """(output name, values_list column or None, converter) per serializer field, in output order."""
+    columns = []
+    for name, field in MarketAreaSerializer().fields.items():
+        if field.write_only:
+            continue
+        if name == 'project_number':
+            columns.append((name, None, None))
+        elif name == 'geometry':
+            columns.append((name, 'geometry_json', RawJSON))
+        elif isinstance(MarketArea._meta.get_field(field.source), models.JSONField):
+            columns.append((name, f'{field.source}_json', loads))
+        else:
+            if isinstance(field, serializers.DateTimeField) and not hasattr(field, 'timezone'):
+                # Resolve the active timezone once per list rather than once per value
+                field.timezone = field.default_timezone()
+            columns.append((name, field.source, field.to_representation))
+    return columns
+
+
+class _ListEncoder:
+    """Turns values_list() rows into chunks of the JSON list body."""
+
+    def __init__(self, queryset, project_number, chunk_size):
+        self.columns = _market_area_columns()
+        selected = [column for _, column, _ in self.columns if column is not None]
+        self.rows = queryset.annotate(**{
+            column: Cast(column[:-len('_json')], output_field=TextField())
+            for column in selected if column.endswith('_json')
+        }).values_list(*selected)
+        self.project_number = project_number
+        self.chunk_size = chunk_size
+        self.renderer = FastJSONRenderer()
+        self.separator = b''
+        self.batch = []
+
+    def add(self, row):
+        """Add a row; returns the next chunk once a batch is full, else None."""
+        values = iter(row)
+        item = {}
+        for name, column, convert in self.columns:
+            if column is None:
+                item[name] = self.project_number
+                continue
+            value = next(values)
+            item[name] = None if value is None else convert(value)
+        self.batch.append(item)
+        if len(self.batch) >= self.chunk_size:
+            return self.flush()
+        return None
+
+    def flush(self):
+        if not self.batch:
+            return None
+        # Rendered as a list, then unwrapped, so the joined chunks equal one render of the whole list
+        chunk = self.separator + self.renderer.render(self.batch)[1:-1]
+        self.separator = b','
+        self.batch = []
+        return chunk
+
+
+def iter_market_area_json(queryset, project_number, chunk_size=CHUNK_SIZE):
+    """
+    Yield the JSON list of the (ordered) market area queryset in chunks.
+    `project_number` is the same for every row of a project-scoped list, so
+    it is looked up once instead of joined per row.
+    """
+    encoder = _ListEncoder(queryset, project_number, chunk_size)
+    yield b'['
+    for row in encoder.rows.iterator(chunk_size=chunk_size):
+        chunk = encoder.add(row)
+        if chunk is not None:
+            yield chunk
+    chunk = encoder.flush()
+    if chunk is not None:
+        yield chunk
+    yield b']'
+
+
+async def aiter_market_area_json(queryset, project_number, chunk_size=CHUNK_SIZE):
+    """iter_market_area_json() reading the rows through the async ORM."""
+    encoder = _ListEncoder(queryset, project_number, chunk_size)
+    # Not values_list().aiterator(): it starts the query in the event loop
+    # (SynchronousOnlyOperation), so slices of the lazy iterator are read in a thread instead
+    rows = encoder.rows.iterator(chunk_size=chunk_size)
+    next_slice = sync_to_async(lambda: list(itertools.islice(rows, chunk_size)))
+    yield b'['
+    while True:
+        batch = await next_slice()
+        for row in batch:
+            chunk = encoder.add(row)
+            if chunk is not None:
+                yield chunk
+        if len(batch) < chunk_size:
+            break
+    chunk = encoder.flush()
+    if chunk is not None:
+        yield chunk
+    yield b']'
+
+
+def market_area_list_response(queryset, project_number, content_type='application/json'):
+    """
+    Lists that fit in one chunk are sent as a plain response; longer ones
+    are streamed chunk by chunk.
+    """
+    chunks = iter_market_area_json(queryset, project_number)
+    head = list(itertools.islice(chunks, 3))
+    if head[-1] == b']':
+        return HttpResponse(b''.join(head), content_type=content_type)
+    return StreamingHttpResponse(itertools.chain(head, chunks), content_type=content_type)
+
+
+async def amarket_area_list_response(queryset, project_number, content_type='application/json'):
+    chunks = aiter_market_area_json(queryset, project_number)
+    head = []
+    async for chunk in chunks:
+        head.append(chunk)
+        if len(head) == 3:
+            break
+    if head[-1] == b']':
+        return HttpResponse(b''.join(head), content_type=content_type)
+
+    async def stream():
+        for chunk in head:
+            yield chunk
+        async for chunk in chunks:
+            yield chunk
+    return StreamingHttpResponse(stream(), content_type=content_type)
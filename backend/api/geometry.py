@@ -0,0 +1,350 @@
+"""
+Geometry helpers for stored MarketArea geometries.
+
+Geometries arrive from the ArcGIS JS client as Esri JSON polygons
+({"rings": [...], "spatialReference": {"wkid": ...}}) in either WGS84 or
+Web Mercator; GeoJSON Polygon/MultiPolygon is accepted as well. Everything
+here works on rings as (n, 2) NumPy arrays so callers can vectorize.
+"""
+import math
+
+import numpy as np
+
+
+WGS84_WKIDS = {4326}
+WEB_MERCATOR_WKIDS = {102100, 102113, 900913, 3857}
+EARTH_RADIUS = 6378137.0
+
+
+def get_wkid(geometry):
+    if not isinstance(geometry, dict):
+        return 4326
+    spatial_reference = geometry.get('spatialReference') or {}
+    return spatial_reference.get('latestWkid') or spatial_reference.get('wkid') or 4326
+
+
+def get_rings(geometry):
+    """Return every ring of a polygon geometry as a list of coordinate lists."""
+    if not isinstance(geometry, dict):
+        return []
+
+    if geometry.get('type') == 'Feature':
+        return get_rings(geometry.get('geometry'))
+
+    if 'rings' in geometry:
+        return [ring for ring in geometry['rings'] if ring]
+
+    if geometry.get('type') == 'Polygon':
+        return [ring for ring in geometry.get('coordinates', []) if ring]
+
+    if geometry.get('type') == 'MultiPolygon':
+        return [ring for polygon in geometry.get('coordinates', []) for ring in polygon if ring]
+
+    return []
+
+
+def mercator_to_lonlat(x, y):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    lon = np.degrees(x / EARTH_RADIUS)
+    lat = np.degrees(2 * np.arctan(np.exp(y / EARTH_RADIUS)) - math.pi / 2)
+    return lon, lat
+
+
+def lonlat_to_mercator(lon, lat):
+    lon = np.asarray(lon, dtype=float)
+    lat = np.clip(np.asarray(lat, dtype=float), -85.05112878, 85.05112878)
+    x = EARTH_RADIUS * np.radians(lon)
+    y = EARTH_RADIUS * np.log(np.tan(math.pi / 4 + np.radians(lat) / 2))
+    return x, y
+
+
+def rings_as_lonlat(geometry):
+    """Rings of a geometry as (n, 2) float arrays in WGS84 longitude/latitude."""
+    rings = []
+    mercator = get_wkid(geometry) in WEB_MERCATOR_WKIDS
+    for ring in get_rings(geometry):
+        coords = np.asarray([point[:2] for point in ring], dtype=float)
+        if mercator:
+            coords = np.column_stack(mercator_to_lonlat(coords[:, 0], coords[:, 1]))
+        rings.append(coords)
+    return rings
+
+
+def rings_bbox(rings):
+    """(xmin, ymin, xmax, ymax) over a list of ring arrays, or None if empty."""
+    if not rings:
+        return None
+    stacked = np.concatenate(rings)
+    xmin, ymin = stacked.min(axis=0)
+    xmax, ymax = stacked.max(axis=0)
+    return float(xmin), float(ymin), float(xmax), float(ymax)
+
+
+def ring_edges(rings):
+    """Stack the edges of every ring into (m, 4) rows of x1, y1, x2, y2."""
+    edges = []
+    for ring in rings:
+        if len(ring) < 2:
+            continue
+        start = ring
+        end = np.roll(ring, -1, axis=0)
+        edges.append(np.column_stack([start, end]))
+    if not edges:
+        return np.empty((0, 4))
+    edges = np.concatenate(edges)
+    # Drop zero-length edges, including the closing edge of an explicitly closed ring
+    keep = (edges[:, 0] != edges[:, 2]) | (edges[:, 1] != edges[:, 3])
+    return edges[keep]
+
+
+# Above this many points, sorting once beats testing every point against every edge
+SWEEP_MIN_POINTS = 512
+
+
+def points_in_edges(xs, ys, edges, max_cells=2_000_000):
+    """
+    Vectorized crossing-number test of points against a set of polygon edges.
+
+    Uses the even-odd rule over all edges together, so holes and multi-part
+    polygons are handled without knowing which ring is which. Points are
+    processed in chunks so the (points x edges) matrices stay under max_cells.
+    Large point sets go through the y-sorted sweep instead.
+    """
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    inside = np.zeros(xs.shape[0], dtype=bool)
+    if xs.size == 0 or edges.size == 0:
+        return inside
+    if xs.size >= SWEEP_MIN_POINTS:
+        return _points_in_edges_sorted(xs, ys, edges)
+
+    x1, y1, x2, y2 = edges[:, 0], edges[:, 1], edges[:, 2], edges[:, 3]
+    rows = max(1, max_cells // len(edges))
+    for start in range(0, xs.shape[0], rows):
+        px = xs[start:start + rows, None]
+        py = ys[start:start + rows, None]
+        straddles = (y1 > py) != (y2 > py)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+        crossings = np.count_nonzero(straddles & (px < x_cross), axis=1)
+        inside[start:start + rows] = (crossings % 2) == 1
+    return inside
+
+
+def _points_in_edges_sorted(xs, ys, edges):
+    """
+    Same test as points_in_edges, but with points sorted by y so each edge
+    only touches the contiguous run of points whose y it straddles. Work is
+    proportional to points x edges crossing a horizontal line, not all edges.
+    """
+    order = np.argsort(ys, kind='stable')
+    sorted_x, sorted_y = xs[order], ys[order]
+    x1, y1, x2, y2 = edges[:, 0], edges[:, 1], edges[:, 2], edges[:, 3]
+    # (y1 > py) != (y2 > py) is exactly low <= py < high
+    starts = np.searchsorted(sorted_y, np.minimum(y1, y2), side='left')
+    ends = np.searchsorted(sorted_y, np.maximum(y1, y2), side='left')
+
+    crossings = np.zeros(xs.shape[0], dtype=np.int64)
+    for i in np.flatnonzero(ends > starts):
+        start, end = starts[i], ends[i]
+        py = sorted_y[start:end]
+        x_cross = x1[i] + (py - y1[i]) * (x2[i] - x1[i]) / (y2[i] - y1[i])
+        crossings[start:end] += sorted_x[start:end] < x_cross
+
+    inside = np.empty(xs.shape[0], dtype=bool)
+    inside[order] = (crossings % 2) == 1
+    return inside
+
+
+def points_in_rings(xs, ys, rings):
+    return points_in_edges(xs, ys, ring_edges(rings))
+
+
+def ring_signed_area(ring):
+    """Shoelace area; positive for counter-clockwise rings in x-right/y-up axes."""
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+
+def ring_depths(rings):
+    """How many other rings contain each ring; odd depth means the ring is a hole."""
+    bboxes = [rings_bbox([ring]) for ring in rings]
+    depths = []
+    for i, ring in enumerate(rings):
+        x, y = ring[0]
+        depth = 0
+        for j, other in enumerate(rings):
+            if i == j:
+                continue
+            xmin, ymin, xmax, ymax = bboxes[j]
+            if xmin <= x <= xmax and ymin <= y <= ymax and points_in_rings([x], [y], [other])[0]:
+                depth += 1
+        depths.append(depth)
+    return depths
+
+
+def orient_rings(rings, outer_clockwise=False):
+    """
+    Orient outer rings one way and holes the other, deciding which is which
+    by nesting rather than trusting the incoming winding. The default is the
+    GeoJSON/mathematical convention (outer rings counter-clockwise); Esri
+    JSON wants outer_clockwise=True.
+    """
+    oriented = []
+    depths = ring_depths(rings) if len(rings) > 1 else [0] * len(rings)
+    for ring, depth in zip(rings, depths):
+        counter_clockwise = ring_signed_area(ring) > 0
+        want_counter_clockwise = (depth % 2 == 0) != outer_clockwise
+        oriented.append(ring if counter_clockwise == want_counter_clockwise else ring[::-1])
+    return oriented
+
+
+def equal_area_rings(rings):
+    """
+    Project lon/lat rings with the Lambert cylindrical equal-area projection
+    so planar areas come out in square meters on the sphere.
+    """
+    projected = []
+    for ring in rings:
+        x = EARTH_RADIUS * np.radians(ring[:, 0])
+        y = EARTH_RADIUS * np.sin(np.radians(ring[:, 1]))
+        projected.append(np.column_stack([x, y]))
+    return projected
+
+
+def polygon_area(rings):
+    """Area of oriented rings (holes negative), in the units of the coordinates."""
+    return abs(sum(ring_signed_area(ring) for ring in rings))
+
+
+# Decimal places kept on write: ~0.1 m for degrees, 1 cm for meters
+GEOGRAPHIC_DECIMALS = 6
+PROJECTED_DECIMALS = 2
+
+
+def coordinate_decimals(wkid):
+    return GEOGRAPHIC_DECIMALS if wkid in WGS84_WKIDS else PROJECTED_DECIMALS
+
+
+def clean_ring(ring, decimals):
+    """
+    Quantize a ring, drop consecutive duplicate vertices and close it.
+    Returns None if fewer than three distinct vertices survive.
+    """
+    if isinstance(ring, np.ndarray) and ring.ndim == 2:
+        coords = np.round(ring[:, :2].astype(float), decimals)
+    else:
+        coords = np.round(np.asarray([point[:2] for point in ring], dtype=float), decimals)
+    if coords.ndim != 2 or not np.isfinite(coords).all():
+        raise ValueError('Ring coordinates must be finite [x, y] pairs')
+
+    keep = np.ones(len(coords), dtype=bool)
+    keep[1:] = np.any(coords[1:] != coords[:-1], axis=1)
+    coords = coords[keep]
+    if len(coords) > 1 and np.array_equal(coords[0], coords[-1]):
+        coords = coords[:-1]
+    if len(coords) < 3:
+        return None
+    return np.vstack([coords, coords[:1]])
+
+
+def _has_vertices(ring):
+    # Rings may arrive as arrays from the upload parser, which have no truth value
+    return ring is not None and len(ring) > 0
+
+
+def _rings_to_lists(rings):
+    return [ring.tolist() for ring in rings]
+
+
+def normalize_geometry(geometry):
+    """
+    Write-time cleanup of a polygon geometry: quantize coordinates, drop
+    duplicate consecutive vertices, close rings, discard degenerate rings and
+    fix winding (Esri JSON: outer rings clockwise; GeoJSON: counter-clockwise).
+    Non-polygon geometries are returned unchanged.
+    """
+    if not isinstance(geometry, dict):
+        return geometry
+
+    decimals = coordinate_decimals(get_wkid(geometry))
+
+    if 'rings' in geometry:
+        rings = [clean_ring(ring, decimals) for ring in geometry['rings'] if _has_vertices(ring)]
+        rings = [ring for ring in rings if ring is not None]
+        return {**geometry, 'rings': _rings_to_lists(orient_rings(rings, outer_clockwise=True))}
+
+    def clean_polygon(polygon):
+        # GeoJSON says which ring is the shell, so winding follows position
+        rings = [clean_ring(ring, decimals) for ring in polygon if _has_vertices(ring)]
+        if not rings or rings[0] is None:
+            return None
+        rings = [ring for ring in rings if ring is not None]
+        oriented = [
+            ring if (ring_signed_area(ring) > 0) == (i == 0) else ring[::-1]
+            for i, ring in enumerate(rings)
+        ]
+        return _rings_to_lists(oriented)
+
+    if geometry.get('type') == 'Polygon':
+        return {**geometry, 'coordinates': clean_polygon(geometry.get('coordinates', [])) or []}
+
+    if geometry.get('type') == 'MultiPolygon':
+        polygons = [clean_polygon(polygon) for polygon in geometry.get('coordinates', [])]
+        return {**geometry, 'coordinates': [polygon for polygon in polygons if polygon]}
+
+    return geometry
+
+
+def geometry_metrics(geometry):
+    """
+    Derived columns stored alongside MarketArea.geometry: WGS84 bounding box
+    and centroid, geodesic area in square meters and vertex count.
+    """
+    metrics = {
+        'bbox_xmin': None, 'bbox_ymin': None, 'bbox_xmax': None, 'bbox_ymax': None,
+        'area': None, 'centroid_x': None, 'centroid_y': None, 'vertex_count': 0,
+    }
+    if not isinstance(geometry, dict):
+        return metrics
+
+    if 'x' in geometry and 'y' in geometry:
+        x, y = float(geometry['x']), float(geometry['y'])
+        if get_wkid(geometry) in WEB_MERCATOR_WKIDS:
+            x, y = (float(value) for value in mercator_to_lonlat(x, y))
+        metrics.update(
+            bbox_xmin=x, bbox_ymin=y, bbox_xmax=x, bbox_ymax=y,
+            area=0.0, centroid_x=x, centroid_y=y, vertex_count=1,
+        )
+        return metrics
+
+    rings = [ring for ring in rings_as_lonlat(geometry) if len(ring) >= 3]
+    if not rings:
+        return metrics
+
+    xmin, ymin, xmax, ymax = rings_bbox(rings)
+    projected = orient_rings(equal_area_rings(rings))
+
+    signed_area = 0.0
+    moment_x = moment_y = 0.0
+    for ring in projected:
+        x, y = ring[:, 0], ring[:, 1]
+        x_next, y_next = np.roll(x, -1), np.roll(y, -1)
+        cross = x * y_next - x_next * y
+        signed_area += cross.sum() / 2
+        moment_x += ((x + x_next) * cross).sum() / 6
+        moment_y += ((y + y_next) * cross).sum() / 6
+
+    if signed_area:
+        centroid_x = math.degrees(moment_x / signed_area / EARTH_RADIUS)
+        centroid_y = math.degrees(math.asin(max(-1.0, min(1.0, moment_y / signed_area / EARTH_RADIUS))))
+    else:
+        centroid_x, centroid_y = (xmin + xmax) / 2, (ymin + ymax) / 2
+
+    metrics.update(
+        bbox_xmin=xmin, bbox_ymin=ymin, bbox_xmax=xmax, bbox_ymax=ymax,
+        area=abs(signed_area), centroid_x=centroid_x, centroid_y=centroid_y,
+        vertex_count=sum(len(ring) for ring in get_rings(geometry)),
+    )
+    return metrics
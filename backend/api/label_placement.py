@@ -0,0 +1,274 @@
+"""
+Initial label placement for market area maps.
+
+Each polygon's label anchor is its pole of inaccessibility (polylabel: the
+interior point farthest from the outline, found by quadtree search with a
+distance upper bound), which stays inside concave and ring-shaped areas
+where a centroid would not. Labels are then placed in priority order at the
+anchor or the first free candidate offset around it, with collisions checked
+against a spatial hash grid of the estimated label boxes, so each test only
+looks at nearby labels.
+
+Everything is computed in Web Mercator at one zoom level. Offsets are screen
+pixels from the area's stored centroid (x right, y up, as TextSymbol
+xoffset/yoffset), which is where the map anchors polygon labels.
+"""
+import heapq
+import math
+
+import numpy as np
+
+from .geometry import (
+    EARTH_RADIUS, lonlat_to_mercator, mercator_to_lonlat, points_in_edges, ring_edges,
+    rings_as_lonlat, rings_bbox,
+)
+
+
+TILE_SIZE = 256
+MAX_ZOOM = 20
+CHARACTER_WIDTH = 0.6  # Average glyph advance as a fraction of font size
+LINE_HEIGHT = 1.2  # Same line height factor as the client's text measurement
+LABEL_PADDING = 2
+CANDIDATE_RINGS = 4
+DIRECTIONS = [(0, 1), (1, 0), (0, -1), (-1, 0), (1, 1), (-1, 1), (1, -1), (-1, -1)]
+
+
+def meters_per_pixel(zoom):
+    return 2 * math.pi * EARTH_RADIUS / (TILE_SIZE * 2 ** zoom)
+
+
+def fit_zoom(bbox, width, height):
+    """Largest whole zoom at which a Web Mercator bbox fits a width x height viewport."""
+    xmin, ymin, xmax, ymax = bbox
+    span = max((xmax - xmin) / width, (ymax - ymin) / height)
+    if span <= 0:
+        return MAX_ZOOM
+    zoom = math.floor(math.log2(2 * math.pi * EARTH_RADIUS / (TILE_SIZE * span)))
+    return max(0, min(MAX_ZOOM, zoom))
+
+
+def mercator_rings(geometry):
+    rings = []
+    for ring in rings_as_lonlat(geometry):
+        if len(ring) >= 4:
+            x, y = lonlat_to_mercator(ring[:, 0], np.clip(ring[:, 1], -85.05, 85.05))
+            rings.append(np.column_stack([x, y]))
+    return rings
+
+
+def _edge_distances(xs, ys, edges):
+    """Distance from each point to the nearest edge, as a (points,) array."""
+    x1, y1, x2, y2 = (edges[:, i] for i in range(4))
+    dx, dy = x2 - x1, y2 - y1
+    length = dx * dx + dy * dy
+    px, py = xs[:, None], ys[:, None]
+    t = np.clip(((px - x1) * dx + (py - y1) * dy) / length, 0, 1)
+    return np.sqrt(((x1 + t * dx - px) ** 2 + (y1 + t * dy - py) ** 2).min(axis=1))
+
+
+def _signed_distances(xs, ys, edges):
+    """Distance to the outline, positive inside the polygon and negative outside."""
+    xs, ys = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+    distances = _edge_distances(xs, ys, edges)
+    return np.where(points_in_edges(xs, ys, edges), distances, -distances)
+
+
+def polylabel(rings, precision):
+    """
+    Pole of inaccessibility of polygon rings (holes and multiple parts by
+    even-odd nesting). Returns (x, y, distance to the outline).
+    """
+    edges = ring_edges(rings)
+    xmin, ymin, xmax, ymax = rings_bbox(rings)
+    size = min(xmax - xmin, ymax - ymin)
+    if size <= 0 or not len(edges):
+        return (xmin + xmax) / 2, (ymin + ymax) / 2, 0.0
+
+    def cells(centers_x, centers_y, half):
+        distances = _signed_distances(centers_x, centers_y, edges)
+        # A cell can hold no point farther from the outline than its center plus its half-diagonal
+        return [
+            (-(d + half * math.sqrt(2)), float(x), float(y), half, float(d))
+            for x, y, d in zip(centers_x, centers_y, distances)
+        ]
+
+    half = size / 2
+    xs = np.arange(xmin, xmax, size) + half
+    ys = np.arange(ymin, ymax, size) + half
+    grid_x, grid_y = np.meshgrid(xs, ys)
+    queue = cells(grid_x.ravel(), grid_y.ravel(), half)
+    heapq.heapify(queue)
+
+    # Start from the area centroid, then the bbox center, whichever is deeper
+    area_x = area_y = area = 0.0
+    for ring in rings:
+        x, y = ring[:, 0], ring[:, 1]
+        x_next, y_next = np.roll(x, -1), np.roll(y, -1)
+        cross = x * y_next - x_next * y
+        area += cross.sum() / 2
+        area_x += ((x + x_next) * cross).sum() / 6
+        area_y += ((y + y_next) * cross).sum() / 6
+    starts = [((xmin + xmax) / 2, (ymin + ymax) / 2)]
+    if area:
+        starts.insert(0, (area_x / area, area_y / area))
+    start_distances = _signed_distances([x for x, _ in starts], [y for _, y in starts], edges)
+    best_index = int(np.argmax(start_distances))
+    best = (starts[best_index][0], starts[best_index][1], float(start_distances[best_index]))
+
+    while queue:
+        bound, x, y, half, distance = heapq.heappop(queue)
+        if distance > best[2]:
+            best = (x, y, distance)
+        if -bound - best[2] <= precision:
+            continue
+        half /= 2
+        queue_x = np.array([x - half, x + half, x - half, x + half])
+        queue_y = np.array([y - half, y - half, y + half, y + half])
+        for cell in cells(queue_x, queue_y, half):
+            heapq.heappush(queue, cell)
+    return best
+
+
+def label_size(text, font_size, font_weight='normal'):
+    """Estimated (width, height) in pixels of a label box, padding included."""
+    lines = (text or '').split('\n') or ['']
+    advance = CHARACTER_WIDTH * (1.08 if font_weight == 'bold' else 1.0)
+    width = max(len(line) for line in lines) * font_size * advance
+    height = len(lines) * font_size * LINE_HEIGHT
+    return width + 2 * LABEL_PADDING, height + 2 * LABEL_PADDING
+
+
+class SpatialHash:
+    """Uniform grid over boxes (xmin, ymin, xmax, ymax) for overlap queries."""
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.boxes = []
+
+    def _keys(self, box):
+        size = self.cell_size
+        for i in range(math.floor(box[0] / size), math.floor(box[2] / size) + 1):
+            for j in range(math.floor(box[1] / size), math.floor(box[3] / size) + 1):
+                yield i, j
+
+    def insert(self, box):
+        index = len(self.boxes)
+        self.boxes.append(box)
+        for key in self._keys(box):
+            self.cells.setdefault(key, []).append(index)
+
+    def overlap(self, box):
+        """Total area of stored boxes overlapping `box`."""
+        seen = set()
+        total = 0.0
+        for key in self._keys(box):
+            for index in self.cells.get(key, ()):
+                if index in seen:
+                    continue
+                seen.add(index)
+                other = self.boxes[index]
+                width = min(box[2], other[2]) - max(box[0], other[0])
+                height = min(box[3], other[3]) - max(box[1], other[1])
+                if width > 0 and height > 0:
+                    total += width * height
+        return total
+
+
+def candidate_offsets(width, height):
+    """Label center offsets to try, nearest first: the anchor, then rings around it."""
+    offsets = [(0.0, 0.0)]
+    for ring in range(1, CANDIDATE_RINGS + 1):
+        for dx, dy in DIRECTIONS:
+            offsets.append((dx * (width / 2 + LABEL_PADDING) * ring, dy * (height + LABEL_PADDING) * ring))
+    return offsets
+
+
+def _box(x, y, width, height):
+    return (x - width / 2, y - height / 2, x + width / 2, y + height / 2)
+
+
+def place_labels(labels, zoom=None, viewport=(1280, 800)):
+    """
+    Place labels without overlaps where possible.
+
+    `labels` are dicts with 'label_id', 'geometry', 'centroid' (lon, lat),
+    'text', 'font_size' and optionally 'priority' (higher is placed first)
+    and 'fixed_offset' (x, y) for labels users already positioned, which
+    are kept and treated as obstacles. Returns (zoom, placements) with one
+    {'label_id', 'x_offset', 'y_offset', 'anchor', 'collides'} per label.
+    """
+    prepared = []
+    for label in labels:
+        rings = mercator_rings(label.get('geometry') or {})
+        lon, lat = label['centroid']
+        cx, cy = lonlat_to_mercator(lon, min(max(lat, -85.05), 85.05))
+        prepared.append({**label, 'rings': rings, 'center': (float(cx), float(cy))})
+
+    if not prepared:
+        return zoom or 0, []
+    if zoom is None:
+        bboxes = [rings_bbox(label['rings']) for label in prepared if label['rings']]
+        bboxes += [(x, y, x, y) for x, y in (label['center'] for label in prepared)]
+        bboxes = np.array(bboxes)
+        zoom = fit_zoom((bboxes[:, 0].min(), bboxes[:, 1].min(), bboxes[:, 2].max(), bboxes[:, 3].max()), *viewport)
+    scale = meters_per_pixel(zoom)
+
+    sizes = [label_size(label.get('text'), label.get('font_size') or 10, label.get('font_weight')) for label in prepared]
+    grid = SpatialHash(max(32.0, float(np.median([height for _, height in sizes])) * 4))
+
+    placements = {}
+    order = sorted(
+        range(len(prepared)),
+        key=lambda i: (prepared[i].get('fixed_offset') is None, -(prepared[i].get('priority') or 0)),
+    )
+    for i in order:
+        label = prepared[i]
+        width, height = sizes[i]
+        cx, cy = label['center']
+        center = (cx / scale, cy / scale)
+
+        if label.get('fixed_offset') is not None:
+            x_offset, y_offset = label['fixed_offset']
+            box = _box(center[0] + x_offset, center[1] + y_offset, width, height)
+            placements[i] = {'x_offset': x_offset, 'y_offset': y_offset, 'anchor': None,
+                             'collides': grid.overlap(box) > 0}
+            grid.insert(box)
+            continue
+
+        if label['rings']:
+            x, y, _ = polylabel(label['rings'], precision=scale)
+            edges = ring_edges(label['rings'])
+        else:
+            x, y, edges = cx, cy, None
+        anchor = (x / scale, y / scale)
+
+        offsets = candidate_offsets(width, height)
+        positions = np.array([(anchor[0] + dx, anchor[1] + dy) for dx, dy in offsets])
+        if edges is not None and len(edges):
+            inside = points_in_edges(positions[:, 0] * scale, positions[:, 1] * scale, edges)
+        else:
+            inside = np.ones(len(positions), dtype=bool)
+
+        # First free spot inside the area, else first free spot, else least overlap
+        best = None
+        for index in np.concatenate([np.flatnonzero(inside), np.flatnonzero(~inside)]):
+            box = _box(positions[index][0], positions[index][1], width, height)
+            overlap = grid.overlap(box)
+            if best is None or overlap < best[0]:
+                best = (overlap, index, box)
+            if overlap == 0:
+                break
+
+        overlap, index, box = best
+        grid.insert(box)
+        lon, lat = (float(value) for value in mercator_to_lonlat(x, y))
+        placements[i] = {
+            'x_offset': round(float(positions[index][0] - center[0]), 1),
+            'y_offset': round(float(positions[index][1] - center[1]), 1),
+            'anchor': [round(lon, 6), round(lat, 6)],
+            'collides': overlap > 0,
+        }
+
+    return zoom, [{'label_id': prepared[i]['label_id'], **placements[i]} for i in range(len(prepared))]
+
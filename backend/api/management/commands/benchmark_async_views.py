@@ -0,0 +1,92 @@
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import User
+from django.core.management.base import CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.models import MapConfiguration, Project
+
+from .load_test import Command as LoadTestCommand
+
+
+class Command(LoadTestCommand):
+    help = (
+        'Compare concurrent-request throughput of the sync endpoints and their async '
+        'versions under /api/async/ for one project. Starts gunicorn once per --interface '
+        'and drives each endpoint with --concurrency keep-alive clients. The drive time '
+        'proxy is left out, as it would call Esri.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', help='Project id (default: the most recently modified)')
+        parser.add_argument('--user', help='Username to issue the access token for (default: first active superuser)')
+        parser.add_argument('--interface', default='wsgi,asgi', help='Comma-separated server interfaces to compare')
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--threads', type=int, default=4, help='Threads per gunicorn worker (WSGI)')
+        parser.add_argument('--url', help='Benchmark this running server instead of starting gunicorn')
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per endpoint')
+        parser.add_argument('--cached', action='store_true',
+                            help='Let the per-project response cache answer repeated requests')
+
+    def handle(self, *args, **options):
+        project = self.get_project(options['project'])
+        headers = {
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip',
+            'Authorization': f'Bearer {AccessToken.for_user(self.get_user(options["user"]))}',
+        }
+        paths = self.endpoint_paths(project)
+        if not options['cached']:
+            # A distinct query string per request misses the response cache, so every request reads the database
+            paths = [(name, path + ('&' if '?' in path else '?') + 'n={n}') for name, path in paths]
+
+        if options['url']:
+            url = urlsplit(options['url'])
+            self.compare('running server', url.hostname, url.port or 80, paths, options, headers)
+            return
+
+        for interface in options['interface'].split(','):
+            port = self.free_port()
+            server = self.start_gunicorn(port, options['workers'], options['threads'], interface)
+            try:
+                self.wait_until_listening(port, server)
+                self.compare(interface.upper(), '127.0.0.1', port, paths, options, headers)
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+
+    def get_project(self, project_id):
+        queryset = Project.objects.all()
+        project = queryset.filter(id=project_id).first() if project_id else queryset.order_by('-last_modified').first()
+        if project is None:
+            raise CommandError('No project to benchmark')
+        return project
+
+    def get_user(self, username):
+        users = User.objects.filter(is_active=True)
+        user = users.filter(username=username).first() if username else (
+            users.filter(is_superuser=True).first() or users.first()
+        )
+        if user is None:
+            raise CommandError('No active user to issue a token for')
+        return user
+
+    def endpoint_paths(self, project):
+        configuration = MapConfiguration.objects.filter(project=project).order_by('order').first()
+        labels = f'?project={project.id}'
+        if configuration is not None:
+            labels += f'&map_configuration={configuration.id}'
+        return [
+            ('project bundle', f'projects/{project.id}/'),
+            ('market areas', f'projects/{project.id}/market-areas/'),
+            ('map configurations', f'map-configurations/?project={project.id}'),
+            ('label positions', f'label-positions/{labels}'),
+        ]
+
+    def compare(self, label, host, port, paths, options, headers):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{label}, {options['workers']} worker(s), "
+                                                     f"{options['concurrency']} clients"))
+        for name, path in paths:
+            for kind, prefix in (('sync', '/api/'), ('async', '/api/async/')):
+                self.report(f'{name} ({kind})', self.run(host, port, options, headers, prefix + path))
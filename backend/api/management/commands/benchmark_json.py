@@ -0,0 +1,86 @@
+import io
+import json
+import math
+import random
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from api.parsers import FastJSONParser, orjson
+from api.renderers import FastJSONRenderer, RawJSON
+
+
+def synthetic_market_areas(areas, vertices, seed=0):
+    """Market area list payloads shaped like MarketAreaSerializer output, with one ring each."""
+    rng = random.Random(seed)
+    payload = []
+    for index in range(areas):
+        lon, lat = rng.uniform(-120, -75), rng.uniform(28, 47)
+        ring = [
+            [round(lon + 0.2 * math.cos(2 * math.pi * step / vertices) * rng.uniform(0.8, 1.2), 6),
+             round(lat + 0.2 * math.sin(2 * math.pi * step / vertices) * rng.uniform(0.8, 1.2), 6)]
+            for step in range(vertices)
+        ]
+        ring.append(ring[0])
+        payload.append({
+            'id': str(uuid.UUID(int=rng.getrandbits(128))),
+            'name': f'Market area {index}',
+            'short_name': f'MA {index}',
+            'ma_type': 'custom',
+            'geometry': {'rings': [ring], 'spatialReference': {'wkid': 4326}},
+            'style_settings': {'fillColor': '#0078D4', 'fillOpacity': 0.35, 'borderColor': '#0078D4'},
+            'locations': [],
+            'radius_points': [],
+            'drive_time_points': [],
+            'site_location_data': None,
+            'created_at': '2025-01-01T00:00:00Z',
+            'last_modified': '2025-01-01T00:00:00Z',
+            'project_number': 'BENCH',
+            'order': index,
+            'area': 1234.5,
+            'vertex_count': vertices + 1,
+        })
+    return payload
+
+
+class Command(BaseCommand):
+    help = 'Time JSON rendering and parsing of synthetic geometry-heavy market area payloads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--areas', type=int, default=100)
+        parser.add_argument('--vertices', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def best_of(self, repeat, func):
+        best = math.inf
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - started)
+        return best
+
+    def handle(self, *args, **options):
+        payload = synthetic_market_areas(options['areas'], options['vertices'])
+        # Geometry as it would be read from the database as text
+        raw_payload = [{**item, 'geometry': RawJSON(json.dumps(item['geometry']))} for item in payload]
+        body = JSONRenderer().render(payload)
+        repeat = options['repeat']
+
+        self.stdout.write(
+            f"{options['areas']} areas x {options['vertices']} vertices, {len(body) / 1e6:.1f} MB, "
+            f"orjson {'installed' if orjson is not None else 'not installed'}"
+        )
+        timings = [
+            ('render  JSONRenderer', self.best_of(repeat, lambda: JSONRenderer().render(payload))),
+            ('render  FastJSONRenderer', self.best_of(repeat, lambda: FastJSONRenderer().render(payload))),
+            ('render  FastJSONRenderer, raw geometry', self.best_of(
+                repeat, lambda: FastJSONRenderer().render(raw_payload))),
+            ('parse   JSONParser', self.best_of(repeat, lambda: JSONParser().parse(io.BytesIO(body)))),
+            ('parse   FastJSONParser', self.best_of(repeat, lambda: FastJSONParser().parse(io.BytesIO(body)))),
+        ]
+        baseline = {'render': timings[0][1], 'parse': timings[3][1]}
+        for label, seconds in timings:
+            speedup = baseline[label.split()[0]] / seconds
+            self.stdout.write(f'{label:<42} {seconds * 1000:9.1f} ms  {speedup:5.1f}x')
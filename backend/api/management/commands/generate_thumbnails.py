@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from api.models import Project
+from api.thumbnails import regenerate_thumbnail
+
+
+class Command(BaseCommand):
+    help = 'Draw project list thumbnails for all projects (or one) that have market areas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', help='Only redraw the thumbnail of this project ID')
+
+    def handle(self, *args, **options):
+        queryset = Project.objects.values_list('id', flat=True)
+        if options['project']:
+            queryset = queryset.filter(id=options['project'])
+
+        drawn = empty = 0
+        for project_id in queryset.iterator():
+            if regenerate_thumbnail(project_id) is None:
+                empty += 1
+            else:
+                drawn += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Drew {drawn} thumbnails ({empty} projects without market areas)'))
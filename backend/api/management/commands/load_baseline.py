@@ -0,0 +1,53 @@
+import os
+import shutil
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.baseline import BaselineLayoutError, get_baseline_dir, read_baseline_csv, write_baseline
+
+
+DEFAULT_SOURCE = os.path.join(settings.BASE_DIR.parent, 'market-area-tool', 'src', 'assets', 'USA Data.csv')
+
+
+class Command(BaseCommand):
+    help = 'Load a national baseline CSV into a new memory-mapped vintage and make it current'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_SOURCE,
+                            help='Baseline CSV (legacy USA Data.csv layout or one row per geography)')
+        parser.add_argument('--vintage', help='Vintage name, e.g. 2024; defaults to a timestamp')
+        parser.add_argument('--keep', type=int, default=3, help='Number of vintages to keep on disk')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'Baseline file not found: {path}')
+
+        vintage = options['vintage'] or datetime.now().strftime('%Y%m%d%H%M%S')
+        try:
+            geographies, variables, rows = read_baseline_csv(path)
+        except BaselineLayoutError as e:
+            raise CommandError(str(e))
+        if not variables:
+            raise CommandError(f'No baseline variables found in {path}')
+
+        try:
+            index = write_baseline(geographies, variables, rows, vintage)
+        except FileExistsError:
+            raise CommandError(f'Baseline vintage {vintage} already exists; choose another --vintage')
+        self._prune(vintage, options['keep'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded baseline vintage {vintage}: {index['variable_count']} variables "
+            f"for {', '.join(geographies)}"
+        ))
+
+    def _prune(self, current, keep):
+        directory = get_baseline_dir()
+        vintages = sorted(
+            (entry for entry in os.scandir(directory) if entry.is_dir() and entry.name != current),
+            key=lambda entry: entry.stat().st_mtime, reverse=True,
+        )
+        # Workers may still have an older vintage mapped; unlinking is safe on POSIX
+        for entry in vintages[max(keep - 1, 0):]:
+            shutil.rmtree(entry.path, ignore_errors=True)
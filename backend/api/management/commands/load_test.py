@@ -0,0 +1,148 @@
+import http.client
+import itertools
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure request throughput against the production server. Starts gunicorn '
+        '(gunicorn.conf.py, WSGI or ASGI) once per --workers value and drives it with concurrent '
+        'keep-alive clients, or load-tests an already running server with --url.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', default='1,2,4', help='Comma-separated worker counts to compare')
+        parser.add_argument('--threads', type=int, default=4, help='Threads per gunicorn worker')
+        parser.add_argument('--interface', choices=['wsgi', 'asgi'], default='wsgi',
+                            help='Serve backend/wsgi.py with gthread or backend/asgi.py with uvicorn workers')
+        parser.add_argument('--url', help='Test this running server instead of starting gunicorn')
+        parser.add_argument('--path', default='/api/color-keys/')
+        parser.add_argument('--token', required=True,
+                            help='JWT access token sent as a Bearer header; without one every request is a 401')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per run')
+
+    def handle(self, *args, **options):
+        headers = {
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip',
+            'Authorization': f"Bearer {options['token']}",
+        }
+
+        if options['url']:
+            url = urlsplit(options['url'])
+            self.report('running server', self.run(url.hostname, url.port or 80, options, headers))
+            return
+
+        worker_counts = [int(value) for value in options['workers'].split(',')]
+        if max(worker_counts) > 1 and not os.getenv('REDIS_URL'):
+            raise CommandError('Set REDIS_URL to run more than one worker (see gunicorn.conf.py)')
+        for workers in worker_counts:
+            port = self.free_port()
+            server = self.start_gunicorn(port, workers, options['threads'], options['interface'])
+            try:
+                self.wait_until_listening(port, server)
+                self.report(f"{workers} worker(s) x {options['threads']} threads",
+                            self.run('127.0.0.1', port, options, headers))
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+
+    def start_gunicorn(self, port, workers, threads, interface='wsgi'):
+        env = {
+            **os.environ,
+            'SERVER_INTERFACE': interface,
+            'PORT': str(port),
+            'WEB_CONCURRENCY': str(workers),
+            'GUNICORN_THREADS': str(threads),
+            'GUNICORN_LOG_LEVEL': 'warning',
+            # A worker recycled mid-run would drop every client's connection at once
+            'GUNICORN_MAX_REQUESTS': '0',
+        }
+        command = [
+            sys.executable, '-m', 'gunicorn',
+            '--config', os.path.join(settings.BASE_DIR, 'gunicorn.conf.py'), '--access-logfile', '/dev/null',
+        ]
+        try:
+            return subprocess.Popen(command, cwd=settings.BASE_DIR, env=env)
+        except FileNotFoundError as e:
+            raise CommandError(f'Could not start gunicorn: {e}')
+
+    def free_port(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    def wait_until_listening(self, port, server, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError('gunicorn exited during startup (is it installed?)')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f'gunicorn did not start listening on port {port}')
+
+    def run(self, host, port, options, headers, path=None):
+        """
+        Each client thread reuses one keep-alive connection until the deadline.
+        '{n}' in the path is replaced by a request counter. Any status outside
+        2xx/3xx counts as an error, not as a measured request.
+        """
+        path = path or options['path']
+        counter = itertools.count()
+        deadline = time.monotonic() + options['duration']
+        latencies, errors, lock = [], [0], threading.Lock()
+
+        def client():
+            connection = http.client.HTTPConnection(host, port, timeout=60)
+            own_latencies, own_errors = [], 0
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    connection.request('GET', path.replace('{n}', str(next(counter))), headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                    if not 200 <= response.status < 400:
+                        own_errors += 1
+                    else:
+                        own_latencies.append(time.perf_counter() - started)
+                except (OSError, http.client.HTTPException):
+                    own_errors += 1
+                    connection.close()
+                    connection = http.client.HTTPConnection(host, port, timeout=60)
+            connection.close()
+            with lock:
+                latencies.extend(own_latencies)
+                errors[0] += own_errors
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            for _ in range(options['concurrency']):
+                pool.submit(client)
+        return latencies, errors[0], time.monotonic() - started
+
+    def report(self, label, result):
+        latencies, errors, elapsed = result
+        if not latencies:
+            self.stdout.write(self.style.ERROR(f'{label}: no successful requests ({errors} errors)'))
+            return
+        latencies.sort()
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        self.stdout.write(
+            f'{label:<28} {len(latencies) / elapsed:8.1f} req/s   '
+            f'p50 {statistics.median(latencies) * 1000:7.1f} ms   p95 {p95 * 1000:7.1f} ms   {errors} errors'
+        )
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from api.geometry import normalize_geometry, geometry_metrics
+from api.models import MarketArea
+from api.response_cache import bump_project
+
+
+class Command(BaseCommand):
+    help = 'Normalize stored MarketArea geometries and recompute bbox, area, centroid and vertex count'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', help='Only refresh market areas of this project ID')
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        queryset = MarketArea.objects.filter(geometry__isnull=False).only('id', 'project_id', 'geometry')
+        if options['project']:
+            queryset = queryset.filter(project_id=options['project'])
+
+        # bulk_update skips auto_now; last_modified is set here so tile and
+        # overlap versions, which derive from it, change with the geometry
+        fields = ['geometry', 'last_modified'] + list(geometry_metrics(None).keys())
+        now = timezone.now()
+        batch, updated, failed = [], 0, 0
+
+        for market_area in queryset.iterator(chunk_size=options['batch_size']):
+            try:
+                market_area.geometry = normalize_geometry(market_area.geometry)
+                market_area.last_modified = now
+                for field, value in geometry_metrics(market_area.geometry).items():
+                    setattr(market_area, field, value)
+            except (ValueError, TypeError, IndexError) as e:
+                failed += 1
+                self.stdout.write(self.style.WARNING(f'Skipping market area {market_area.id}: {e}'))
+                continue
+
+            batch.append(market_area)
+            if len(batch) >= options['batch_size']:
+                updated += self._save(batch, fields)
+                batch = []
+
+        if batch:
+            updated += self._save(batch, fields)
+
+        self.stdout.write(self.style.SUCCESS(f'Refreshed {updated} market areas ({failed} skipped)'))
+
+    def _save(self, batch, fields):
+        with transaction.atomic():
+            MarketArea.objects.bulk_update(batch, fields)
+            for project_id in {market_area.project_id for market_area in batch}:
+                bump_project(project_id)
+        return len(batch)
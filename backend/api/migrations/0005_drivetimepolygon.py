@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:29
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_alter_labelposition_unique_together_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriveTimePolygon',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('minutes', models.FloatField()),
+                ('travel_mode', models.CharField(default='driving', max_length=50)),
+                ('geometry', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'unique_together': {('latitude', 'longitude', 'minutes', 'travel_mode')},
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_drivetimepolygon'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marketarea',
+            name='area',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='marketarea',
+            name='bbox_xmax',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='marketarea',
+            name='bbox_xmin',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='marketarea',
+            name='bbox_ymax',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='marketarea',
+            name='bbox_ymin',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='marketarea',
+            name='centroid_x',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='marketarea',
+            name='centroid_y',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='marketarea',
+            name='vertex_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='marketarea',
+            index=models.Index(fields=['project', 'bbox_xmin', 'bbox_ymin', 'bbox_xmax', 'bbox_ymax'], name='marketarea_project_bbox_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:41
+
+from django.db import migrations
+
+
+GIST_INDEX_SQL = (
+    'CREATE INDEX IF NOT EXISTS marketarea_bbox_gist ON api_marketarea '
+    'USING gist (box(point(bbox_xmin, bbox_ymin), point(bbox_xmax, bbox_ymax)))'
+)
+
+
+def create_gist_index(apps, schema_editor):
+    # Other backends rely on the b-tree marketarea_project_bbox_idx
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(GIST_INDEX_SQL)
+
+
+def drop_gist_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS marketarea_bbox_gist')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_marketarea_geometry_metrics'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_gist_index, drop_gist_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_marketarea_bbox_gist_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='variablepreset',
+            name='formulas',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations
+from django.utils import timezone
+
+from api.geometry import geometry_metrics
+
+
+BATCH_SIZE = 200
+
+
+def backfill_geometry_metrics(apps, schema_editor):
+    """
+    Fill the columns added in 0006 for market areas saved before it. Their
+    last_modified moves too, so tiles and overlaps cached while the columns
+    were empty are rebuilt.
+    """
+    MarketArea = apps.get_model('api', 'MarketArea')
+    fields = list(geometry_metrics(None)) + ['last_modified']
+    now = timezone.now()
+    queryset = MarketArea.objects.filter(geometry__isnull=False, vertex_count=0).only('id', 'geometry')
+
+    batch = []
+    for market_area in queryset.iterator(chunk_size=BATCH_SIZE):
+        try:
+            metrics = geometry_metrics(market_area.geometry)
+        except (ValueError, TypeError, IndexError):
+            # Left for refresh_geometry_metrics, which reports what it skips
+            continue
+        if not metrics['vertex_count']:
+            continue
+        for field, value in metrics.items():
+            setattr(market_area, field, value)
+        market_area.last_modified = now
+        batch.append(market_area)
+        if len(batch) >= BATCH_SIZE:
+            MarketArea.objects.bulk_update(batch, fields)
+            batch = []
+    if batch:
+        MarketArea.objects.bulk_update(batch, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_create_cache_table'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_geometry_metrics, migrations.RunPython.noop),
+    ]
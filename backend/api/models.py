@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, connection
+from django.db.models import Min, Max
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 import uuid
@@ -66,6 +67,29 @@ class TcgTheme(models.Model):
     def __str__(self):
         return f"{self.theme_key} - {self.theme_name}"
 
+class MarketAreaQuerySet(models.QuerySet):
+    def intersecting(self, xmin, ymin, xmax, ymax):
+        """Market areas whose stored WGS84 bounding box intersects the given one."""
+        if connection.vendor == 'postgresql':
+            # Matches the expression of the GiST index added in 0007
+            return self.extra(
+                where=['box(point(bbox_xmin, bbox_ymin), point(bbox_xmax, bbox_ymax)) && '
+                       'box(point(%s, %s), point(%s, %s))'],
+                params=[xmin, ymin, xmax, ymax],
+            )
+        return self.filter(
+            bbox_xmin__lte=xmax, bbox_xmax__gte=xmin,
+            bbox_ymin__lte=ymax, bbox_ymax__gte=ymin,
+        )
+
+    def extent(self):
+        """Combined WGS84 extent of the stored bounding boxes, in one query."""
+        return self.aggregate(
+            xmin=Min('bbox_xmin'), ymin=Min('bbox_ymin'),
+            xmax=Max('bbox_xmax'), ymax=Max('bbox_ymax'),
+        )
+
+
 class MarketArea(models.Model):
     MARKET_AREA_TYPES = [
         ('radius', 'Radius'),
@@ -95,12 +119,29 @@ class MarketArea(models.Model):
     drive_time_points = models.JSONField(null=True, blank=True)  # Added explicit field for drive time points
     site_location_data = models.JSONField(null=True, blank=True)  # Store site location specific data
     order = models.IntegerField(default=0)  # New field for ordering
+    # Derived from geometry on write (see geometry.geometry_metrics), all WGS84
+    bbox_xmin = models.FloatField(null=True, blank=True)
+    bbox_ymin = models.FloatField(null=True, blank=True)
+    bbox_xmax = models.FloatField(null=True, blank=True)
+    bbox_ymax = models.FloatField(null=True, blank=True)
+    area = models.FloatField(null=True, blank=True, db_index=True)  # Geodesic area in square meters
+    centroid_x = models.FloatField(null=True, blank=True)
+    centroid_y = models.FloatField(null=True, blank=True)
+    vertex_count = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     last_modified = models.DateTimeField(auto_now=True)
 
+    objects = MarketAreaQuerySet.as_manager()
+
     class Meta:
         ordering = ['order', '-last_modified']
         unique_together = ['project', 'name']
+        indexes = [
+            models.Index(
+                fields=['project', 'bbox_xmin', 'bbox_ymin', 'bbox_xmax', 'bbox_ymax'],
+                name='marketarea_project_bbox_idx',
+            ),
+        ]
 
 class StylePreset(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -127,6 +168,8 @@ class VariablePreset(models.Model):
     project = models.ForeignKey(Project, on_delete=models.CASCADE, 
                               related_name="variable_presets", null=True, blank=True)
     variables = models.JSONField(default=list)
+    # Derived metric declarations, see derived_metrics.compile_formula
+    formulas = models.JSONField(default=list, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     last_modified = models.DateTimeField(auto_now=True)
     is_global = models.BooleanField(default=False)
@@ -186,4 +229,31 @@ class LabelPosition(models.Model):
 
     def __str__(self):
         config_name = self.map_configuration.tab_name if self.map_configuration else "No Config"
-        return f"Label {self.label_id} - {config_name} - {self.project.project_number}"
\ No newline at end of file
+        return f"Label {self.label_id} - {config_name} - {self.project.project_number}"
+
+class DriveTimePolygon(models.Model):
+    """Durable cache of service area polygons returned by the routing provider."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    latitude = models.FloatField()  # Rounded to DRIVE_TIME['COORDINATE_PRECISION']
+    longitude = models.FloatField()
+    minutes = models.FloatField()
+    travel_mode = models.CharField(max_length=50, default='driving')
+    geometry = models.JSONField()  # Esri JSON polygon as returned by the provider
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        unique_together = ['latitude', 'longitude', 'minutes', 'travel_mode']
+
+    def __str__(self):
+        return f"{self.minutes:g} min {self.travel_mode} @ {self.latitude}, {self.longitude}"
+
+class CacheVersion(models.Model):
+    """Version counter of a cached catalog, bumped by signals whenever its rows change."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=100, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    last_modified = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
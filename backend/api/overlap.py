@@ -0,0 +1,320 @@
+"""
+Pairwise overlap between the market areas of a project.
+
+Intersection areas are computed by integrating the shoelace formula over the
+boundary of A ∩ B, which is the part of A's boundary inside B plus the part
+of B's boundary inside A. That needs edge splitting and point-in-polygon
+tests but no polygon reconstruction, so it handles holes, multi-part areas
+and shared tract borders with plain NumPy.
+
+Only pairs whose bounding boxes overlap (found with a sweep line) are
+clipped; with enough of them the clipping runs in a small process pool,
+in chunks that each carry the rings of their areas once. Every web worker
+process has its own pool, so a host runs up to workers x MAX_WORKERS
+clipping processes. Results are cached until any area in the project is
+modified.
+"""
+import hashlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .geometry import (
+    equal_area_rings, orient_rings, polygon_area, points_in_edges, ring_edges,
+    rings_as_lonlat, rings_bbox,
+)
+
+
+SQUARE_METERS_PER_SQUARE_MILE = 2589988.110336
+DEFAULT_SETTINGS = {
+    # Per web worker process; keep workers x MAX_WORKERS near the core count
+    'MAX_WORKERS': min(2, os.cpu_count() or 1),
+    'PARALLEL_THRESHOLD': 16,  # Candidate pairs below this are clipped in-process
+    'CACHE_TIMEOUT': 60 * 60 * 24,
+    # Never 'fork': the pool is started from threaded web workers, and a forked
+    # child inherits locks held by other threads. None picks forkserver where
+    # available, else spawn.
+    'START_METHOD': None,
+}
+
+
+def get_overlap_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'MARKET_AREA_OVERLAP', {})}
+
+
+def bbox_overlap_pairs(bboxes):
+    """
+    Sweep line over x: yields (i, j) for every pair of overlapping boxes.
+    Boxes that are None are skipped.
+    """
+    events = sorted((box[0], i) for i, box in enumerate(bboxes) if box is not None)
+    active = []
+    for xmin, i in events:
+        box = bboxes[i]
+        active = [j for j in active if bboxes[j][2] >= xmin]
+        for j in active:
+            other = bboxes[j]
+            if other[1] <= box[3] and box[1] <= other[3]:
+                yield (j, i) if j < i else (i, j)
+        active.append(i)
+
+
+def _segment_parameters(edges, other, tolerance, eps=1e-12):
+    """
+    For each edge, the parameters t in (0, 1) where it meets any edge of
+    `other`. Returns an (m, 3k) array with NaN where there is no crossing,
+    and a per-edge flag for edges that run along some edge of `other`.
+    """
+    px, py = edges[:, 0:1], edges[:, 1:2]
+    rx, ry = edges[:, 2:3] - px, edges[:, 3:4] - py
+    qx, qy = other[:, 0], other[:, 1]
+    sx, sy = other[:, 2] - qx, other[:, 3] - qy
+    r_length = np.hypot(rx, ry)
+
+    denominator = rx * sy - ry * sx
+    parallel = np.abs(denominator) <= 1e-10 * r_length * np.hypot(sx, sy)
+    dx, dy = qx - px, qy - py
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (dx * sy - dy * sx) / denominator
+        u = (dx * ry - dy * rx) / denominator
+    hit = ~parallel & (t > eps) & (t < 1 - eps) & (u >= -eps) & (u <= 1 + eps)
+
+    # Collinear overlaps: split at the other edge's endpoints that fall on this edge
+    collinear = parallel & (np.abs(dx * ry - dy * rx) <= tolerance * r_length)
+    length_sq = r_length * r_length
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_start = (dx * rx + dy * ry) / length_sq
+        t_end = ((dx + sx) * rx + (dy + sy) * ry) / length_sq
+    t_start = np.where(collinear & (t_start > eps) & (t_start < 1 - eps), t_start, np.nan)
+    t_end = np.where(collinear & (t_end > eps) & (t_end < 1 - eps), t_end, np.nan)
+
+    return np.hstack([np.where(hit, t, np.nan), t_start, t_end]), collinear.any(axis=1)
+
+
+def _split_edges(edges, other, tolerance, chunk_size=64):
+    """
+    Split `edges` wherever they cross `other`. Returns (n, 4) pieces and a
+    flag for pieces cut from edges that run along the other boundary.
+
+    Consecutive ring edges are spatially coherent, so small chunks have
+    tight bounding boxes and only meet a handful of the other edges.
+    """
+    pieces, shared = [], []
+    other_xmin = np.minimum(other[:, 0], other[:, 2]) - tolerance
+    other_xmax = np.maximum(other[:, 0], other[:, 2]) + tolerance
+    other_ymin = np.minimum(other[:, 1], other[:, 3]) - tolerance
+    other_ymax = np.maximum(other[:, 1], other[:, 3]) + tolerance
+    for start in range(0, len(edges), chunk_size):
+        chunk = edges[start:start + chunk_size]
+        xs, ys = chunk[:, 0::2], chunk[:, 1::2]
+        near = (
+            (other_xmax >= xs.min()) & (other_xmin <= xs.max()) &
+            (other_ymax >= ys.min()) & (other_ymin <= ys.max())
+        )
+        t, collinear = _segment_parameters(chunk, other[near], tolerance)
+        hit_row, hit_column = np.nonzero(~np.isnan(t))
+
+        # Every edge is cut at 0, 1 and its crossings; sort cuts per edge
+        count = len(chunk)
+        row = np.concatenate([hit_row, np.arange(count), np.arange(count)])
+        cut = np.concatenate([t[hit_row, hit_column], np.zeros(count), np.ones(count)])
+        order = np.lexsort((cut, row))
+        row, cut = row[order], cut[order]
+        keep = (row[1:] == row[:-1]) & (cut[1:] - cut[:-1] > 1e-12)
+        row, t0, t1 = row[:-1][keep], cut[:-1][keep], cut[1:][keep]
+
+        x1, y1 = chunk[row, 0], chunk[row, 1]
+        dx, dy = chunk[row, 2] - x1, chunk[row, 3] - y1
+        pieces.append(np.column_stack([x1 + t0 * dx, y1 + t0 * dy, x1 + t1 * dx, y1 + t1 * dy]))
+        shared.append(collinear[row])
+    return np.concatenate(pieces), np.concatenate(shared)
+
+
+def _boundary_direction(pieces, other, tolerance):
+    """
+    For each piece, +1/-1 if it lies along an edge of `other` running the
+    same/opposite way, else 0.
+    """
+    direction = np.zeros(len(pieces), dtype=int)
+    if pieces.size == 0 or other.size == 0:
+        return direction
+
+    mx = (pieces[:, 0:1] + pieces[:, 2:3]) / 2
+    my = (pieces[:, 1:2] + pieces[:, 3:4]) / 2
+    qx, qy = other[:, 0], other[:, 1]
+    sx, sy = other[:, 2] - qx, other[:, 3] - qy
+    length_sq = sx * sx + sy * sy
+    u = np.clip(((mx - qx) * sx + (my - qy) * sy) / length_sq, 0, 1)
+    distance_sq = (qx + u * sx - mx) ** 2 + (qy + u * sy - my) ** 2
+    nearest = np.argmin(distance_sq, axis=1)
+    on_boundary = distance_sq[np.arange(len(pieces)), nearest] <= tolerance ** 2
+
+    dot = (pieces[:, 2] - pieces[:, 0]) * sx[nearest] + (pieces[:, 3] - pieces[:, 1]) * sy[nearest]
+    direction[on_boundary] = np.where(dot[on_boundary] > 0, 1, -1)
+    return direction
+
+
+def _boundary_inside(edges, other_edges, other_bbox, include_shared, tolerance):
+    """Shoelace contribution of the pieces of `edges` that lie inside the other polygon."""
+    xmin, ymin, xmax, ymax = other_bbox
+    near = (
+        (np.maximum(edges[:, 0], edges[:, 2]) >= xmin) & (np.minimum(edges[:, 0], edges[:, 2]) <= xmax) &
+        (np.maximum(edges[:, 1], edges[:, 3]) >= ymin) & (np.minimum(edges[:, 1], edges[:, 3]) <= ymax)
+    )
+    edges = edges[near]
+    if edges.size == 0:
+        return 0.0
+
+    pieces, maybe_shared = _split_edges(edges, other_edges, tolerance)
+    direction = np.zeros(len(pieces), dtype=int)
+    candidates = np.flatnonzero(maybe_shared)
+    # Chunked to bound the (pieces x edges) distance matrix
+    for start in range(0, len(candidates), 2048):
+        chunk = candidates[start:start + 2048]
+        direction[chunk] = _boundary_direction(pieces[chunk], other_edges, tolerance)
+
+    mx = (pieces[:, 0] + pieces[:, 2]) / 2
+    my = (pieces[:, 1] + pieces[:, 3]) / 2
+    inside = points_in_edges(mx, my, other_edges) & (direction == 0)
+    if include_shared:
+        # Boundary shared in the same direction belongs to A ∩ B; count it once
+        inside |= direction == 1
+
+    chosen = pieces[inside]
+    return 0.5 * float(np.sum(chosen[:, 0] * chosen[:, 3] - chosen[:, 2] * chosen[:, 1]))
+
+
+def intersection_area(rings_a, rings_b):
+    """Area of A ∩ B for two sets of consistently oriented (outer CCW) rings."""
+    edges_a, edges_b = ring_edges(rings_a), ring_edges(rings_b)
+    bbox_a, bbox_b = rings_bbox(rings_a), rings_bbox(rings_b)
+    extent = max(bbox_a[2] - bbox_a[0], bbox_a[3] - bbox_a[1], bbox_b[2] - bbox_b[0], bbox_b[3] - bbox_b[1])
+    tolerance = max(extent, 1.0) * 1e-9
+
+    area = _boundary_inside(edges_a, edges_b, bbox_b, True, tolerance)
+    area += _boundary_inside(edges_b, edges_a, bbox_a, False, tolerance)
+    return max(area, 0.0)
+
+
+def _intersection_chunk(args):
+    pairs, rings = args
+    return [(i, j, intersection_area(rings[i], rings[j])) for i, j in pairs]
+
+
+def _chunks(pairs, prepared, count):
+    """Split pairs into `count` chunks, each with the rings of just the areas it needs."""
+    size = -(-len(pairs) // count)
+    for start in range(0, len(pairs), size):
+        chunk = pairs[start:start + size]
+        needed = {index for pair in chunk for index in pair}
+        yield chunk, {index: prepared[index] for index in needed}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    """The clipping pool, started on first use with a fork-free start method."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            config = get_overlap_settings()
+            method = config['START_METHOD'] or (
+                'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            )
+            _pool = ProcessPoolExecutor(
+                max_workers=config['MAX_WORKERS'], mp_context=multiprocessing.get_context(method),
+            )
+        return _pool
+
+
+def prepare_market_area(market_area):
+    """Equal-area projected, consistently oriented rings for one market area."""
+    rings = [ring for ring in rings_as_lonlat(market_area.geometry) if len(ring) >= 3]
+    if not rings:
+        return None
+    return orient_rings(equal_area_rings(rings))
+
+
+def compute_overlap_matrix(market_areas):
+    config = get_overlap_settings()
+    prepared = [prepare_market_area(market_area) for market_area in market_areas]
+    bboxes = [rings_bbox(rings) if rings else None for rings in prepared]
+    areas = [polygon_area(rings) if rings else 0.0 for rings in prepared]
+
+    pairs = list(bbox_overlap_pairs(bboxes))
+    if len(pairs) >= config['PARALLEL_THRESHOLD'] and config['MAX_WORKERS'] > 1:
+        chunks = _chunks(pairs, prepared, config['MAX_WORKERS'] * 4)
+        results = [result for chunk in get_process_pool().map(_intersection_chunk, chunks) for result in chunk]
+    else:
+        results = _intersection_chunk((pairs, prepared))
+
+    n = len(market_areas)
+    matrix = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        if areas[i] > 0:
+            matrix[i][i] = 100.0
+
+    overlaps = []
+    for i, j, shared in results:
+        # Shared borders can leave floating point dust behind
+        if shared <= 1e-9 * max(areas[i], areas[j], 1.0):
+            continue
+        percent_of_a = 100.0 * shared / areas[i] if areas[i] else 0.0
+        percent_of_b = 100.0 * shared / areas[j] if areas[j] else 0.0
+        matrix[i][j] = percent_of_a
+        matrix[j][i] = percent_of_b
+        overlaps.append({
+            'a': str(market_areas[i].id),
+            'b': str(market_areas[j].id),
+            'intersection_sq_miles': shared / SQUARE_METERS_PER_SQUARE_MILE,
+            'percent_of_a': percent_of_a,
+            'percent_of_b': percent_of_b,
+        })
+
+    return {
+        'market_areas': [
+            {
+                'id': str(market_area.id),
+                'name': market_area.name,
+                'short_name': market_area.short_name,
+                'ma_type': market_area.ma_type,
+                'area_sq_miles': area / SQUARE_METERS_PER_SQUARE_MILE,
+            }
+            for market_area, area in zip(market_areas, areas)
+        ],
+        # matrix[i][j] is the percent of area i covered by area j
+        'matrix': matrix,
+        'overlaps': overlaps,
+        'candidate_pairs': len(pairs),
+    }
+
+
+def overlap_cache_key(project_id, versions):
+    digest = hashlib.md5(
+        ''.join(f"{pk}:{modified.isoformat()};" for pk, modified in versions).encode('utf-8')
+    ).hexdigest()
+    return f"market_area_overlap:{project_id}:{digest}"
+
+
+def get_project_overlap(project_id, queryset):
+    """
+    Overlap matrix for the market areas in `queryset`, cached under a key
+    derived from every area's last_modified so any edit invalidates it.
+    """
+    versions = list(queryset.order_by('order', 'id').values_list('id', 'last_modified'))
+    key = overlap_cache_key(project_id, versions)
+    result = cache.get(key)
+    if result is None:
+        market_areas = list(queryset.order_by('order', 'id').only(
+            'id', 'name', 'short_name', 'ma_type', 'geometry'
+        ))
+        result = compute_overlap_matrix(market_areas)
+        cache.set(key, result, get_overlap_settings()['CACHE_TIMEOUT'])
+    return result
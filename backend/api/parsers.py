@@ -0,0 +1,30 @@
+import io
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib decoder is used instead
+    orjson = None
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSONParser that decodes UTF-8 bodies with orjson when it is installed.
+    Bodies orjson rejects (other encodings, NaN/Infinity constants) are
+    handed to the stdlib parser, so what is accepted does not change.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = (parser_context.get('encoding') or settings.DEFAULT_CHARSET).lower().replace('_', '-')
+        if orjson is None or encoding not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read() if stream is not None else b''
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            pass
+        return super().parse(io.BytesIO(body), media_type, parser_context)
@@ -0,0 +1,130 @@
+import json
+import re
+import uuid
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .topology import encode_topology
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is used instead
+    orjson = None
+
+
+SHORT_SEPARATORS = (',', ':')
+LONG_SEPARATORS = (', ', ': ')
+INDENT_SEPARATORS = (',', ': ')
+
+
+class RawJSON:
+    """
+    Already encoded JSON (e.g. a JSON column read as text) that
+    FastJSONRenderer writes into the output as is.
+    """
+    __slots__ = ('content',)
+
+    def __init__(self, content):
+        self.content = content.encode() if isinstance(content, str) else content
+
+    def __repr__(self):
+        return f'RawJSON({self.content[:40]!r}...)'
+
+
+def accepts_raw_json(request):
+    """True when the response will be rendered by FastJSONRenderer as plain JSON."""
+    renderer = getattr(request, 'accepted_renderer', None)
+    return isinstance(renderer, FastJSONRenderer) and renderer.format == 'json'
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed, falling back
+    to the stdlib encoder for indented output, ASCII-only or non-compact
+    settings and values orjson cannot encode (e.g. integers over 64 bits).
+    Non-native values go through DRF's encoder either way, so dates, decimals
+    and querysets render exactly as before. RawJSON values are spliced in
+    verbatim instead of being decoded and encoded again.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+        raw = []
+        marker = f'__raw_json_{uuid.uuid4().hex}_'
+        fallback = JSONEncoder().default
+
+        def default(obj):
+            if isinstance(obj, RawJSON):
+                raw.append(obj.content)
+                return f'{marker}{len(raw) - 1}'
+            return fallback(obj)
+
+        content = None
+        if orjson is not None and indent is None and self.compact and not self.ensure_ascii:
+            try:
+                content = orjson.dumps(
+                    data, default=default,
+                    option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+                )
+            except TypeError:
+                raw.clear()
+        if content is None:
+            if indent is None:
+                separators = SHORT_SEPARATORS if self.compact else LONG_SEPARATORS
+            else:
+                separators = INDENT_SEPARATORS
+            content = json.dumps(
+                data, cls=self.encoder_class, default=default,
+                indent=indent, ensure_ascii=self.ensure_ascii,
+                allow_nan=not self.strict, separators=separators
+            ).encode()
+
+        if raw:
+            pattern = re.compile(b'"' + marker.encode() + rb'(\d+)"')
+            content = pattern.sub(lambda match: raw[int(match.group(1))], content)
+        # Same strict-javascript-subset escaping as JSONRenderer
+        if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+            content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return content
+
+
+class TopoJSONRenderer(FastJSONRenderer):
+    """
+    Renders market area geometries as a quantized, delta-encoded TopoJSON
+    topology. Selected with `Accept: application/topo+json` or
+    `?format=topojson`; `?precision=<decimals>` coarsens the quantization.
+    Payloads without market areas (errors, other actions) render as JSON.
+    """
+    media_type = 'application/topo+json'
+    format = 'topojson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        renderer_context = renderer_context or {}
+        response = renderer_context.get('response')
+        if response is None or response.status_code < 400:
+            data = self.to_topology(data, self.get_precision(renderer_context))
+        return super().render(data, accepted_media_type, renderer_context)
+
+    def get_precision(self, renderer_context):
+        request = renderer_context.get('request')
+        try:
+            return int(request.query_params['precision'])
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return None
+
+    def to_topology(self, data, precision):
+        # Market area list
+        if isinstance(data, list) and all(isinstance(item, dict) and 'geometry' in item for item in data):
+            return encode_topology(data, precision)
+        # Single market area
+        if isinstance(data, dict) and 'geometry' in data and 'ma_type' in data:
+            return encode_topology([data], precision)
+        # Project detail with nested market areas
+        if isinstance(data, dict) and isinstance(data.get('market_areas'), list):
+            return {**data, 'market_areas': encode_topology(data['market_areas'], precision)}
+        return data
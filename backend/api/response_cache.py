@@ -0,0 +1,230 @@
+"""
+Per-project cache of rendered read responses.
+
+Project-scoped GET endpoints store their rendered bodies in Django's cache
+under the project's current version token, so the same unchanged data is
+serialized once rather than for every tab and user. Streamed responses are
+stored once their last chunk has been sent. Signals replace the
+token on any write to the project or its market areas, map configurations
+or labels; old entries are then simply never read again and age out.
+
+The cache is shared by all worker processes (CACHES in settings), so a
+token replaced by one worker is replaced for every worker. Tokens are
+random rather than counters, so a token lost to eviction or a cache flush
+can never bring back entries written under an older one. Only JSON
+renderings are cached; the browsable API page is per user. Hits and misses
+are counted in process and added to totals in the shared cache every
+STATS_FLUSH_EVERY events, so the numbers cover every worker without a
+cache write per request. Compressed variants of a body are cached next to it, one per
+encoding. Async views use the same entries through cached_response() and
+store_response(): entries are keyed by resource, so /api/async/<path> and
+/api/<path> share them.
+"""
+import hashlib
+import threading
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+from .compression import compress, is_compressible, mark_encoded, negotiate, worth_compressing
+
+
+DEFAULT_SETTINGS = {
+    'TIMEOUT': 60 * 60 * 24,
+    'STATS_FLUSH_EVERY': 100,
+}
+STATS_KEYS = {'hit': 'response_cache:hits', 'miss': 'response_cache:misses'}
+
+_pending_stats = {'hit': 0, 'miss': 0}
+_stats_lock = threading.Lock()
+
+
+def get_response_cache_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'PROJECT_RESPONSE_CACHE', {})}
+
+
+def _version_key(project_id):
+    return f'project_version:{project_id}'
+
+
+def project_version(project_id):
+    key = _version_key(project_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        # add() so concurrent first readers agree on one token
+        if not cache.add(key, version, None):
+            version = cache.get(key) or version
+    return version
+
+
+def bump_project(project_id):
+    """Retire every cached response of the project, now and again once the write commits."""
+    if project_id is None:
+        return
+    key = _version_key(project_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def _record(outcome):
+    with _stats_lock:
+        _pending_stats[outcome] += 1
+        if sum(_pending_stats.values()) < get_response_cache_settings()['STATS_FLUSH_EVERY']:
+            return
+        counts = dict(_pending_stats)
+        _pending_stats.update(hit=0, miss=0)
+    flush_stats(counts)
+
+
+def flush_stats(counts):
+    """Add in-process hit/miss counts to the totals in the shared cache."""
+    for outcome, count in counts.items():
+        if not count:
+            continue
+        key = STATS_KEYS[outcome]
+        if not cache.add(key, count, None):
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                cache.set(key, count, None)
+
+
+def cache_stats():
+    """Totals from the shared cache plus this process's counts not yet flushed."""
+    with _stats_lock:
+        pending = dict(_pending_stats)
+    hits = (cache.get(STATS_KEYS['hit']) or 0) + pending['hit']
+    misses = (cache.get(STATS_KEYS['miss']) or 0) + pending['miss']
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_rate': round(hits / total, 4) if total else None}
+
+
+ASYNC_PREFIX = '/api/async/'
+
+
+def resource_path(request):
+    """Path and query of the request, async endpoints named by their sync path."""
+    path = request.get_full_path()
+    if path.startswith(ASYNC_PREFIX):
+        path = '/api/' + path[len(ASYNC_PREFIX):]
+    return path
+
+
+def response_cache_key(project_id, request):
+    # Async views have no renderer negotiation and always render JSON
+    media_type = getattr(getattr(request, 'accepted_renderer', None), 'media_type', 'application/json')
+    request_id = hashlib.md5(f'{resource_path(request)}|{media_type}'.encode()).hexdigest()
+    return f'project_response:{project_id}:{project_version(project_id)}:{request_id}'
+
+
+def cache_project_response(get_project_id):
+    """
+    Decorator for GET handlers of views using ProjectResponseCacheMixin.
+    `get_project_id(view, request)` names the project the response depends
+    on; returning None skips the cache for that request.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            project_id = get_project_id(view, request)
+            if project_id is None or not isinstance(getattr(request, 'accepted_renderer', None), JSONRenderer):
+                # Only JSON bodies are shared; the browsable API page carries the user's name and CSRF token
+                return handler(view, request, *args, **kwargs)
+
+            key = response_cache_key(project_id, request)
+            response = cached_response(request, key)
+            if response is not None:
+                return response
+            view._response_cache_key = key
+            return handler(view, request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ProjectResponseCacheMixin:
+    """Stores successful responses of handlers wrapped with cache_project_response."""
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, '_response_cache_key', None)
+        if key is not None:
+            self._response_cache_key = None
+            if response.status_code == 200 and response.streaming:
+                store_when_sent(key, response)
+                response['X-Cache'] = 'MISS'
+            elif response.status_code == 200:
+                if hasattr(response, 'render'):
+                    response.render()
+                response = store_response(request, key, response)
+                response['X-Cache'] = 'MISS'
+        return response
+
+
+def cached_response(request, key):
+    """The response cached under `key`, or None; counted as a hit or a miss."""
+    cached = cache.get(key)
+    if cached is None:
+        _record('miss')
+        return None
+    _record('hit')
+    content, content_type = cached
+    response = encoded_response(request, key, content, content_type)
+    response['X-Cache'] = 'HIT'
+    return response
+
+
+def store_response(request, key, response):
+    """Cache a rendered response's body and return it in the encoding the client accepts."""
+    cache.set(key, (response.content, response['Content-Type']), get_response_cache_settings()['TIMEOUT'])
+    return encoded_response(request, key, response.content, response['Content-Type'], response)
+
+
+def encoded_response(request, key, content, content_type, response=None):
+    """
+    Response with the body in the best encoding the client accepts. Each
+    encoding is compressed once and cached under the body's key.
+    """
+    encoding = negotiate(request)
+    if encoding is None or not is_compressible(content_type) or not worth_compressing(content):
+        return response if response is not None else HttpResponse(content, content_type=content_type)
+
+    variant_key = f'{key}:{encoding}'
+    compressed = cache.get(variant_key)
+    if compressed is None:
+        compressed = compress(content, encoding, stored=True)
+        cache.set(variant_key, compressed, get_response_cache_settings()['TIMEOUT'])
+    if response is None:
+        response = HttpResponse(compressed, content_type=content_type)
+    else:
+        response.content = compressed
+    return mark_encoded(response, encoding)
+
+
+def store_when_sent(key, response):
+    """Cache a streamed response's body once its last chunk has been sent."""
+    tee = _astore_when_sent if response.is_async else _store_when_sent
+    response.streaming_content = tee(key, response.streaming_content, response['Content-Type'])
+    return response
+
+
+def _store_when_sent(key, chunks, content_type):
+    """Pass streamed chunks through, caching the body once the last one has gone out."""
+    sent = []
+    for chunk in chunks:
+        sent.append(chunk)
+        yield chunk
+    cache.set(key, (b''.join(sent), content_type), get_response_cache_settings()['TIMEOUT'])
+
+
+async def _astore_when_sent(key, chunks, content_type):
+    sent = []
+    async for chunk in chunks:
+        sent.append(chunk)
+        yield chunk
+    await cache.aset(key, (b''.join(sent), content_type), get_response_cache_settings()['TIMEOUT'])
@@ -1,8 +1,49 @@
 import json
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from django.db.models import Count
+from django.db import models
+from django.db.models import Count, TextField
+from django.db.models.functions import Cast
+from django.urls import reverse
 from .models import Project, MarketArea, StylePreset, VariablePreset, ColorKey, TcgTheme, EnrichmentUsage, MapConfiguration, LabelPosition  
+from .geometry import normalize_geometry, geometry_metrics
+from .derived_metrics import CompiledFormulas, FormulaError
+from .variable_catalog import get_variable_catalog
+from .thumbnails import thumbnail_version
+from .renderers import RawJSON
+from .uploads import ParsedGeometry
+
+def with_raw_json(queryset, *fields):
+    """
+    Read JSON columns as text (annotated as `<field>_json`) instead of
+    decoding them, for RawJSONField to pass through to the renderer.
+    """
+    return queryset.defer(*fields).annotate(**{
+        f'{field}_json': Cast(field, output_field=TextField()) for field in fields
+    })
+
+
+class RawJSONField(serializers.JSONField):
+    """JSONField that emits the `<field>_json` text annotation as RawJSON when present."""
+
+    def get_attribute(self, instance):
+        raw_name = f'{self.source}_json'
+        if raw_name in getattr(instance, '__dict__', {}):
+            raw = instance.__dict__[raw_name]
+            return None if raw is None else RawJSON(raw)
+        return super().get_attribute(instance)
+
+    def to_representation(self, value):
+        if isinstance(value, RawJSON):
+            return value
+        return super().to_representation(value)
+
+    def to_internal_value(self, data):
+        # Checked by the upload parser; its ring arrays are not JSON serializable until normalized
+        if isinstance(data, ParsedGeometry):
+            return data
+        return super().to_internal_value(data)
+
 
 class ColorKeySerializer(serializers.ModelSerializer):
     class Meta:
@@ -96,6 +137,7 @@ class EnrichmentUsageSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'project', 'cost', 'timestamp']
 
 class MarketAreaSerializer(serializers.ModelSerializer):
+    serializer_field_mapping = {**serializers.ModelSerializer.serializer_field_mapping, models.JSONField: RawJSONField}
     project_number = serializers.ReadOnlyField(source='project.project_number')
     
     class Meta:
@@ -104,9 +146,15 @@ class MarketAreaSerializer(serializers.ModelSerializer):
             'id', 'name', 'short_name', 'ma_type', 'geometry',
             'style_settings', 'locations', 'radius_points', 'drive_time_points',
             'site_location_data', 'created_at', 'last_modified',
-            'project_number', 'order',
+            'project_number', 'order', 'area', 'vertex_count',
         ]
-        read_only_fields = ['created_at', 'last_modified', 'order']
+        read_only_fields = ['created_at', 'last_modified', 'order', 'area', 'vertex_count']
+
+    def validate_geometry(self, value):
+        try:
+            return normalize_geometry(value)
+        except (ValueError, TypeError, IndexError) as e:
+            raise serializers.ValidationError(f"Invalid geometry: {e}")
 
     def validate(self, data):
         ma_type = data.get('ma_type')
@@ -158,19 +206,31 @@ class MarketAreaSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError({
                     "site_location_data": "Color must be a string (hex code or color name)"
                 })
-        
+
+        # Keep the derived bbox/area/centroid columns in step with the geometry
+        if 'geometry' in data:
+            data.update(geometry_metrics(data['geometry']))
+
         return data
 
 class ProjectListSerializer(serializers.ModelSerializer):
     market_areas_count = serializers.IntegerField(read_only=True)
+    thumbnail_url = serializers.SerializerMethodField()
     
     class Meta:
         model = Project
         fields = [
             'id', 'project_number', 'client', 'location', 
-            'last_modified', 'market_areas_count'
+            'last_modified', 'market_areas_count', 'thumbnail_url'
         ]
 
+    def get_thumbnail_url(self, obj):
+        # A stat() of the PNG, no query; the version makes the URL safe to cache forever
+        version = thumbnail_version(obj.id)
+        if version is None:
+            return None
+        return f"{reverse('project-thumbnail', kwargs={'project_id': obj.id})}?v={version}"
+
 class ProjectDetailSerializer(serializers.ModelSerializer):
     market_areas = MarketAreaSerializer(many=True, read_only=True)
     users = UserSerializer(many=True, read_only=True)
@@ -220,7 +280,7 @@ class VariablePresetSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = VariablePreset
-        fields = ['id', 'name', 'variables', 'is_global', 
+        fields = ['id', 'name', 'variables', 'formulas', 'is_global', 
                  'created_at', 'last_modified', 'created_by', 'created_by_username',
                  'variable_count']
         read_only_fields = ['id', 'created_at', 'last_modified', 'created_by']
@@ -233,6 +293,20 @@ class VariablePresetSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Variables must be a list")
         if not value:
             raise serializers.ValidationError("Variables list cannot be empty")
+        if not all(isinstance(variable, str) for variable in value):
+            raise serializers.ValidationError("Variables must be strings")
+        unknown = get_variable_catalog().unknown(value)
+        if unknown:
+            raise serializers.ValidationError(f"Unknown variables: {', '.join(map(str, unknown[:20]))}")
+        return value
+
+    def validate_formulas(self, value):
+        if not isinstance(value, list):
+            raise serializers.ValidationError("Formulas must be a list")
+        try:
+            CompiledFormulas(value)
+        except FormulaError as e:
+            raise serializers.ValidationError(str(e))
         return value
 
     def validate(self, data):
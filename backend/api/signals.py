@@ -0,0 +1,74 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import invalidate_user
+from .catalog_cache import bump_version
+from .models import (
+    ColorKey, LabelPosition, MapConfiguration, MarketArea, Project, StylePreset, TcgTheme, VariablePreset,
+)
+from .response_cache import bump_project
+from .thumbnails import schedule_thumbnail
+from .vector_tiles import clear_project_tiles
+
+
+@receiver([post_save, post_delete], sender=MarketArea)
+def invalidate_project_tiles(sender, instance, **kwargs):
+    # Tiles are keyed by project version, so stale ones are never served;
+    # this just reclaims the disk space once the change is committed.
+    project_id = instance.project_id
+    transaction.on_commit(lambda: clear_project_tiles(project_id))
+
+
+@receiver([post_save, post_delete], sender=MarketArea)
+def regenerate_project_thumbnail(sender, instance, **kwargs):
+    project_id = instance.project_id
+    transaction.on_commit(lambda: schedule_thumbnail(project_id))
+
+
+@receiver([post_save, post_delete], sender=ColorKey)
+def invalidate_color_keys(sender, instance, **kwargs):
+    # Themes embed their colour key, so both catalogs change
+    bump_version('color_keys', 'tcg_themes')
+
+
+@receiver([post_save, post_delete], sender=TcgTheme)
+def invalidate_tcg_themes(sender, instance, **kwargs):
+    bump_version('tcg_themes')
+
+
+# Saves also cover make_global and presets leaving the global set, whose
+# previous state is no longer known here
+@receiver([post_save, post_delete], sender=StylePreset)
+def invalidate_global_style_presets(sender, instance, **kwargs):
+    bump_version('global_style_presets')
+
+
+@receiver([post_save, post_delete], sender=VariablePreset)
+def invalidate_global_variable_presets(sender, instance, **kwargs):
+    bump_version('global_variable_presets')
+
+
+@receiver([post_save, post_delete], sender=MarketArea)
+@receiver([post_save, post_delete], sender=MapConfiguration)
+@receiver([post_save, post_delete], sender=LabelPosition)
+def invalidate_project_responses(sender, instance, **kwargs):
+    bump_project(instance.project_id)
+
+
+@receiver([post_save, post_delete], sender=Project)
+def invalidate_project_detail(sender, instance, **kwargs):
+    bump_project(instance.id)
+
+
+@receiver(m2m_changed, sender=Project.users.through)
+def invalidate_project_users(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear') and isinstance(instance, Project):
+        bump_project(instance.id)
+
+
+# Covers AdminUserViewSet deactivation and password resets, which both save the user
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
@@ -0,0 +1,224 @@
+"""
+Point-in-polygon classification of custom/site points against market areas.
+
+Points are binned into a uniform grid once; each market area then pulls only
+the points from grid cells under its bounding box and runs the vectorized
+crossing-number test on that subset.
+"""
+import csv
+import io
+import math
+
+import numpy as np
+
+from .geometry import ring_edges, rings_as_lonlat, points_in_edges
+
+
+# Mirrors the column auto-detection in CustomDataHandler.js
+LATITUDE_FIELDS = ['Latitude', 'latitude', 'lat', 'LAT', 'y', 'Y', 'Lat', 'lat_y', 'LAT_Y']
+LONGITUDE_FIELDS = ['Longitude', 'longitude', 'lng', 'long', 'LONG', 'LON', 'lon', 'x', 'X',
+                    'Lng', 'Long', 'lng_x', 'LON_X']
+
+
+class PointGrid:
+    """Uniform grid over a point set with contiguous per-cell index ranges."""
+
+    def __init__(self, xs, ys, target_per_cell=16):
+        self.xs = np.asarray(xs, dtype=float)
+        self.ys = np.asarray(ys, dtype=float)
+        n = self.xs.size
+        if n == 0:
+            self.xmin = self.ymin = 0.0
+            self.cell_size = 1.0
+            self.columns = self.rows = 1
+            self.order = np.empty(0, dtype=np.intp)
+            self.offsets = np.zeros(2, dtype=np.intp)
+            return
+
+        self.xmin, self.ymin = float(self.xs.min()), float(self.ys.min())
+        width = float(self.xs.max()) - self.xmin
+        height = float(self.ys.max()) - self.ymin
+        cells = max(1, n // target_per_cell)
+        # The extent term keeps the grid bounded when points fall on a line
+        self.cell_size = max(math.sqrt(width * height / cells), max(width, height) / cells, 1e-9)
+        self.columns = int(width // self.cell_size) + 1
+        self.rows = int(height // self.cell_size) + 1
+
+        cell_ids = self._cell_ids(self.xs, self.ys)
+        self.order = np.argsort(cell_ids, kind='stable')
+        counts = np.bincount(cell_ids, minlength=self.columns * self.rows)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    def _cell_ids(self, xs, ys):
+        col = ((xs - self.xmin) // self.cell_size).astype(np.intp)
+        row = ((ys - self.ymin) // self.cell_size).astype(np.intp)
+        return row * self.columns + col
+
+    def query_bbox(self, bbox):
+        """Indices of points inside (xmin, ymin, xmax, ymax)."""
+        if self.order.size == 0:
+            return self.order
+        xmin, ymin, xmax, ymax = bbox
+        col0 = max(int((xmin - self.xmin) // self.cell_size), 0)
+        col1 = min(int((xmax - self.xmin) // self.cell_size), self.columns - 1)
+        row0 = max(int((ymin - self.ymin) // self.cell_size), 0)
+        row1 = min(int((ymax - self.ymin) // self.cell_size), self.rows - 1)
+        if col0 > col1 or row0 > row1:
+            return np.empty(0, dtype=np.intp)
+
+        chunks = []
+        for row in range(row0, row1 + 1):
+            # Cells in one grid row are contiguous in the sorted order
+            start = self.offsets[row * self.columns + col0]
+            end = self.offsets[row * self.columns + col1 + 1]
+            if end > start:
+                chunks.append(self.order[start:end])
+        if not chunks:
+            return np.empty(0, dtype=np.intp)
+
+        candidates = np.concatenate(chunks)
+        px, py = self.xs[candidates], self.ys[candidates]
+        keep = (px >= xmin) & (px <= xmax) & (py >= ymin) & (py <= ymax)
+        return candidates[keep]
+
+
+def detect_coordinate_fields(record, latitude_field=None, longitude_field=None):
+    columns = list(record.keys())
+    if not latitude_field:
+        latitude_field = next((c for c in LATITUDE_FIELDS if c in columns), None) or \
+            next((c for c in columns if 'lat' in c.lower()), None)
+    if not longitude_field:
+        longitude_field = next((c for c in LONGITUDE_FIELDS if c in columns), None) or \
+            next((c for c in columns if 'lon' in c.lower() or 'lng' in c.lower()), None)
+    return latitude_field, longitude_field
+
+
+def records_from_csv(upload):
+    text = io.TextIOWrapper(upload, encoding='utf-8-sig')
+    return list(csv.DictReader(text))
+
+
+def records_from_market_area(market_area):
+    """Point records stored on a custom or site_location MarketArea."""
+    records = []
+    for location in market_area.locations or []:
+        if not isinstance(location, dict):
+            continue
+        record = dict(location.get('attributes') or location)
+        geometry = location.get('geometry') or {}
+        if 'x' in geometry and 'y' in geometry:
+            record.setdefault('longitude', geometry['x'])
+            record.setdefault('latitude', geometry['y'])
+        records.append(record)
+
+    point = (market_area.site_location_data or {}).get('point')
+    if point:
+        records.append({'latitude': point.get('latitude'), 'longitude': point.get('longitude')})
+    return records
+
+
+def numeric_columns(records, exclude=()):
+    """Columns whose non-empty values all parse as numbers."""
+    columns = {}
+    for record in records:
+        for key, value in record.items():
+            if key in exclude or columns.get(key) is False:
+                continue
+            if value is None or value == '':
+                continue
+            try:
+                float(value)
+                columns[key] = True
+            except (TypeError, ValueError):
+                columns[key] = False
+    return [key for key, numeric in columns.items() if numeric]
+
+
+def records_to_arrays(records, latitude_field, longitude_field, value_fields):
+    n = len(records)
+    xs = np.full(n, np.nan)
+    ys = np.full(n, np.nan)
+    values = np.zeros((n, len(value_fields)))
+    for i, record in enumerate(records):
+        try:
+            ys[i] = float(record.get(latitude_field))
+            xs[i] = float(record.get(longitude_field))
+        except (TypeError, ValueError):
+            pass
+        for j, field in enumerate(value_fields):
+            try:
+                values[i, j] = float(record.get(field))
+            except (TypeError, ValueError):
+                pass
+    return xs, ys, values
+
+
+def classify_points(records, market_areas, latitude_field=None, longitude_field=None, sum_fields=None):
+    """
+    Relate point records to the market areas that contain them.
+
+    Returns per-point market area IDs plus per-area counts and sums of the
+    requested numeric fields (all numeric fields when sum_fields is None).
+    `market_areas` is a MarketArea queryset; geometries are only loaded for
+    areas whose stored bounding box overlaps the points.
+    """
+    if not records:
+        return {'points': [], 'market_areas': [], 'unmatched': 0, 'invalid': 0}
+    if not all(isinstance(record, dict) for record in records):
+        raise ValueError('Every point must be an object of field values')
+
+    latitude_field, longitude_field = detect_coordinate_fields(records[0], latitude_field, longitude_field)
+    if not latitude_field or not longitude_field:
+        raise ValueError('Could not determine latitude/longitude fields')
+
+    if sum_fields is None:
+        sum_fields = numeric_columns(records, exclude={latitude_field, longitude_field})
+
+    xs, ys, values = records_to_arrays(records, latitude_field, longitude_field, sum_fields)
+    valid = ~(np.isnan(xs) | np.isnan(ys))
+    valid_index = np.flatnonzero(valid)
+    grid = PointGrid(xs[valid], ys[valid])
+
+    geometries = {}
+    if valid_index.size:
+        overlapping = market_areas.intersecting(
+            float(grid.xs.min()), float(grid.ys.min()), float(grid.xs.max()), float(grid.ys.max())
+        )
+        geometries = dict(overlapping.values_list('id', 'geometry'))
+
+    memberships = [[] for _ in records]
+    area_results = []
+    bbox_fields = ['bbox_xmin', 'bbox_ymin', 'bbox_xmax', 'bbox_ymax']
+    for market_area in market_areas.only('id', 'name', 'ma_type', *bbox_fields):
+        if market_area.bbox_xmin is None:
+            continue
+
+        point_index = valid_index[:0]
+        rings = rings_as_lonlat(geometries.get(market_area.id))
+        if rings:
+            candidates = grid.query_bbox([getattr(market_area, field) for field in bbox_fields])
+            inside = candidates[points_in_edges(grid.xs[candidates], grid.ys[candidates], ring_edges(rings))]
+            point_index = valid_index[inside]
+
+        area_id = str(market_area.id)
+        for i in point_index:
+            memberships[i].append(area_id)
+
+        sums = values[point_index].sum(axis=0) if point_index.size else np.zeros(len(sum_fields))
+        area_results.append({
+            'id': area_id,
+            'name': market_area.name,
+            'ma_type': market_area.ma_type,
+            'count': int(point_index.size),
+            'sums': {field: float(total) for field, total in zip(sum_fields, sums)},
+        })
+
+    return {
+        'latitude_field': latitude_field,
+        'longitude_field': longitude_field,
+        'sum_fields': sum_fields,
+        'points': [{'index': i, 'market_areas': ids} for i, ids in enumerate(memberships)],
+        'market_areas': area_results,
+        'unmatched': sum(1 for i, ids in enumerate(memberships) if valid[i] and not ids),
+        'invalid': int((~valid).sum()),
+    }
@@ -1,3 +1,1342 @@
-from django.test import TestCase
+import gzip
+import io
+import itertools
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .baseline import get_baseline_store
+from .class_breaks import ckmeans, class_break_infos, compute_class_breaks
+from .compression import available_encodings, compress_stream, negotiate
+from .derived_metrics import CompiledFormulas, FormulaError, compile_formula
+from .drive_time import DriveTimeService, RoutingError, StubRoutingProvider
+from .fast_serializers import iter_market_area_json
+from .geometry import geometry_metrics, normalize_geometry, ring_signed_area
+from .label_placement import place_labels
+from .models import (
+    ColorKey, DriveTimePolygon, LabelPosition, MapConfiguration, Project, MarketArea, StylePreset, TcgTheme,
+    VariablePreset,
+)
+from .renderers import FastJSONRenderer
+from .serializers import MarketAreaSerializer
+from .topology import decode_topology, encode_topology
+from .uploads import MarketAreaBodyScanner, get_upload_limits
+from .utils import write_atomic
+from .variable_catalog import tokenize
+from . import overlap
+
+
+class FlakyRoutingProvider(StubRoutingProvider):
+    fail_minutes = None
+
+    def solve(self, longitude, latitude, minutes, travel_mode='driving'):
+        if minutes == self.fail_minutes:
+            raise RoutingError('Service area request failed')
+        return super().solve(longitude, latitude, minutes, travel_mode)
+
+
+class DriveTimeServiceTests(TestCase):
+    def setUp(self):
+        self.provider = FlakyRoutingProvider()
+        self.service = DriveTimeService(provider=self.provider, max_concurrency=2)
+
+    def test_repeated_requests_do_not_hit_provider(self):
+        first = self.service.get_polygon(-84.38798, 33.74900, 15)
+        second = self.service.get_polygon(-84.38801, 33.74902, 15)
+
+        self.assertEqual(self.provider.calls, 1)
+        self.assertEqual(first[1], 'provider')
+        self.assertEqual(second, (first[0], 'memory'))
+
+    def test_polygons_survive_process_restart(self):
+        self.service.get_polygon(-84.388, 33.749, 10)
+        fresh = DriveTimeService(provider=self.provider)
+
+        geometry, source = fresh.get_polygon(-84.388, 33.749, 10)
+
+        self.assertEqual(source, 'database')
+        self.assertEqual(self.provider.calls, 1)
+        self.assertEqual(DriveTimePolygon.objects.count(), 1)
+
+    def test_batch_solves_each_distinct_key_once(self):
+        results = self.service.get_polygons([
+            (-84.388, 33.749, 10, 'driving'),
+            (-84.388, 33.749, 10, 'driving'),
+            (-84.388, 33.749, 20, 'driving'),
+            (-80.191, 25.761, 10, 'driving'),
+        ])
+
+        self.assertEqual(len(results), 4)
+        self.assertEqual(self.provider.calls, 3)
+        self.assertIs(results[0][0], results[1][0])
+
+    def test_memory_cache_is_bounded(self):
+        service = DriveTimeService(provider=self.provider, memory_cache_size=2)
+        for minutes in (5, 10, 15):
+            service.get_polygon(-84.388, 33.749, minutes)
+
+        self.assertEqual(len(service.memory), 2)
+
+    def test_polygons_solved_before_a_failure_are_kept(self):
+        batch = [(-84.388, 33.749, minutes, 'driving') for minutes in (5, 10, 20, 30)]
+        for solve in (self.service.get_polygons, async_to_sync(self.service.aget_polygons)):
+            with self.subTest(solve=solve):
+                DriveTimePolygon.objects.all().delete()
+                self.service.memory.clear()
+                self.provider.fail_minutes = 20
+
+                with self.assertRaises(RoutingError):
+                    solve(batch)
+
+                self.assertEqual(sorted(DriveTimePolygon.objects.values_list('minutes', flat=True)), [5, 10, 30])
+                self.provider.fail_minutes = None
+                calls = self.provider.calls
+                self.assertEqual([source for _, source in solve(batch)], ['memory', 'memory', 'provider', 'memory'])
+                self.assertEqual(self.provider.calls, calls + 1)
+
+    def test_non_object_points_are_rejected(self):
+        client = APIClient()
+        # The async view authenticates with JWT only
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(User.objects.create(username='drive'))}")
+        points = [{'longitude': -84.388, 'latitude': 33.749, 'travelTimeMinutes': 10}, 'not a point']
+
+        for url in ('/api/drive-time/polygons/', '/api/async/drive-time/polygons/'):
+            response = client.post(url, {'points': points}, format='json')
+            self.assertEqual(response.status_code, 400)
+
+
+    def test_invalid_batches_are_rejected(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(User.objects.create(username='limits'))}")
+        point = {'longitude': -84.388, 'latitude': 33.749, 'travelTimeMinutes': 10}
+        invalid = {
+            'too many points': [point] * 101,
+            'NaN minutes': [{**point, 'travelTimeMinutes': 'nan'}],
+            'negative minutes': [{**point, 'travelTimeMinutes': -5}],
+            'huge minutes': [{**point, 'travelTimeMinutes': 1e9}],
+            'infinite minutes': [{**point, 'travelTimeMinutes': 'inf'}],
+            'unknown mode': [{**point, 'travelMode': 'teleport'}],
+            'unhashable mode': [{**point, 'travelMode': ['driving']}],
+            'latitude out of range': [{**point, 'latitude': 133.7}],
+        }
+
+        for url in ('/api/drive-time/polygons/', '/api/async/drive-time/polygons/'):
+            for case, points in invalid.items():
+                with self.subTest(url=url, case=case):
+                    self.assertEqual(client.post(url, {'points': points}, format='json').status_code, 400)
+        self.assertFalse(DriveTimePolygon.objects.exists())
+
+def canonical_ring(ring):
+    """Ring as an open vertex list rotated to start at its smallest vertex."""
+    points = [tuple(point) for point in ring]
+    if points[0] == points[-1]:
+        points = points[:-1]
+    start = points.index(min(points))
+    return points[start:] + points[:start]
+
+
+def square(x, y, size, steps=1):
+    """Closed Esri ring (clockwise) with `steps` vertices per side."""
+    ring = []
+    corners = [(x, y), (x, y + size), (x + size, y + size), (x + size, y)]
+    for (x0, y0), (x1, y1) in zip(corners, corners[1:] + corners[:1]):
+        for i in range(steps):
+            ring.append([x0 + (x1 - x0) * i / steps, y0 + (y1 - y0) * i / steps])
+    ring.append(ring[0])
+    return ring
+
+
+class TopologyRoundTripTests(SimpleTestCase):
+    def assertRoundTrip(self, items, precision=None):
+        topology = json.loads(json.dumps(encode_topology(items, precision)))
+        decoded = decode_topology(topology)
+        self.assertEqual(len(decoded), len(items))
+        for original, restored in zip(items, decoded):
+            self.assertEqual(
+                {key: value for key, value in original.items() if key != 'geometry'},
+                {key: value for key, value in restored.items() if key != 'geometry'},
+            )
+            if original['geometry'] is None or 'x' in original['geometry']:
+                self.assertEqual(original['geometry'], restored['geometry'])
+                continue
+            if 'rings' in original['geometry']:
+                self.assertEqual(original['geometry']['spatialReference'], restored['geometry']['spatialReference'])
+                original_rings = original['geometry']['rings']
+                restored_rings = restored['geometry']['rings']
+            elif original['geometry']['type'] == 'MultiPolygon':
+                original_rings = [ring for polygon in original['geometry']['coordinates'] for ring in polygon]
+                restored_rings = [ring for polygon in restored['geometry']['coordinates'] for ring in polygon]
+            else:
+                original_rings = original['geometry']['coordinates']
+                restored_rings = restored['geometry']['coordinates']
+            self.assertEqual(
+                [canonical_ring(ring) for ring in original_rings],
+                [canonical_ring(ring) for ring in restored_rings],
+            )
+        return topology
+
+    def test_adjacent_areas_share_border_arcs(self):
+        offset = 0.000123  # Full six-decimal coordinates, as stored for real tracts
+        left = normalize_geometry({'rings': [square(-84.4 + offset, 33.7 + offset, 0.1, steps=50)],
+                                   'spatialReference': {'wkid': 4326}})
+        right = normalize_geometry({'rings': [square(-84.3 + offset, 33.7 + offset, 0.1, steps=50)],
+                                    'spatialReference': {'wkid': 4326}})
+        items = [
+            {'id': 'a', 'name': 'Left', 'ma_type': 'tract', 'geometry': left},
+            {'id': 'b', 'name': 'Right', 'ma_type': 'tract', 'geometry': right},
+        ]
+
+        topology = self.assertRoundTrip(items)
+
+        vertices = sum(len(arc) for arc in topology['arcs'])
+        # 400 ring vertices, 51 of them on the shared border
+        self.assertLess(vertices, 400 - 40)
+        self.assertLess(len(json.dumps(topology)), len(json.dumps(items)) / 2)
+
+    def test_random_polygons_with_holes_round_trip(self):
+        rng = random.Random(7)
+        items = []
+        for i in range(20):
+            x, y = rng.uniform(-100, -80), rng.uniform(30, 40)
+            outer = [[x + rng.uniform(0, 1), y + rng.uniform(0, 1)] for _ in range(30)]
+            # Sorting by angle around the centre gives a simple (star-shaped) ring
+            outer.sort(key=lambda point: math.atan2(point[1] - y - 0.5, point[0] - x - 0.5))
+            hole = square(x + 0.45, y + 0.45, 0.1)
+            geometry = normalize_geometry({'rings': [outer + outer[:1], hole], 'spatialReference': {'wkid': 4326}})
+            items.append({'id': str(i), 'ma_type': 'custom', 'geometry': geometry})
+
+        self.assertRoundTrip(items)
+
+    def test_web_mercator_and_geojson_round_trip(self):
+        mercator = normalize_geometry({
+            'rings': [square(-9392000.123, 3995000.456, 2500, steps=10)],
+            'spatialReference': {'wkid': 102100, 'latestWkid': 3857},
+        })
+        multipolygon = normalize_geometry({
+            'type': 'MultiPolygon',
+            'coordinates': [[square(0, 0, 1)], [square(2, 2, 1), square(2.25, 2.25, 0.5)]],
+        })
+        items = [
+            {'id': 'm', 'ma_type': 'radius', 'geometry': mercator},
+            {'id': 'g', 'ma_type': 'custom', 'geometry': multipolygon},
+            {'id': 's', 'ma_type': 'site_location', 'geometry': {'x': -84.39, 'y': 33.75}},
+            {'id': 'n', 'ma_type': 'custom', 'geometry': None},
+        ]
+
+        self.assertRoundTrip(items)
+
+    def test_coarser_precision_round_trips_quantized_geometry(self):
+        geometry = normalize_geometry({'rings': [square(-84.123456, 33.654321, 0.01, steps=5)],
+                                       'spatialReference': {'wkid': 4326}})
+        quantized = normalize_geometry({
+            'rings': [[[round(x, 4), round(y, 4)] for x, y in ring] for ring in geometry['rings']],
+            'spatialReference': {'wkid': 4326},
+        })
+        decoded = decode_topology(encode_topology([{'id': 'q', 'geometry': geometry}], precision=4))
+
+        self.assertEqual(
+            canonical_ring(decoded[0]['geometry']['rings'][0]),
+            canonical_ring(quantized['rings'][0]),
+        )
+
+
+class TopoJSONRendererTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='renderer'))
+        self.project = Project.objects.create(project_number='TEST-1', client='Client', location='Atlanta')
+        for i in range(3):
+            MarketArea.objects.create(
+                project=self.project, name=f'Area {i}', ma_type='tract', order=i,
+                geometry={'rings': [square(-84.4 + i * 0.1, 33.7, 0.1)], 'spatialReference': {'wkid': 4326}},
+            )
+        self.url = f'/api/projects/{self.project.id}/market-areas/'
+
+    def test_format_query_parameter(self):
+        response = self.client.get(self.url, {'format': 'topojson'})
+
+        self.assertEqual(response['Content-Type'], 'application/topo+json')
+        topology = json.loads(response.content)
+        self.assertEqual(topology['type'], 'Topology')
+        self.assertEqual(len(decode_topology(topology)), 3)
+
+    def test_accept_header(self):
+        response = self.client.get(self.url, HTTP_ACCEPT='application/topo+json')
+
+        self.assertEqual(json.loads(response.content)['type'], 'Topology')
+
+    def test_default_is_plain_json(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(len(response.json()), 3)
+
+
+class ProjectResponseCacheTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='cache'))
+        self.project = Project.objects.create(project_number='CACHE-1', client='Client', location='Atlanta')
+        self.area = MarketArea.objects.create(project=self.project, name='Area', ma_type='tract')
+        self.url = f'/api/projects/{self.project.id}/market-areas/'
+
+    def test_writes_retire_cached_responses(self):
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'HIT')
+
+        self.area.name = 'Renamed'
+        self.area.save()
+        response = self.client.get(self.url)
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()[0]['name'], 'Renamed')
+
+    def test_related_writes_retire_project_lists(self):
+        configurations = f'/api/map-configurations/?project={self.project.id}'
+        labels = f'/api/label-positions/?project={self.project.id}'
+        self.client.get(configurations)
+        self.client.get(labels)
+
+        configuration = MapConfiguration.objects.create(
+            project=self.project, tab_name='Tab', visualization_type='income', area_type='tract',
+        )
+        LabelPosition.objects.create(
+            project=self.project, map_configuration=configuration, label_id='oid-1',
+            x_offset=0, y_offset=0, font_size=10,
+        )
+
+        self.assertEqual(len(self.client.get(configurations).json()), 1)
+        self.assertEqual(len(self.client.get(labels).json()), 1)
+
+    def test_version_token_lives_in_the_shared_cache(self):
+        from django.core.cache import CacheHandler
+        self.client.get(self.url)
+        # A second backend instance stands in for another worker process
+        other_worker = CacheHandler()['default']
+        key = f'project_version:{self.project.id}'
+        self.assertIsNotNone(other_worker.get(key))
+
+        self.area.save()
+
+        self.assertIsNone(other_worker.get(key))
+
+    def test_stats_reach_the_shared_cache_in_batches(self):
+        from django.core.cache import cache
+        from .response_cache import STATS_KEYS, _pending_stats, cache_stats
+        self.enterContext(override_settings(PROJECT_RESPONSE_CACHE={'STATS_FLUSH_EVERY': 3}))
+        self.enterContext(mock.patch.dict(_pending_stats, hit=0, miss=0))
+        cache.delete_many(STATS_KEYS.values())
+
+        self.client.get(self.url)
+        self.client.get(self.url)
+        self.assertIsNone(cache.get(STATS_KEYS['hit']))
+        self.assertEqual(cache_stats()['hits'], 1)
+
+        self.client.get(self.url)
+        self.assertEqual(cache.get(STATS_KEYS['hit']), 2)
+        self.assertEqual(cache.get(STATS_KEYS['miss']), 1)
+        self.assertEqual(cache_stats(), {'hits': 2, 'misses': 1, 'hit_rate': 0.6667})
+
+    def test_browsable_api_is_not_cached(self):
+        html = self.client.get(self.url, HTTP_ACCEPT='text/html')
+        self.assertNotIn('X-Cache', html)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_errors_are_not_marked_as_cache_misses(self):
+        response = self.client.get('/api/projects/00000000-0000-0000-0000-000000000000/')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('X-Cache', response)
+
+
+class AuthUserCacheTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        self.cache = cache
+        self.user = User.objects.create_user(username='cached', password='first-password')
+        self.key = f'auth_user:{self.user.id}'
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.assertEqual(self.client.get('/api/color-keys/').status_code, 200)
+        self.assertIsNotNone(self.cache.get(self.key))
+
+    def test_deactivating_a_user_drops_the_cached_user(self):
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertIsNone(self.cache.get(self.key))
+        self.assertEqual(self.client.get('/api/color-keys/').status_code, 401)
+
+    def test_changing_the_password_drops_the_cached_user(self):
+        self.user.set_password('second-password')
+        self.user.save()
+
+        self.assertIsNone(self.cache.get(self.key))
+        self.client.get('/api/color-keys/')
+        self.assertEqual(self.cache.get(self.key).password, self.user.password)
+
+    def test_deleting_a_user_drops_the_cached_user(self):
+        self.user.delete()
+
+        self.assertIsNone(self.cache.get(self.key))
+        self.assertEqual(self.client.get('/api/color-keys/').status_code, 401)
+
+    def test_database_cache_is_not_used_for_users(self):
+        self.enterContext(override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'auth_user_cache',
+        }}))
+        call_command('createcachetable', verbosity=0)
+
+        self.assertEqual(self.client.get('/api/color-keys/').status_code, 200)
+        self.assertIsNone(self.cache.get(self.key))
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from .catalog_cache import COLOR_KEYS, TCG_THEMES, get_version
+        self.get_version = get_version
+        # Versions roll back with each test; the cached mirror and built catalogs don't
+        cache.clear()
+        for catalog in (COLOR_KEYS, TCG_THEMES):
+            self.enterContext(mock.patch.object(catalog, '_entry', None))
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='catalog'))
+        self.red = ColorKey.objects.create(key_number='1', color_name='Red', R=255, G=0, B=0, Hex='#FF0000')
+
+    def test_warm_catalog_is_served_without_queries(self):
+        first = self.client.get('/api/color-keys/')
+        self.assertEqual(first.json()[0]['color_name'], 'Red')
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/color-keys/')
+            retrieved = self.client.get(f'/api/color-keys/{self.red.id}/')
+
+        self.assertEqual(response.content, first.content)
+        self.assertEqual(retrieved.json()['Hex'], '#FF0000')
+
+    def test_matching_etag_gets_not_modified(self):
+        etag = self.client.get('/api/color-keys/')['ETag']
+
+        response = self.client.get('/api/color-keys/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get('/api/color-keys/', HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_color_key_writes_bump_keys_and_themes(self):
+        etag = self.client.get('/api/color-keys/')['ETag']
+        versions = self.get_version('color_keys'), self.get_version('tcg_themes')
+
+        self.red.color_name = 'Crimson'
+        self.red.save()
+
+        self.assertEqual(self.get_version('color_keys'), versions[0] + 1)
+        self.assertEqual(self.get_version('tcg_themes'), versions[1] + 1)
+        response = self.client.get('/api/color-keys/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['color_name'], 'Crimson')
+
+    def test_theme_writes_bump_only_themes(self):
+        versions = self.get_version('color_keys'), self.get_version('tcg_themes')
+
+        theme = TcgTheme.objects.create(
+            theme_key='T1', theme_name='Theme', fill='Yes', color_key=self.red, transparency='0',
+            border='No', weight='1', excel_fill='', excel_text='',
+        )
+
+        self.assertEqual(self.get_version('color_keys'), versions[0])
+        self.assertEqual(self.get_version('tcg_themes'), versions[1] + 1)
+        self.assertEqual(self.client.get(f'/api/tcg-themes/{theme.id}/').json()['theme_name'], 'Theme')
+        theme.delete()
+        self.assertEqual(self.get_version('tcg_themes'), versions[1] + 2)
+
+
+class DotDensityTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='dots'))
+        self.features = [{
+            'id': 'a',
+            'geometry': {'rings': [square(-84.4, 33.7, 0.1)], 'spatialReference': {'wkid': 4326}},
+            'attributes': {'POP': 500},
+        }]
+
+    def post(self, config, **data):
+        return self.client.post('/api/dot-density/points/', {'config': config, 'features': self.features, **data},
+                                format='json')
+
+    def test_config_edits_change_the_cached_result(self):
+        config = {'attributes': [{'field': 'POP', 'color': '#ff0000', 'label': 'People', 'value': 10}]}
+        first = self.post(config).json()
+
+        recoloured = {'attributes': [{'field': 'POP', 'color': '#0000ff', 'label': 'Residents', 'value': 10}]}
+        layer = self.post(recoloured).json()['layers'][0]
+        self.assertEqual((layer['color'], layer['label']), ('#0000ff', 'Residents'))
+
+        denser = {'attributes': [{'field': 'POP', 'color': '#ff0000', 'label': 'People', 'value': 5}]}
+        self.assertEqual(first['layers'][0]['count'], 50)
+        self.assertEqual(self.post(denser).json()['layers'][0]['count'], 100)
+
+    def test_malformed_values_and_attributes_are_rejected(self):
+        project = Project.objects.create(project_number='DOTS-1', client='Client', location='Atlanta')
+        config = {'dotValue': 10, 'attributes': [{'field': 'POP'}]}
+
+        response = self.client.post('/api/dot-density/points/',
+                                    {'config': config, 'project': str(project.id), 'values': [1, 2]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        self.assertEqual(self.post({'dotValue': 10, 'attributes': {'field': 'POP'}}).status_code, 400)
+        self.features = ['not a feature']
+        self.assertEqual(self.post(config).status_code, 400)
+
+
+class ClassBreaksTests(TestCase):
+    def test_counts_include_each_class_upper_bound(self):
+        result = compute_class_breaks([1, 1, 1, 2, 2, 10, 11, 50], 'natural-breaks', 3)
+
+        self.assertEqual(result['breaks'], [1.0, 2.0, 11.0, 50.0])
+        self.assertEqual(result['counts'], [5, 2, 1])
+
+    def test_counts_match_class_break_infos(self):
+        values = [random.Random(3).randint(0, 20) for _ in range(200)]
+        result = compute_class_breaks(values, 'quantile', 5)
+
+        for index, (info, count) in enumerate(zip(class_break_infos(result), result['counts'])):
+            low, high = info['minValue'], info['maxValue']
+            in_class = [value for value in values if (low < value or index == 0 and value == low) and value <= high]
+            self.assertEqual(count, len(in_class))
+        self.assertEqual(sum(result['counts']), len(values))
+
+    def test_ckmeans_matches_exhaustive_search(self):
+        def within_class_cost(values, weights, starts):
+            cost = 0.0
+            for start, end in zip(starts, list(starts[1:]) + [len(values)]):
+                x, w = values[start:end], weights[start:end]
+                cost += float((w * (x - (w * x).sum() / w.sum()) ** 2).sum())
+            return cost
+
+        rng = random.Random(11)
+        for _ in range(25):
+            values, weights = np.unique([rng.randint(0, 60) for _ in range(rng.randint(3, 12))], return_counts=True)
+            values, weights = values.astype(float), weights.astype(float)
+            for k in range(1, min(4, len(values)) + 1):
+                best = min(
+                    within_class_cost(values, weights, (0,) + cuts)
+                    for cuts in itertools.combinations(range(1, len(values)), k - 1)
+                )
+                self.assertAlmostEqual(within_class_cost(values, weights, ckmeans(values, weights, k)), best)
+
+    def test_cached_breaks_follow_the_data(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='breaks-data'))
+        data = {'variable': 'POP', 'area_type': 'tract', 'extent': [-85, 33, -84, 34], 'classes': 2}
+
+        first = client.post('/api/class-breaks/', {**data, 'values': [1, 2, 3, 4]}, format='json').json()
+        changed = client.post('/api/class-breaks/', {**data, 'values': [10, 20, 30, 40]}, format='json').json()
+        self.assertEqual((first['breaks'][-1], changed['breaks'][-1]), (4.0, 40.0))
+        # Same values in another order are the same data
+        with mock.patch('api.class_breaks.compute_class_breaks') as compute:
+            client.post('/api/class-breaks/', {**data, 'values': [4, 3, 2, 1]}, format='json')
+        compute.assert_not_called()
+
+        self.assertEqual(client.post('/api/class-breaks/', data, format='json').status_code, 400)
+        self.assertEqual(client.post('/api/class-breaks/', {**data, 'vintage': '2025'}, format='json').status_code, 400)
+        client.post('/api/class-breaks/', {**data, 'vintage': '2025', 'values': [5, 6, 7, 8]}, format='json')
+        cached = client.post('/api/class-breaks/', {**data, 'vintage': '2025'}, format='json')
+        self.assertEqual(cached.json()['breaks'][-1], 8.0)
+
+    def test_map_configuration_must_belong_to_the_project(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='breaks'))
+        project = Project.objects.create(project_number='BRK-1', client='Client', location='Atlanta')
+        other = Project.objects.create(project_number='BRK-2', client='Client', location='Atlanta')
+        configuration = MapConfiguration.objects.create(
+            project=other, tab_name='Tab', visualization_type='income', area_type='tract',
+        )
+        data = {'variable': 'POP', 'area_type': 'tract', 'values': [1, 2, 3, 4], 'classes': 2,
+                'map_configuration': str(configuration.id)}
+
+        self.assertEqual(client.post('/api/class-breaks/', {**data, 'project': str(project.id)},
+                                     format='json').status_code, 404)
+        self.assertEqual(client.post('/api/class-breaks/', data, format='json').status_code, 400)
+        response = client.post('/api/class-breaks/', {**data, 'project': str(other.id)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        configuration.refresh_from_db()
+        self.assertEqual(configuration.layer_configuration['type'], 'class-breaks')
+
+
+class LabelAutoPlaceTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='labels'))
+        self.project = Project.objects.create(project_number='LBL-1', client='Client', location='Atlanta')
+        geometry = {'rings': [square(-84.4, 33.7, 0.1)], 'spatialReference': {'wkid': 4326}}
+        self.area = MarketArea.objects.create(
+            project=self.project, name='Area', ma_type='radius', geometry=geometry, **geometry_metrics(geometry),
+        )
+
+        self.configuration = MapConfiguration.objects.create(
+            project=self.project, tab_name='Tab', visualization_type='income', area_type='radius',
+        )
+
+    def auto_place(self):
+        return self.client.post('/api/label-positions/auto_place/', {
+            'project_id': str(self.project.id), 'map_configuration_id': str(self.configuration.id),
+        }, format='json')
+
+    def test_label_ids_follow_the_client_scheme(self):
+        self.assertEqual(self.auto_place().json()['created'], 1)
+
+        label = LabelPosition.objects.get(project=self.project)
+        self.assertEqual(label.label_id, f'id-{self.area.id}')
+
+    def test_label_saved_concurrently_is_kept(self):
+        def place_after_concurrent_save(*args):
+            LabelPosition.objects.create(
+                project=self.project, map_configuration=self.configuration, label_id=f'id-{self.area.id}',
+                x_offset=5, y_offset=5, font_size=10,
+            )
+            return place_labels(*args)
+
+        with mock.patch('api.views.place_labels', side_effect=place_after_concurrent_save):
+            response = self.auto_place()
+
+        self.assertEqual(response.status_code, 200)
+        label = LabelPosition.objects.get(project=self.project)
+        self.assertEqual((label.x_offset, label.y_offset), (5, 5))
+
+
+class VectorTileTests(TestCase):
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        # Compress even this small tile
+        self.enterContext(override_settings(VECTOR_TILE_CACHE_DIR=cache_dir.name,
+                                            RESPONSE_COMPRESSION={'MIN_LENGTH': 0}))
+
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='tiles'))
+        project = Project.objects.create(project_number='MVT-1', client='Client', location='Atlanta')
+        geometry = {'rings': [square(-84.45, 33.65, 0.1)], 'spatialReference': {'wkid': 4326}}
+        MarketArea.objects.create(project=project, name='Area', ma_type='radius', geometry=geometry,
+                                  **geometry_metrics(geometry))
+        # The zoom 8 tile containing the area
+        z, lon, lat = 8, -84.4, 33.7
+        x = int((lon + 180) / 360 * 2 ** z)
+        y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * 2 ** z)
+        self.url = f'/api/projects/{project.id}/tiles/{z}/{x}/{y}.mvt'
+
+    def test_etag_varies_with_content_encoding(self):
+        plain = self.client.get(self.url)
+        gzipped = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertNotEqual(plain['ETag'].removeprefix('W/'), gzipped['ETag'].removeprefix('W/'))
+
+        revalidated = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=gzipped['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+
+
+class WriteAtomicTests(SimpleTestCase):
+    def test_concurrent_writers_never_share_a_temporary_file(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = f'{directory.name}/tile.mvt'
+        contents = [bytes([i]) * 100000 for i in range(8)]
+
+        threads = [threading.Thread(target=write_atomic, args=(path, content)) for content in contents]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with open(path, 'rb') as f:
+            self.assertIn(f.read(), contents)
+        self.assertEqual(os.listdir(directory.name), ['tile.mvt'])
+
+
+class PointClassificationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='points'))
+        project = Project.objects.create(project_number='PTS-1', client='Client', location='Atlanta')
+        self.areas = []
+        for name, x in (('Near', -84.5), ('Far', -80.0)):
+            geometry = {'rings': [square(x, 33.5, 0.5)], 'spatialReference': {'wkid': 4326}}
+            self.areas.append(MarketArea.objects.create(
+                project=project, name=name, ma_type='radius', geometry=geometry, **geometry_metrics(geometry),
+            ))
+        self.url = f'/api/projects/{project.id}/market-areas/classify-points/'
+
+    def test_points_are_counted_in_overlapping_areas_only(self):
+        points = [
+            {'latitude': 33.7, 'longitude': -84.4, 'sales': 10},
+            {'latitude': 33.8, 'longitude': -84.2, 'sales': 5},
+            {'latitude': 40.0, 'longitude': -84.2, 'sales': 1},
+        ]
+        result = self.client.post(self.url, {'points': points}, format='json').json()
+
+        areas = {area['name']: area for area in result['market_areas']}
+        near, far = areas['Near'], areas['Far']
+        self.assertEqual((near['name'], near['count'], near['sums']), ('Near', 2, {'sales': 15.0}))
+        self.assertEqual((far['name'], far['count']), ('Far', 0))
+        self.assertEqual([point['market_areas'] for point in result['points']],
+                         [[str(self.areas[0].id)], [str(self.areas[0].id)], []])
+        self.assertEqual(result['unmatched'], 1)
+
+    def test_non_object_points_are_rejected(self):
+        points = [{'latitude': 33.7, 'longitude': -84.4}, 'not a point']
+        response = self.client.post(self.url, {'points': points}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+
+
+class DerivedMetricsTests(SimpleTestCase):
+    def evaluate(self, *specs):
+        return CompiledFormulas(specs).evaluate(['Esri.TOTPOP_CY', 'Esri.POP65_CY', 'Esri.TOTPOP_FY'],
+                                                [[1000, 150, 1100], [0, 0, 0]])
+
+    def test_formulas_are_evaluated_per_area(self):
+        result = self.evaluate(
+            {'key': 'SHARE', 'type': 'share', 'numerator': 'POP65_CY', 'denominator': 'TOTPOP_CY'},
+            {'key': 'GROWTH', 'type': 'growth', 'start': 'TOTPOP_CY', 'end': 'TOTPOP_FY'},
+            {'key': 'EXPR', 'expression': '(Esri.POP65_CY + 50) / TOTPOP_CY * 100'},
+        )
+
+        self.assertEqual(result[0].round(6).tolist(), [15.0, 10.0, 20.0])
+        self.assertTrue(math.isnan(result[1][0]) and math.isnan(result[1][1]))
+
+    def test_constant_overflow_is_rejected_or_undefined(self):
+        for expression in ('10 ** 10 ** 10', 'TOTPOP_CY ** (10 ** 10)', '2 ** -1000', '9' * 400, '-' * 600 + '1'):
+            with self.subTest(expression=expression[:20]), self.assertRaises(FormulaError):
+                compile_formula({'key': 'BIG', 'expression': expression})
+
+        result = self.evaluate({'key': 'INF', 'expression': '1 / 0 + 1e300 * 1e300'})
+        self.assertTrue(math.isnan(result[0][0]))
+
+
+class LoadBaselineTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.enterContext(override_settings(BASELINE_DATA_DIR=os.path.join(self.directory, 'baseline')))
+
+    def write_csv(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_vintages_are_never_rewritten(self):
+        call_command('load_baseline', self.write_csv('2024.csv', 'geography,TOTPOP_CY\nUSA,"1,000"\n'),
+                     vintage='2024', stdout=io.StringIO())
+        store = get_baseline_store()
+
+        with self.assertRaises(CommandError):
+            call_command('load_baseline', self.write_csv('2025.csv', 'geography,TOTPOP_CY\nUSA,2000\n'),
+                         vintage='2024', stdout=io.StringIO())
+
+        self.assertEqual(store.lookup(['TOTPOP_CY']).tolist(), [1000.0])
+        self.assertIs(get_baseline_store(), store)
+
+    def test_legacy_csv_must_match_the_layout(self):
+        path = self.write_csv('usa.csv', 'USA\n\nUSA\n\n\n"1,000"\n500\n')
+
+        with self.assertRaises(CommandError):
+            call_command('load_baseline', path, vintage='short', stdout=io.StringIO())
+        self.assertIsNone(get_baseline_store())
+
+    def test_bundled_usa_data_loads_under_the_right_variables(self):
+        call_command('load_baseline', vintage='bundled', stdout=io.StringIO())
+
+        store = get_baseline_store()
+        expected = {
+            'AtRisk.TOTPOP_CY': 337363227,
+            'householdincome.MEDHINC_CY': 79010,
+            'KeyUSFacts.VACANT_FY': 14657583,
+            'HistoricalPopulation.TSPOP10_CY': 308162550,
+            'HistoricalHouseholds.TSHH10_CY': 116441641,
+            '5yearincrements.POP85C10': 5476655,
+            '5yearincrements.MEDAGE10': 37.1,
+            'householdsbysize.NF2PERS10': 6320574,
+            'tapestryhouseholdsNEW.THH01': 2081323,
+            'tapestryhouseholdsNEW.THH67': 634665,
+        }
+        self.assertEqual(store.lookup(list(expected)).tolist(), list(expected.values()))
+
+
+class OverlapTests(SimpleTestCase):
+    def market_areas(self):
+        # Half-overlapping squares in a row, so every neighbour pair shares half its area
+        return [
+            MarketArea(name=f'Area {i}', ma_type='radius',
+                       geometry={'rings': [square(-84.0 + 0.05 * i, 33.5, 0.1)], 'spatialReference': {'wkid': 4326}})
+            for i in range(12)
+        ]
+
+    def test_neighbours_share_half_their_area(self):
+        result = overlap.compute_overlap_matrix(self.market_areas())
+
+        self.assertEqual(len(result['overlaps']), 11)
+        self.assertAlmostEqual(result['matrix'][0][1], 50.0, places=1)
+        self.assertEqual(result['matrix'][0][2], 0.0)
+
+    def test_process_pool_does_not_fork(self):
+        with override_settings(MARKET_AREA_OVERLAP={'MAX_WORKERS': 2, 'PARALLEL_THRESHOLD': 1}):
+            self.addCleanup(overlap.get_process_pool().shutdown)
+            self.addCleanup(setattr, overlap, '_pool', None)
+            self.assertNotEqual(overlap.get_process_pool()._mp_context.get_start_method(), 'fork')
+
+            parallel = overlap.compute_overlap_matrix(self.market_areas())
+
+        self.assertEqual(parallel['matrix'], overlap.compute_overlap_matrix(self.market_areas())['matrix'])
+
+    def test_chunks_carry_only_their_areas(self):
+        prepared = [overlap.prepare_market_area(area) for area in self.market_areas()]
+        pairs = [(i, i + 1) for i in range(11)]
+
+        chunks = list(overlap._chunks(pairs, prepared, 4))
+
+        self.assertEqual([pair for chunk, _ in chunks for pair in chunk], pairs)
+        for chunk, rings in chunks:
+            self.assertEqual(set(rings), {index for pair in chunk for index in pair})
+        self.assertLessEqual(overlap.DEFAULT_SETTINGS['MAX_WORKERS'], 2)
+
+
+class VariablePresetTests(TestCase):
+    def test_non_string_variables_are_rejected(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='presets'))
+
+        for variables in ([{'id': 'AtRisk.TOTPOP_CY'}], ['AtRisk.TOTPOP_CY', ['AtRisk.TOTHH_CY']]):
+            with self.subTest(variables=variables):
+                response = client.post('/api/variable-presets/', {'name': 'Preset', 'variables': variables},
+                                       format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('variables', response.json())
+
+        response = client.post('/api/variable-presets/', {'name': 'Preset', 'variables': ['AtRisk.TOTPOP_CY']},
+                               format='json')
+        self.assertEqual(response.status_code, 201)
+
+
+class GlobalPresetListTests(TestCase):
+    styles = {'fillColor': '#FF0000', 'fillOpacity': 0.5, 'borderColor': '#000000', 'borderWidth': 1}
+
+    def setUp(self):
+        from django.core.cache import cache
+        from .catalog_cache import GLOBAL_STYLE_PRESETS, GLOBAL_VARIABLE_PRESETS
+        cache.clear()
+        for catalog in (GLOBAL_STYLE_PRESETS, GLOBAL_VARIABLE_PRESETS):
+            self.enterContext(mock.patch.object(catalog, '_entry', None))
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='global-presets'))
+
+    def names(self, url):
+        return [preset['name'] for preset in self.client.get(url).json()]
+
+    def test_writes_retire_the_cached_global_list(self):
+        cases = [
+            ('/api/style-presets/', StylePreset, {'styles': self.styles}),
+            ('/api/variable-presets/', VariablePreset, {'variables': ['AtRisk.TOTPOP_CY']}),
+        ]
+        for url, model, fields in cases:
+            with self.subTest(url=url):
+                self.assertEqual(self.names(url), [])
+
+                preset = model.objects.create(name='Created', is_global=True, **fields)
+                self.assertEqual(self.names(url), ['Created'])
+
+                response = self.client.patch(f'{url}{preset.id}/', {'name': 'Updated'}, format='json')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.names(url), ['Updated'])
+
+                self.assertEqual(self.client.delete(f'{url}{preset.id}/').status_code, 204)
+                self.assertEqual(self.names(url), [])
+
+    def test_make_global_adds_to_the_cached_list(self):
+        project = Project.objects.create(project_number='PRESET-1', client='Client', location='Atlanta')
+        preset = StylePreset.objects.create(name='Local', project=project, styles=self.styles)
+        self.assertEqual(self.names('/api/style-presets/'), [])
+
+        response = self.client.post(f'/api/style-presets/{preset.id}/make_global/?project={project.id}')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.names('/api/style-presets/'), ['Local'])
+
+    def test_merge_compares_timestamps_not_strings(self):
+        from .catalog_cache import merge_by_last_modified
+        project = [{'name': 'later', 'last_modified': '2026-01-01T00:00:00.500000Z'},
+                   {'name': 'offset', 'last_modified': '2026-01-01T01:00:00.250000+02:00'}]
+        global_presets = [{'name': 'earlier', 'last_modified': '2026-01-01T00:00:00Z'},
+                          {'name': 'undated', 'last_modified': None}]
+
+        merged = merge_by_last_modified(project, global_presets)
+
+        self.assertEqual([item['name'] for item in merged], ['later', 'earlier', 'offset', 'undated'])
+
+
+class VariableCatalogTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='catalog-search'))
+
+    def search(self, query, **params):
+        return self.client.get('/api/variables/search/', {'q': query, **params})
+
+    def test_prefix_search_matches_token_starts(self):
+        results = self.search('househ').json()['results']
+
+        self.assertTrue(results)
+        for result in results:
+            tokens = tokenize(f"{result['label']} {result['id']}") + [result['short_key'].lower()]
+            self.assertTrue(any(token.startswith('househ') for token in tokens), result)
+
+    def test_every_term_must_match_and_exact_keys_rank_first(self):
+        results = self.search('total households').json()['results']
+        self.assertIn('AtRisk.TOTHH_CY', [result['id'] for result in results])
+        for result in results:
+            tokens = tokenize(f"{result['label']} {result['id']}")
+            self.assertTrue(any(token.startswith('total') for token in tokens), result)
+            self.assertTrue(any(token.startswith('households') for token in tokens), result)
+
+        self.assertEqual(self.search('TOTPOP_CY').json()['results'][0]['id'], 'AtRisk.TOTPOP_CY')
+        self.assertEqual(self.search('total zzzz').json()['count'], 0)
+
+    def test_empty_queries_and_bad_limits(self):
+        for query in ('', '   '):
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query).status_code, 400)
+        self.assertEqual(self.search('!!!').json(), {'query': '!!!', 'count': 0, 'results': []})
+        self.assertEqual(self.search('total', limit='many').status_code, 400)
+        self.assertEqual(self.search('total', limit=2).json()['count'], 2)
+
+        retail = self.search('average', category='retail').json()['results']
+        self.assertTrue(retail)
+        self.assertEqual({result['category'] for result in retail}, {'retail'})
+
+    def test_categories_list_their_groups_and_variables(self):
+        categories = self.client.get('/api/variables/categories/').json()
+        self.assertEqual([category['key'] for category in categories], ['tier1', 'tier2', 'retail'])
+
+        for category in categories:
+            with self.subTest(category=category['key']):
+                detail = self.client.get(f"/api/variables/categories/{category['key']}/").json()
+                self.assertEqual(detail['count'], category['count'])
+                self.assertEqual(len(detail['variables']), category['count'])
+                self.assertEqual({variable['category'] for variable in detail['variables']}, {category['key']})
+
+        group = 'Current Year Population Base'
+        detail = self.client.get('/api/variables/categories/tier1/', {'group': group}).json()
+        self.assertIn(group, detail['groups'])
+        self.assertIn('AtRisk.TOTPOP_CY', [variable['id'] for variable in detail['variables']])
+        self.assertEqual({variable['group'] for variable in detail['variables']}, {group})
+        self.assertEqual(self.client.get('/api/variables/categories/nope/').status_code, 404)
+
+
+def plain(value):
+    """Parsed upload with ring arrays turned back into lists, for comparing with json.loads()."""
+    if isinstance(value, dict):
+        return {key: plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain(item) for item in value]
+    return value.tolist() if hasattr(value, 'tolist') else value
+
+
+class UploadScannerTests(SimpleTestCase):
+    bodies = [
+        {
+            'name': 'Rings "[[1, 2]]" in a string \\ with escapes é',
+            'ma_type': 'custom',
+            'geometry': {
+                'rings': [square(-84.4, 33.7, 0.1, steps=3), [[1e-3, -2.5E2], [3, 4], [5, 6], [1e-3, -2.5E2]]],
+                'spatialReference': {'wkid': 4326},
+            },
+            'style_settings': {'rings': [[1, 2]], 'colors': [[0, 0, 0], []]},
+        },
+        {
+            'name': 'GeoJSON',
+            'geometry': {
+                'type': 'MultiPolygon',
+                'coordinates': [[square(0, 0, 1)], [square(5, 5, 1), square(5.2, 5.2, 0.1)]],
+            },
+            'locations': [{'geometry': {'x': 1, 'y': 2}}],
+        },
+        {'name': 'No geometry', 'geometry': None, 'drive_time_points': [[1, [2, 3]], {}]},
+        {'name': 'Point', 'geometry': {'x': -84.4, 'y': 33.7, 'spatialReference': {'wkid': 4326}}},
+    ]
+
+    def scan(self, body, chunk_size):
+        scanner = MarketAreaBodyScanner(get_upload_limits())
+        for start in range(0, len(body), chunk_size):
+            scanner.feed(body[start:start + chunk_size])
+        scanner.feed(b'', final=True)
+        return scanner.result()
+
+    def test_chunked_scan_matches_json_loads(self):
+        for data in self.bodies:
+            for body in (json.dumps(data).encode(), json.dumps(data, indent=2, ensure_ascii=False).encode()):
+                for chunk_size in (1, 3, 17, len(body)):
+                    with self.subTest(name=data['name'], chunk_size=chunk_size):
+                        self.assertEqual(plain(self.scan(body, chunk_size)), json.loads(body))
+
+    def test_truncated_and_malformed_bodies_are_rejected(self):
+        body = json.dumps(self.bodies[0]).encode()
+        for broken in (body[:len(body) // 2], body.replace(b'33.7', b'33..7', 1), body.replace(b'], [', b'] [', 1)):
+            for chunk_size in (1, 64, len(broken)):
+                with self.subTest(chunk_size=chunk_size), self.assertRaises(ParseError):
+                    self.scan(broken, chunk_size)
+
+
+class MarketAreaListTests(TestCase):
+    def test_values_list_output_matches_the_serializer(self):
+        project = Project.objects.create(project_number='LIST-1', client='Client', location='Atlanta')
+        geometry = {'rings': [square(-84.4, 33.7, 0.1)], 'spatialReference': {'wkid': 4326}}
+        MarketArea.objects.create(
+            project=project, name='Área "one"', short_name='A1', ma_type='radius', geometry=geometry,
+            style_settings={'fillColor': '#ff0000', 'fillOpacity': 0.35}, radius_points=[{'radii': [1, 3]}],
+            order=1, **geometry_metrics(geometry),
+        )
+        MarketArea.objects.create(project=project, name='Empty', ma_type='custom', geometry=None, locations=[], order=2)
+        queryset = MarketArea.objects.filter(project=project).order_by('order')
+
+        streamed = b''.join(iter_market_area_json(queryset, project.project_number, chunk_size=1))
+        serialized = FastJSONRenderer().render(MarketAreaSerializer(queryset, many=True).data)
+
+        self.assertEqual(json.loads(streamed), json.loads(serialized))
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='list'))
+        self.assertEqual(client.get(f'/api/projects/{project.id}/market-areas/').json(), json.loads(serialized))
+
+
+class GeometryNormalizationTests(TestCase):
+    def test_rings_are_cleaned_closed_and_wound(self):
+        esri = normalize_geometry({
+            'rings': [[[0, 0], [1, 0], [1, 0], [1, 1], [0.1234567891, 1]], [[5, 5], [5, 5]]],
+            'spatialReference': {'wkid': 4326},
+        })
+        self.assertEqual(esri['rings'], [[[0, 0], [0.123457, 1], [1, 1], [1, 0], [0, 0]]])
+
+        geojson = normalize_geometry({'type': 'Polygon', 'coordinates': [
+            [[0, 0], [0, 1], [1, 1], [1, 0], [0, 0]],
+            [[0.2, 0.2], [0.8, 0.2], [0.8, 0.8], [0.2, 0.8]],
+        ]})
+        shell, hole = geojson['coordinates']
+        self.assertGreater(ring_signed_area(np.array(shell)), 0)
+        self.assertLess(ring_signed_area(np.array(hole)), 0)
+        self.assertEqual(hole[0], hole[-1])
+
+        point = {'x': 1, 'y': 2}
+        self.assertEqual(normalize_geometry(point), point)
+
+    def test_writes_store_normalized_geometry_and_metrics(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='geometry'))
+        project = Project.objects.create(project_number='GEO-1', client='Client', location='Atlanta')
+        ring = square(-84.4, 33.7, 0.1)[::-1][:-1]
+
+        response = client.post(f'/api/projects/{project.id}/market-areas/', {
+            'name': 'Area', 'ma_type': 'radius',
+            'geometry': {'rings': [ring], 'spatialReference': {'wkid': 4326}},
+        }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        area = MarketArea.objects.get(project=project)
+        self.assertEqual(area.geometry['rings'][0][0], area.geometry['rings'][0][-1])
+        self.assertLess(ring_signed_area(np.array(area.geometry['rings'][0])), 0)
+        self.assertEqual((area.bbox_xmin, area.bbox_ymax), (-84.4, 33.8))
+        self.assertAlmostEqual(area.centroid_x, -84.35, places=6)
+        self.assertEqual(area.vertex_count, len(area.geometry['rings'][0]))
+
+    def test_backfill_fills_metrics_of_older_rows(self):
+        from importlib import import_module
+        from django.apps import apps
+        backfill = import_module('api.migrations.0011_backfill_geometry_metrics').backfill_geometry_metrics
+        project = Project.objects.create(project_number='GEO-2', client='Client', location='Atlanta')
+        geometry = {'rings': [square(-84.4, 33.7, 0.1)], 'spatialReference': {'wkid': 4326}}
+        area = MarketArea.objects.create(project=project, name='Old', ma_type='radius', geometry=geometry)
+        empty = MarketArea.objects.create(project=project, name='Empty', ma_type='custom', geometry=None)
+        saved = area.last_modified
+
+        backfill(apps, None)
+
+        area.refresh_from_db()
+        expected = geometry_metrics(geometry)
+        self.assertEqual({field: getattr(area, field) for field in expected}, expected)
+        self.assertGreater(area.last_modified, saved)
+        self.assertEqual(MarketArea.objects.get(id=empty.id).vertex_count, 0)
+
+    def test_refresh_moves_tile_and_overlap_versions(self):
+        from .vector_tiles import project_tile_version
+        project = Project.objects.create(project_number='GEO-3', client='Client', location='Atlanta')
+        geometry = {'rings': [square(-84.4, 33.7, 0.1)[::-1]], 'spatialReference': {'wkid': 4326}}
+        MarketArea.objects.create(project=project, name='Area', ma_type='radius', geometry=geometry)
+        queryset = MarketArea.objects.filter(project=project)
+        tile_version = project_tile_version(queryset)
+        overlap_key = overlap.overlap_cache_key(project.id, queryset.values_list('id', 'last_modified'))
+
+        call_command('refresh_geometry_metrics', project=str(project.id), stdout=io.StringIO())
+
+        self.assertNotEqual(project_tile_version(queryset), tile_version)
+        self.assertNotEqual(overlap.overlap_cache_key(project.id, queryset.values_list('id', 'last_modified')),
+                            overlap_key)
+        self.assertIsNotNone(queryset.get().bbox_xmin)
+
+
+class ProjectExtentTests(TestCase):
+    missing = '/api/projects/00000000-0000-0000-0000-000000000000/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='extent'))
+        self.project = Project.objects.create(project_number='EXT-1', client='Client', location='Atlanta')
+        self.url = f'/api/projects/{self.project.id}/'
+        self.areas = []
+        for name, x, y in (('West', -84.5, 33.7), ('East', -84.2, 33.9)):
+            geometry = {'rings': [square(x, y, 0.1)], 'spatialReference': {'wkid': 4326}}
+            self.areas.append(MarketArea.objects.create(project=self.project, name=name, ma_type='radius',
+                                                        geometry=geometry, **geometry_metrics(geometry)))
+
+    def test_extent_covers_every_market_area(self):
+        extent = self.client.get(f'{self.url}extent/').json()['extent']
+        self.assertEqual([round(extent[key], 9) for key in ('xmin', 'ymin', 'xmax', 'ymax')],
+                         [-84.5, 33.7, -84.1, 34.0])
+        self.assertEqual(extent['spatialReference'], {'wkid': 4326})
+
+        mercator = self.client.get(f'{self.url}extent/?wkid=102100').json()['extent']
+        self.assertAlmostEqual(mercator['xmin'], -84.5 * 20037508.342789244 / 180, places=3)
+        self.assertEqual(mercator['spatialReference'], {'wkid': 102100})
+
+        empty = Project.objects.create(project_number='EXT-2', client='Client', location='Atlanta')
+        self.assertEqual(self.client.get(f'/api/projects/{empty.id}/extent/').json(), {'extent': None})
+        self.assertEqual(self.client.get(f'{self.missing}extent/').status_code, 404)
+        self.assertEqual(self.client.get(f'{self.url}extent/?wkid=web').status_code, 400)
+
+    def test_in_view_lists_intersecting_market_areas(self):
+        west, east = (str(area.id) for area in self.areas)
+        in_view = lambda query: self.client.get(f'{self.url}in-view/?{query}')
+
+        self.assertEqual(in_view('bbox=-84.6,33.6,-84.45,33.75').json(), {'market_areas': [west]})
+        self.assertEqual(sorted(in_view('bbox=-85,33,-84,35').json()['market_areas']), sorted([west, east]))
+        self.assertEqual(in_view('bbox=-80,30,-79,31').json(), {'market_areas': []})
+        xs, ys = (-84.15 * 20037508.342789244 / 180, -84.12 * 20037508.342789244 / 180), (4000000, 4040000)
+        query = f'bbox={xs[0]},{ys[0]},{xs[1]},{ys[1]}&wkid=102100'
+        self.assertEqual(in_view(query).json(), {'market_areas': [east]})
+
+        self.assertEqual(in_view('bbox=1,2,3').status_code, 400)
+        self.assertEqual(self.client.get(f'{self.missing}in-view/?bbox=-85,33,-84,35').status_code, 404)
+
+
+class ProjectCloneTests(TestCase):
+    def test_clone_copies_related_rows_and_remaps_ids(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='clone'))
+        source = Project.objects.create(project_number='CLONE-1', client='Client', location='Atlanta')
+        geometry = {'rings': [square(-84.4, 33.7, 0.1)], 'spatialReference': {'wkid': 4326}}
+        area = MarketArea.objects.create(project=source, name='Area', ma_type='radius', geometry=geometry,
+                                         **geometry_metrics(geometry))
+        configuration = MapConfiguration.objects.create(
+            project=source, tab_name='Tab', visualization_type='income', area_type='radius',
+            layer_configuration={'visibleAreas': [str(area.id)]},
+        )
+        LabelPosition.objects.create(project=source, map_configuration=configuration, label_id=f'id-{area.id}',
+                                     x_offset=3, y_offset=4, font_size=12)
+
+        response = client.post(f'/api/projects/{source.id}/clone/', {'project_number': 'CLONE-2'}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['copied']['market_areas'], 1)
+        target = Project.objects.get(id=response.json()['id'])
+        copy = MarketArea.objects.get(project=target)
+        self.assertNotEqual(copy.id, area.id)
+        self.assertEqual((copy.name, copy.geometry, copy.area), (area.name, area.geometry, area.area))
+        copied_configuration = MapConfiguration.objects.get(project=target)
+        self.assertEqual(copied_configuration.layer_configuration, {'visibleAreas': [str(copy.id)]})
+        label = LabelPosition.objects.get(project=target)
+        self.assertEqual((label.label_id, label.map_configuration_id, label.x_offset),
+                         (f'id-{copy.id}', copied_configuration.id, 3))
+        # The source is left alone
+        self.assertEqual(LabelPosition.objects.get(project=source).label_id, f'id-{area.id}')
+        self.assertEqual(MapConfiguration.objects.get(project=source).layer_configuration,
+                         {'visibleAreas': [str(area.id)]})
+
+
+class ProjectThumbnailTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(PROJECT_THUMBNAIL_DIR=directory.name))
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='thumbnails'))
+        self.project = Project.objects.create(project_number='THUMB-1', client='Client', location='Atlanta')
+        geometry = {'rings': [square(-84.4, 33.7, 0.1)], 'spatialReference': {'wkid': 4326}}
+        self.area = MarketArea.objects.create(project=self.project, name='Area', ma_type='radius',
+                                              geometry=geometry, style_settings={'fillColor': '#ff0000'})
+        self.url = f'/api/projects/{self.project.id}/thumbnail.png'
+
+    def test_thumbnail_is_drawn_and_revalidated(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content[:8], b'\x89PNG\r\n\x1a\n')
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        missing = self.client.get('/api/projects/00000000-0000-0000-0000-000000000000/thumbnail.png')
+        self.assertEqual(missing.status_code, 404)
+
+    def test_only_an_up_to_date_version_is_immutable(self):
+        from . import thumbnails
+        thumbnails.regenerate_thumbnail(self.project.id)
+        version = thumbnails.thumbnail_version(self.project.id)
+        url = f'{self.url}?v={version}'
+        self.assertIn('immutable', self.client.get(url)['Cache-Control'])
+
+        # Saved after the file was drawn; its redraw hasn't run yet
+        self.area.save()
+        self.assertEqual(self.client.get(url)['Cache-Control'], 'private, no-cache')
+
+        thumbnails.regenerate_thumbnail(self.project.id)
+        version = thumbnails.thumbnail_version(self.project.id)
+        self.assertIn('immutable', self.client.get(f'{self.url}?v={version}')['Cache-Control'])
+
+        with mock.patch.object(thumbnails, '_outdated', {self.project.id}):
+            self.assertEqual(self.client.get(f'{self.url}?v={version}')['Cache-Control'], 'private, no-cache')
+
+    def test_background_failures_are_logged(self):
+        from . import thumbnails
+        self.enterContext(override_settings(PROJECT_THUMBNAILS={'BACKGROUND': True}))
+        self.enterContext(mock.patch.object(thumbnails, 'regenerate_thumbnail', side_effect=RuntimeError('boom')))
+
+        with self.assertLogs('api.thumbnails', 'ERROR') as logs:
+            thumbnails.schedule_thumbnail(self.project.id)
+            thumbnails._executor.submit(lambda: None).result()
+
+        self.assertIn(str(self.project.id), logs.output[0])
+        self.assertIn(self.project.id, thumbnails._outdated)
+        thumbnails._outdated.discard(self.project.id)
+
+
+class CompressionTests(TestCase):
+    def test_negotiation_honours_quality_values(self):
+        factory = RequestFactory()
+        for header, expected in (
+            ('', None), ('gzip', 'gzip'), ('gzip;q=0', None), ('identity', None),
+            ('*', available_encodings()[0]), ('deflate, gzip;q=0.5', 'gzip'),
+        ):
+            with self.subTest(header=header):
+                self.assertEqual(negotiate(factory.get('/', HTTP_ACCEPT_ENCODING=header)), expected)
+
+    def test_json_responses_are_compressed_when_accepted(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='gzip'))
+        project = Project.objects.create(project_number='GZIP-1', client='Client', location='Atlanta')
+        geometry = {'rings': [square(-84.4, 33.7, 0.1, steps=20)], 'spatialReference': {'wkid': 4326}}
+        MarketArea.objects.create(project=project, name='Area', ma_type='radius', geometry=geometry)
+        url = f'/api/projects/{project.id}/market-areas/'
+
+        plain = client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', plain)
+        # Both are cache hits: the first stores a gzip copy with the cached body, the second serves it
+        for _ in range(2):
+            response = client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertIn('Accept-Encoding', response['Vary'])
+            self.assertEqual(json.loads(gzip.decompress(response.content)), json.loads(plain.content))
+
+    def test_per_request_gzip_is_padded_against_breach(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='breach'))
+        plain = client.get('/api/variables/search/?q=total&limit=200').content
+
+        lengths = set()
+        for _ in range(10):
+            response = client.get('/api/variables/search/?q=total&limit=200', HTTP_ACCEPT_ENCODING='br, gzip')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertTrue(response.content[3] & gzip.FNAME)
+            self.assertEqual(gzip.decompress(response.content), plain)
+            lengths.add(len(response.content))
+        self.assertGreater(len(lengths), 1)
+
+        chunks = [b'{"token": "secret"}' * 50, b'', b'[1, 2, 3]' * 100]
+        streamed = list(compress_stream(iter(chunks), 'gzip'))
+        self.assertTrue(streamed[0][3] & gzip.FNAME)
+        self.assertEqual(gzip.decompress(b''.join(streamed)), b''.join(chunks))
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(username='async')
+        self.sync_client = APIClient()
+        self.sync_client.force_authenticate(user)
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+        self.project = Project.objects.create(project_number='ASYNC-1', client='Client', location='Atlanta')
+        geometry = {'rings': [square(-84.4, 33.7, 0.1)], 'spatialReference': {'wkid': 4326}}
+        MarketArea.objects.create(project=self.project, name='Area', ma_type='radius', geometry=geometry, order=1)
+        MarketArea.objects.create(project=self.project, name='Other', ma_type='custom', order=2)
+        configuration = MapConfiguration.objects.create(
+            project=self.project, tab_name='Tab', visualization_type='income', area_type='radius',
+        )
+        LabelPosition.objects.create(project=self.project, map_configuration=configuration, label_id='id-1',
+                                     x_offset=1, y_offset=2, font_size=10)
+
+    async def test_responses_match_the_sync_endpoints(self):
+        project_id = self.project.id
+        for path in (
+            f'projects/{project_id}/',
+            f'projects/{project_id}/market-areas/',
+            f'map-configurations/?project={project_id}',
+            f'label-positions/?project={project_id}',
+        ):
+            with self.subTest(path=path):
+                expected = (await sync_to_async(self.sync_client.get)(f'/api/{path}')).json()
+                response = await self.async_client.get(f'/api/async/{path}', headers=self.headers)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(json.loads(b''.join([chunk async for chunk in response])
+                                            if response.streaming else response.content), expected)
+
+    async def test_sync_and_async_share_cached_responses(self):
+        url = f'projects/{self.project.id}/market-areas/'
+        get = sync_to_async(self.sync_client.get)
+        self.assertEqual((await get(f'/api/{url}'))['X-Cache'], 'MISS')
+
+        response = await self.async_client.get(f'/api/async/{url}', headers=self.headers)
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+        area = await MarketArea.objects.aget(project=self.project, name='Area')
+        patch = sync_to_async(self.sync_client.patch)
+        self.assertEqual((await patch(f'/api/{url}{area.id}/', {'name': 'Renamed'}, format='json')).status_code, 200)
+
+        response = await self.async_client.get(f'/api/async/{url}', headers=self.headers)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        body = b''.join([chunk async for chunk in response]) if response.streaming else response.content
+        self.assertIn('Renamed', [item['name'] for item in json.loads(body)])
+        self.assertEqual((await get(f'/api/{url}'))['X-Cache'], 'HIT')
+
+    async def test_requests_need_a_token_and_an_allowed_method(self):
+        url = f'/api/async/projects/{self.project.id}/'
+
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('WWW-Authenticate', response)
+
+        response = await self.async_client.post(url, headers=self.headers)
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response['Allow'], 'GET')
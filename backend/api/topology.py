@@ -0,0 +1,218 @@
+"""
+TopoJSON encoding of market area geometries.
+
+Coordinates are quantized to integers at the precision geometries are stored
+with (see geometry.normalize_geometry), rings are cut into arcs at junctions
+so borders shared by adjacent areas are sent once, and arcs are
+delta-encoded. decode_topology reverses it, so the round trip is lossless at
+the chosen precision.
+"""
+import math
+
+from .geometry import coordinate_decimals, get_rings, get_wkid
+
+
+OBJECT_NAME = 'market_areas'
+
+
+def _quantize_ring(ring, translate, scale):
+    tx, ty = translate
+    points = []
+    for point in ring:
+        q = (round((point[0] - tx) / scale), round((point[1] - ty) / scale))
+        if not points or points[-1] != q:
+            points.append(q)
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    return points
+
+
+def _polygon_parts(geometry):
+    """(topology type, list of polygons as lists of rings) for a polygon geometry."""
+    if 'rings' in geometry:
+        return 'Polygon', [get_rings(geometry)]
+    if geometry.get('type') == 'Polygon':
+        return 'Polygon', [geometry.get('coordinates', [])]
+    if geometry.get('type') == 'MultiPolygon':
+        return 'MultiPolygon', geometry.get('coordinates', [])
+    return None, []
+
+
+def _rotate_to_min(points):
+    start = points.index(min(points))
+    return points[start:] + points[:start]
+
+
+class _ArcBuilder:
+    def __init__(self):
+        self.arcs = []
+        self.index = {}
+
+    def add(self, points):
+        """Index of the arc for `points`, reusing an existing arc (or its reverse)."""
+        key = tuple(points)
+        if key in self.index:
+            return self.index[key]
+        reverse = tuple(reversed(points))
+        if reverse in self.index:
+            return ~self.index[reverse]
+        self.index[key] = len(self.arcs)
+        self.arcs.append(points)
+        return self.index[key]
+
+    def add_closed(self, points):
+        """Junction-free ring: compare rotation-independent forms."""
+        forward = _rotate_to_min(points)
+        backward = _rotate_to_min(list(reversed(points)))
+        key = tuple(forward + forward[:1])
+        if key in self.index:
+            return self.index[key]
+        reverse_key = tuple(backward + backward[:1])
+        if reverse_key in self.index:
+            return ~self.index[reverse_key]
+        return self.add(list(key))
+
+
+def encode_topology(items, precision=None):
+    """
+    Build a TopoJSON Topology from serialized market areas. Each item's
+    polygon geometry becomes a Polygon/MultiPolygon referencing shared arcs;
+    all other fields (and non-polygon geometries) are kept as properties.
+    """
+    polygon_items = []
+    all_x, all_y = [], []
+    decimals = precision
+    for item in items:
+        geometry = item.get('geometry')
+        kind, polygons = _polygon_parts(geometry) if isinstance(geometry, dict) else (None, [])
+        polygons = [[ring for ring in polygon if ring] for polygon in polygons]
+        polygons = [polygon for polygon in polygons if polygon]
+        polygon_items.append((kind if polygons else None, polygons))
+        if polygons:
+            if precision is None:
+                decimals = max(decimals or 0, coordinate_decimals(get_wkid(geometry)))
+            for polygon in polygons:
+                for ring in polygon:
+                    all_x.extend(point[0] for point in ring)
+                    all_y.extend(point[1] for point in ring)
+
+    decimals = 6 if decimals is None else decimals
+    scale = 10 ** -decimals
+    translate = (round(min(all_x), decimals), round(min(all_y), decimals)) if all_x else (0, 0)
+
+    quantized = []
+    neighbours = {}
+    for kind, polygons in polygon_items:
+        parts = []
+        for polygon in polygons:
+            rings = []
+            for ring in polygon:
+                points = _quantize_ring(ring, translate, scale)
+                if len(points) < 3:
+                    continue
+                for i, point in enumerate(points):
+                    linked = neighbours.setdefault(point, set())
+                    linked.add(points[i - 1])
+                    linked.add(points[(i + 1) % len(points)])
+                rings.append(points)
+            if rings:
+                parts.append(rings)
+        quantized.append(parts)
+
+    # A vertex where more than two distinct neighbours meet is a junction
+    junctions = {point for point, linked in neighbours.items() if len(linked) > 2}
+
+    builder = _ArcBuilder()
+    geometries = []
+    for item, (kind, _), parts in zip(items, polygon_items, quantized):
+        properties = {key: value for key, value in item.items() if key != 'geometry'}
+        if not parts:
+            if item.get('geometry') is not None:
+                properties['geometry'] = item['geometry']
+            geometries.append({'type': None, 'id': item.get('id'), 'properties': properties})
+            continue
+
+        if 'rings' in item['geometry']:
+            properties['spatialReference'] = item['geometry'].get('spatialReference')
+        arc_parts = []
+        for rings in parts:
+            arc_rings = []
+            for points in rings:
+                cuts = [i for i, point in enumerate(points) if point in junctions]
+                if not cuts:
+                    arc_rings.append([builder.add_closed(points)])
+                    continue
+                rotated = points[cuts[0]:] + points[:cuts[0]]
+                cuts = [i - cuts[0] for i in cuts] + [len(points)]
+                rotated.append(rotated[0])
+                arc_rings.append([
+                    builder.add(rotated[start:end + 1])
+                    for start, end in zip(cuts[:-1], cuts[1:])
+                ])
+            arc_parts.append(arc_rings)
+
+        geometries.append({
+            'type': kind,
+            'id': item.get('id'),
+            'arcs': arc_parts[0] if kind == 'Polygon' else arc_parts,
+            'properties': properties,
+        })
+
+    arcs = []
+    for points in builder.arcs:
+        encoded = [list(points[0])]
+        for (x0, y0), (x1, y1) in zip(points, points[1:]):
+            encoded.append([x1 - x0, y1 - y0])
+        arcs.append(encoded)
+
+    return {
+        'type': 'Topology',
+        'transform': {'scale': [scale, scale], 'translate': list(translate)},
+        'objects': {OBJECT_NAME: {'type': 'GeometryCollection', 'geometries': geometries}},
+        'arcs': arcs,
+    }
+
+
+def decode_topology(topology):
+    """Inverse of encode_topology: items with Esri JSON (or GeoJSON) geometry restored."""
+    scale_x, scale_y = topology['transform']['scale']
+    tx, ty = topology['transform']['translate']
+    decimals = max(0, round(-math.log10(scale_x)))
+
+    decoded_arcs = []
+    for arc in topology['arcs']:
+        x = y = 0
+        points = []
+        for dx, dy in arc:
+            x += dx
+            y += dy
+            points.append([round(tx + x * scale_x, decimals), round(ty + y * scale_y, decimals)])
+        decoded_arcs.append(points)
+
+    def ring_from_arcs(indexes):
+        ring = []
+        for index in indexes:
+            points = decoded_arcs[index] if index >= 0 else decoded_arcs[~index][::-1]
+            ring.extend(points if not ring else points[1:])
+        return ring
+
+    items = []
+    for geometry in topology['objects'][OBJECT_NAME]['geometries']:
+        item = dict(geometry['properties'])
+        esri = 'spatialReference' in item
+        spatial_reference = item.pop('spatialReference', None)
+        if geometry['type'] == 'Polygon':
+            rings = [ring_from_arcs(indexes) for indexes in geometry['arcs']]
+            if esri:
+                item['geometry'] = {'rings': rings, 'spatialReference': spatial_reference}
+            else:
+                item['geometry'] = {'type': 'Polygon', 'coordinates': rings}
+        elif geometry['type'] == 'MultiPolygon':
+            item['geometry'] = {
+                'type': 'MultiPolygon',
+                'coordinates': [[ring_from_arcs(indexes) for indexes in polygon] for polygon in geometry['arcs']],
+            }
+        else:
+            item.setdefault('geometry', None)
+        items.append(item)
+    return items
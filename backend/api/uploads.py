@@ -0,0 +1,282 @@
+"""
+Streaming parser for market area bodies with large geometries.
+
+The body is read in chunks and scanned as it arrives. Polygon rings inside
+`geometry` ('rings' for Esri JSON, 'coordinates' for GeoJSON) are cut out
+of the text as soon as each one is complete, checked for structure and
+parsed straight into float arrays; only the rest of the document (a few
+KB of properties) is kept as text and decoded at the end. The raw body
+and a tree of Python floats for every vertex are therefore never held at
+the same time, and body size, ring and vertex limits are enforced while
+reading, before the rest of an oversized upload is read at all.
+
+Limits come from MARKET_AREA_UPLOAD_LIMITS.
+"""
+import json
+import re
+import warnings
+
+import numpy as np
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.parsers import BaseParser
+
+from .parsers import FastJSONParser, orjson
+from .renderers import FastJSONRenderer
+
+
+DEFAULT_SETTINGS = {
+    'MAX_BODY_BYTES': 64 * 1024 * 1024,
+    'MAX_VERTICES': 1_000_000,
+    'MAX_RINGS': 50_000,
+    'CHUNK_SIZE': 256 * 1024,
+}
+
+RING_KEYS = (b'rings', b'coordinates')
+POLYGON_TYPES = ('Polygon', 'MultiPolygon')
+RING_PLACEHOLDER = '$ring'
+
+STRUCTURAL = re.compile(rb'["\[\]{}:,]')
+STRING_END = re.compile(rb'["\\]')
+RING_START = re.compile(rb'\[\s*\[\s*[-+.\d]')
+RING_PREFIX = re.compile(rb'\[\s*(?:\[\s*)?')
+RING_END = re.compile(rb'\]\s*\]')
+NESTED = re.compile(rb'\[\s*\[|\]\s*\]')
+# Everything a ring of numeric [x, y(, z, m)] pairs may contain
+RING_BYTES = b'0123456789+-.eE,[] \t\r\n'
+TO_SPACES = bytes.maketrans(b'[],\t\r\n', b'      ')
+
+
+def get_upload_limits():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'MARKET_AREA_UPLOAD_LIMITS', {})}
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Upload exceeds the configured limits.'
+    default_code = 'upload_too_large'
+
+
+class ParsedGeometry(dict):
+    """Geometry whose rings were parsed into arrays; its structure is already validated."""
+
+
+def parse_ring(segment):
+    """
+    Parse the text of one ring ('[[x, y], [x, y], ...]') into an (n, 2)
+    float array, checking that it is a flat list of numeric vertices with
+    two to four values each. z and m values are dropped, as
+    normalize_geometry does.
+    """
+    if segment.translate(None, RING_BYTES):
+        raise ParseError('JSON parse error - geometry rings must contain only numeric coordinates')
+    if NESTED.search(segment, 1, len(segment) - 1):
+        raise ParseError('JSON parse error - geometry rings must be lists of [x, y] coordinates')
+
+    raw = np.frombuffer(segment, dtype=np.uint8)
+    opens = np.flatnonzero(raw == ord('['))[1:]
+    closes = np.flatnonzero(raw == ord(']'))[:-1]
+    if len(opens) == 0 or len(opens) != len(closes) or (closes < opens).any() or (opens[1:] < closes[:-1]).any():
+        raise ParseError('JSON parse error - unbalanced brackets in geometry ring')
+
+    commas = np.flatnonzero(raw == ord(','))
+    per_vertex = np.searchsorted(commas, closes) - np.searchsorted(commas, opens) + 1
+    if (per_vertex < 2).any() or (per_vertex > 4).any():
+        raise ParseError('JSON parse error - coordinates must have two to four values')
+    # Exactly one comma between consecutive vertices
+    if len(commas) != per_vertex.sum() - 1:
+        raise ParseError('JSON parse error - misplaced comma in geometry ring')
+
+    with warnings.catch_warnings():
+        # Malformed numbers end the read early; the length check below catches it
+        warnings.simplefilter('ignore', DeprecationWarning)
+        try:
+            values = np.fromstring(segment.translate(TO_SPACES), dtype=float, sep=' ')
+        except ValueError:
+            values = np.empty(0)
+    if len(values) != per_vertex.sum():
+        raise ParseError('JSON parse error - invalid number in geometry ring')
+
+    starts = np.concatenate([[0], np.cumsum(per_vertex)[:-1]])
+    return np.column_stack([values[starts], values[starts + 1]])
+
+
+class MarketAreaBodyScanner:
+    """
+    Incremental scanner fed with body chunks. Everything except polygon
+    rings is copied into `skeleton`; each ring is replaced there by a
+    {"$ring": index} placeholder and parsed into `rings`.
+    """
+
+    def __init__(self, limits):
+        self.limits = limits
+        self.buffer = bytearray()
+        self.skeleton = bytearray()
+        self.rings = []
+        self.vertices = 0
+        self.received = 0
+        # One [kind, key] entry per open container; key is the last object key read
+        self.stack = []
+        self.last_string = None
+        self.ring_search_from = None
+
+    def feed(self, chunk, final=False):
+        self.received += len(chunk)
+        if self.received > self.limits['MAX_BODY_BYTES']:
+            raise UploadTooLarge(f"Request body exceeds {self.limits['MAX_BODY_BYTES']} bytes")
+        self.buffer += chunk
+        position = self._scan(final)
+        del self.buffer[:position]
+        if self.ring_search_from is not None:
+            self.ring_search_from -= position
+
+    def _in_ring_array(self):
+        # geometry object > rings/coordinates value > (polygon arrays) > ring
+        return (
+            len(self.stack) >= 3 and self.stack[-1][0] == 'array'
+            and self.stack[0][1] == b'geometry' and self.stack[1][0] == 'object'
+            and self.stack[1][1] in RING_KEYS
+        )
+
+    def _scan(self, final):
+        buffer = self.buffer
+        position = 0
+        while True:
+            if self.ring_search_from is not None:
+                match = RING_END.search(buffer, self.ring_search_from)
+                if match is None:
+                    # A ']' at the very end may still be followed by the closing one
+                    self.ring_search_from = max(position, buffer.rfind(b']'))
+                    return position
+                self._add_ring(bytes(buffer[position:match.end()]))
+                self.ring_search_from = None
+                position = match.end()
+                continue
+
+            match = STRUCTURAL.search(buffer, position)
+            if match is None:
+                self.skeleton += buffer[position:]
+                return len(buffer)
+            start = match.start()
+            self.skeleton += buffer[position:start]
+            char = buffer[start:start + 1]
+
+            if char == b'"':
+                end = self._string_end(start)
+                if end is None:
+                    return start
+                self.last_string = bytes(buffer[start + 1:end - 1])
+                self.skeleton += buffer[start:end]
+                position = end
+            elif char == b'[':
+                if self._in_ring_array() and RING_START.match(buffer, start):
+                    self.ring_search_from = start + 1
+                    position = start
+                    continue
+                if self._in_ring_array() and not final and RING_PREFIX.fullmatch(buffer, start):
+                    return start  # too little data yet to tell a ring from a nested array
+                self.stack.append(['array', None])
+                self.skeleton += char
+                position = start + 1
+            elif char == b'{':
+                self.stack.append(['object', None])
+                self.skeleton += char
+                position = start + 1
+            elif char in (b']', b'}'):
+                if not self.stack or self.stack[-1][0] != ('array' if char == b']' else 'object'):
+                    raise ParseError('JSON parse error - unbalanced brackets')
+                self.stack.pop()
+                self.skeleton += char
+                position = start + 1
+            else:
+                if char == b':' and self.stack and self.stack[-1][0] == 'object':
+                    self.stack[-1][1] = self.last_string
+                self.skeleton += char
+                position = start + 1
+
+    def _string_end(self, start):
+        position = start + 1
+        while True:
+            match = STRING_END.search(self.buffer, position)
+            if match is None:
+                return None
+            if match.group() == b'"':
+                return match.end()
+            position = match.end() + 1
+            if position >= len(self.buffer):
+                return None
+
+    def _add_ring(self, segment):
+        ring = parse_ring(segment)
+        self.vertices += len(ring)
+        if len(self.rings) >= self.limits['MAX_RINGS']:
+            raise UploadTooLarge(f"Geometry has more than {self.limits['MAX_RINGS']} rings")
+        if self.vertices > self.limits['MAX_VERTICES']:
+            raise UploadTooLarge(f"Geometry has more than {self.limits['MAX_VERTICES']} vertices")
+        self.skeleton += b'{"%s":%d}' % (RING_PLACEHOLDER.encode(), len(self.rings))
+        self.rings.append(ring)
+
+    def result(self):
+        if self.ring_search_from is not None or self.stack or self.buffer:
+            raise ParseError('JSON parse error - unexpected end of body')
+        try:
+            data = orjson.loads(self.skeleton) if orjson is not None else json.loads(self.skeleton)
+        except ValueError as e:
+            raise ParseError(f'JSON parse error - {e}')
+        if self.rings and isinstance(data, dict) and isinstance(data.get('geometry'), dict):
+            data['geometry'] = self._restore(data['geometry'])
+        return data
+
+    def _restore(self, geometry):
+        polygon = 'rings' in geometry or geometry.get('type') in POLYGON_TYPES
+
+        def restore(value):
+            if isinstance(value, dict):
+                if value.keys() == {RING_PLACEHOLDER}:
+                    ring = self.rings[value[RING_PLACEHOLDER]]
+                    return ring if polygon else ring.tolist()
+                return {key: restore(item) for key, item in value.items()}
+            if isinstance(value, list):
+                return [restore(item) for item in value]
+            return value
+
+        restored = restore(geometry)
+        return ParsedGeometry(restored) if polygon else restored
+
+
+class MarketAreaUploadParser(BaseParser):
+    """
+    JSON parser for market area create/update that streams the body
+    through MarketAreaBodyScanner. It deliberately does not subclass
+    JSONParser: DRF reads the whole of request.body up front for those
+    (capped by DATA_UPLOAD_MAX_MEMORY_SIZE), while other parsers get the
+    request stream. Non-UTF-8 bodies fall back to the regular parser.
+    """
+    media_type = 'application/json'
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = (parser_context.get('encoding') or settings.DEFAULT_CHARSET).lower().replace('_', '-')
+        if encoding not in ('utf-8', 'utf8'):
+            return FastJSONParser().parse(stream, media_type, parser_context)
+
+        limits = get_upload_limits()
+        request = parser_context.get('request')
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0) if request is not None else 0
+        except ValueError:
+            length = 0
+        if length > limits['MAX_BODY_BYTES']:
+            raise UploadTooLarge(f"Request body exceeds {limits['MAX_BODY_BYTES']} bytes")
+
+        scanner = MarketAreaBodyScanner(limits)
+        if stream is not None:
+            while True:
+                chunk = stream.read(limits['CHUNK_SIZE'])
+                if not chunk:
+                    break
+                scanner.feed(chunk)
+        scanner.feed(b'', final=True)
+        return scanner.result()
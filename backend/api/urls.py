@@ -1,12 +1,16 @@
 # urls.py
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import async_views
 from .views import (
     ColorKeyViewSet, TcgThemeViewSet, StylePresetViewSet,
     VariablePresetViewSet, CreateUserView, ProjectViewSet,
     MarketAreaList, MarketAreaReorder, MarketAreaDetail,
     AdminUserViewSet, EnrichmentUsageViewSet, MapConfigurationViewSet,
-    LabelPositionViewSet,
+    LabelPositionViewSet, DriveTimePolygonView, MarketAreaPointClassification,
+    MarketAreaVectorTile, DotDensityView, ClassBreaksView, BaselineView,
+    VariableCatalogSearch, VariableCatalogCategories, ProjectThumbnail,
+    ResponseCacheStats,
 )
 
 router = DefaultRouter()
@@ -29,9 +33,59 @@ urlpatterns = [
          MarketAreaList.as_view(), name='market-area-list'),
     path('projects/<uuid:project_id>/market-areas/reorder/',
          MarketAreaReorder.as_view(), name='market-area-reorder'),
+    path('projects/<uuid:project_id>/market-areas/classify-points/',
+         MarketAreaPointClassification.as_view(), name='market-area-classify-points'),
     path('projects/<uuid:project_id>/market-areas/<uuid:pk>/',
          MarketAreaDetail.as_view(), name='market-area-detail'),
+
+    # Mapbox Vector Tiles of a project's market areas
+    path('projects/<uuid:project_id>/tiles/<int:z>/<int:x>/<int:y>.mvt',
+         MarketAreaVectorTile.as_view(), name='market-area-tile'),
+
+    # Project list thumbnails
+    path('projects/<uuid:project_id>/thumbnail.png',
+         ProjectThumbnail.as_view(), name='project-thumbnail'),
+
+    # Cached drive time polygons
+    path('drive-time/polygons/',
+         DriveTimePolygonView.as_view(), name='drive-time-polygons'),
+
+    # Dot-density layer points
+    path('dot-density/points/',
+         DotDensityView.as_view(), name='dot-density-points'),
+
+    # Shared class breaks for class-breaks layers
+    path('class-breaks/',
+         ClassBreaksView.as_view(), name='class-breaks'),
+
+    # National baseline values and index-to-USA ratios
+    path('baseline/',
+         BaselineView.as_view(), name='baseline'),
+
+    # Enrichment variable catalog
+    path('variables/search/',
+         VariableCatalogSearch.as_view(), name='variable-search'),
+    path('variables/categories/',
+         VariableCatalogCategories.as_view(), name='variable-categories'),
+    path('variables/categories/<str:key>/',
+         VariableCatalogCategories.as_view(), name='variable-category-detail'),
          
+    # Per-project response cache counters
+    path('cache/stats/',
+         ResponseCacheStats.as_view(), name='response-cache-stats'),
+
+    # Async versions of the hot reads and the drive time proxy, for ASGI
+    path('async/projects/<uuid:pk>/',
+         async_views.project_detail, name='async-project-detail'),
+    path('async/projects/<uuid:project_id>/market-areas/',
+         async_views.market_area_list, name='async-market-area-list'),
+    path('async/map-configurations/',
+         async_views.map_configuration_list, name='async-map-configuration-list'),
+    path('async/label-positions/',
+         async_views.label_position_list, name='async-label-position-list'),
+    path('async/drive-time/polygons/',
+         async_views.drive_time_polygons, name='async-drive-time-polygons'),
+
     # Include router URLs at the API prefix
     path('api/', include(router.urls)),
     
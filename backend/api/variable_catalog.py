@@ -0,0 +1,141 @@
+"""
+Enrichment variable catalog.
+
+The catalog (data/variable_catalog.json, extracted from the frontend's
+analysisCategories) is loaded once per process into:
+
+- a set of every full id and short key, so preset validation is one lookup;
+- an inverted index from whole tokens to variables;
+- a prefix trie whose nodes carry the variables under them, so a prefix
+  lookup costs only the length of the prefix.
+
+Search ANDs the query tokens as prefixes and ranks exact token and key
+matches first.
+"""
+import json
+import os
+import re
+import threading
+
+
+CATALOG_FILE = os.path.join(os.path.dirname(__file__), 'data', 'variable_catalog.json')
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class PrefixTrie:
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, token, value):
+        node = self.root
+        for char in token:
+            node = node.setdefault(char, {})
+            node.setdefault('', set()).add(value)
+
+    def lookup(self, prefix):
+        node = self.root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return set()
+        return node.get('', set())
+
+
+class VariableCatalog:
+    def __init__(self, data):
+        self.categories = []
+        self.entries = []
+        self.by_id = {}
+        self.trie = PrefixTrie()
+        self.inverted = {}
+
+        for category in data['categories']:
+            groups = []
+            for variable in category['variables']:
+                if variable['id'] in self.by_id:
+                    continue
+                entry = {
+                    'id': variable['id'],
+                    'short_key': variable['id'].split('.')[-1],
+                    'label': variable['label'],
+                    'category': category['key'],
+                    'group': variable.get('group'),
+                }
+                self._add(entry)
+                if entry['group'] and entry['group'] not in groups:
+                    groups.append(entry['group'])
+            self.categories.append({
+                'key': category['key'],
+                'label': category['label'],
+                'groups': groups,
+            })
+
+        # Full ids and short keys are both accepted wherever variables are named
+        self.ids = set(self.by_id) | {entry['short_key'] for entry in self.entries}
+
+    def _add(self, entry):
+        index = len(self.entries)
+        self.entries.append(entry)
+        self.by_id[entry['id']] = entry
+        tokens = set(tokenize(entry['label'])) | set(tokenize(entry['id'])) | {entry['short_key'].lower()}
+        for token in tokens:
+            self.inverted.setdefault(token, set()).add(index)
+            self.trie.insert(token, index)
+
+    def __contains__(self, variable):
+        return isinstance(variable, str) and variable in self.ids
+
+    def unknown(self, variables):
+        return [variable for variable in variables if variable not in self]
+
+    def search(self, query, category=None, limit=50):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        matches = None
+        for token in tokens:
+            found = self.trie.lookup(token)
+            matches = found if matches is None else matches & found
+            if not matches:
+                return []
+
+        upper = query.strip().upper()
+        scored = []
+        for index in matches:
+            entry = self.entries[index]
+            if category and entry['category'] != category:
+                continue
+            score = sum(3 if index in self.inverted.get(token, ()) else 1 for token in tokens)
+            if entry['short_key'].upper() == upper or entry['id'].upper() == upper:
+                score += 10
+            elif entry['short_key'].upper().startswith(upper):
+                score += 5
+            scored.append((-score, index))
+
+        scored.sort()
+        return [{**self.entries[index], 'score': -score} for score, index in scored[:limit]]
+
+    def category(self, key, group=None):
+        return [
+            entry for entry in self.entries
+            if entry['category'] == key and (group is None or entry['group'] == group)
+        ]
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_variable_catalog():
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                with open(CATALOG_FILE) as f:
+                    _catalog = VariableCatalog(json.load(f))
+    return _catalog
@@ -2,7 +2,9 @@ from rest_framework import generics, status, viewsets, permissions, serializers
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.response import Response
 from rest_framework.decorators import action, permission_classes, api_view
+from rest_framework.settings import api_settings
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import transaction
 from django.db.models import Count, Q, Sum
 from django.utils import timezone
@@ -20,22 +22,48 @@ from .models import (
     MapConfiguration,
     LabelPosition
 )
+from .drive_time import TRAVEL_MODES, get_drive_time_service, get_drive_time_settings, RoutingError
+from .spatial_join import classify_points, records_from_csv, records_from_market_area
+from .overlap import get_project_overlap
+from .dot_density import get_dot_density
+from .class_breaks import apply_to_layer_configuration, class_break_infos, get_class_breaks
+from .baseline import get_baseline_store, to_json_values
+from .derived_metrics import get_compiled_formulas
+from .variable_catalog import get_variable_catalog
+from .label_placement import place_labels
+from .cloning import clone_project
+from .catalog_cache import (
+    COLOR_KEYS, GLOBAL_STYLE_PRESETS, GLOBAL_VARIABLE_PRESETS, TCG_THEMES, catalog_response,
+    merge_by_last_modified,
+)
+from .response_cache import ProjectResponseCacheMixin, bump_project, cache_project_response, cache_stats
+from .geometry import WEB_MERCATOR_WKIDS, lonlat_to_mercator, mercator_to_lonlat
+from .renderers import TopoJSONRenderer, accepts_raw_json
+from .fast_serializers import market_area_list_response
+from .uploads import MarketAreaUploadParser, UploadTooLarge
+from .compression import etag_matches, mark_encoded, negotiate, worth_compressing
+from . import thumbnails, vector_tiles
 from .serializers import (
     UserSerializer, ProjectListSerializer, ProjectDetailSerializer,
     MarketAreaSerializer, StylePresetSerializer, VariablePresetSerializer,
     ColorKeySerializer, TcgThemeSerializer, AdminUserSerializer,
     AdminUserUpdateSerializer, PasswordResetSerializer, EnrichmentUsageSerializer,
-    MapConfigurationSerializer, LabelPositionSerializer
+    MapConfigurationSerializer, LabelPositionSerializer, with_raw_json
 )
 from decimal import Decimal, ROUND_HALF_UP
 import csv
 import json
+import os
 
 
-class LabelPositionViewSet(viewsets.ModelViewSet):
+class LabelPositionViewSet(ProjectResponseCacheMixin, viewsets.ModelViewSet):
     serializer_class = LabelPositionSerializer
     permission_classes = [IsAuthenticated]
 
+    @cache_project_response(lambda view, request: request.query_params.get('project'))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     def get_queryset(self):
         project_id = self.request.query_params.get('project')
         map_config_id = self.request.query_params.get('map_configuration')
@@ -174,6 +202,120 @@ class LabelPositionViewSet(viewsets.ModelViewSet):
                 'details': str(e)
             }, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'])
+    def auto_place(self, request):
+        """
+        Compute initial label positions for a project's market areas and
+        bulk upsert them. Labels already saved are kept (and avoided)
+        unless 'overwrite' is true.
+
+        Body: project_id (required), map_configuration_id, font_size,
+        zoom (default: fit the project into viewport_width x viewport_height),
+        label_id_prefix (default 'id-', the ID SimplifiedLabelManager.getLabelId
+        gives a label whose attributes.id is the market area's id), overwrite.
+        """
+        project_id = request.data.get('project_id')
+        if not project_id:
+            return Response({
+                'error': 'Missing required fields',
+                'required': ['project_id']
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            project = Project.objects.get(id=project_id)
+        except Project.DoesNotExist:
+            return Response({
+                'error': f'Project with ID {project_id} does not exist'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        map_config = None
+        map_config_id = request.data.get('map_configuration_id')
+        if map_config_id:
+            try:
+                map_config = MapConfiguration.objects.get(id=map_config_id, project=project)
+            except MapConfiguration.DoesNotExist:
+                return Response({
+                    'error': f'MapConfiguration with ID {map_config_id} does not exist'
+                }, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            font_size = int(request.data.get('font_size', 10))
+            zoom = request.data.get('zoom')
+            zoom = int(zoom) if zoom is not None else None
+            viewport = (
+                float(request.data.get('viewport_width', 1280)),
+                float(request.data.get('viewport_height', 800)),
+            )
+        except (TypeError, ValueError) as e:
+            return Response({
+                'error': 'font_size, zoom and viewport sizes must be numbers',
+                'details': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        prefix = request.data.get('label_id_prefix', 'id-')
+        overwrite = bool(request.data.get('overwrite', False))
+
+        existing = {
+            position.label_id: position
+            for position in LabelPosition.objects.filter(project=project, map_configuration=map_config)
+        }
+        labels = []
+        for market_area in project.market_areas.filter(centroid_x__isnull=False).only(
+                'id', 'name', 'geometry', 'centroid_x', 'centroid_y', 'area', 'order'):
+            label_id = f'{prefix}{market_area.id}'
+            saved = existing.get(label_id)
+            labels.append({
+                'label_id': label_id,
+                'geometry': market_area.geometry,
+                'centroid': (market_area.centroid_x, market_area.centroid_y),
+                'text': saved.text if saved and saved.text else market_area.name,
+                'font_size': saved.font_size if saved else font_size,
+                'font_weight': saved.font_weight if saved else 'normal',
+                'priority': market_area.area or 0,
+                'fixed_offset': (saved.x_offset, saved.y_offset) if saved and not overwrite else None,
+            })
+
+        zoom, placements = place_labels(labels, zoom, viewport)
+
+        now = timezone.now()
+        to_create, to_update = [], []
+        for label, placement in zip(labels, placements):
+            if label['fixed_offset'] is not None:
+                continue
+            position = existing.get(label['label_id'])
+            if position is None:
+                to_create.append(LabelPosition(
+                    project=project,
+                    map_configuration=map_config,
+                    label_id=label['label_id'],
+                    x_offset=placement['x_offset'],
+                    y_offset=placement['y_offset'],
+                    font_size=label['font_size'],
+                    text=label['text'],
+                    created_by=request.user,
+                ))
+            else:
+                position.x_offset = placement['x_offset']
+                position.y_offset = placement['y_offset']
+                position.last_modified = now
+                to_update.append(position)
+
+        with transaction.atomic():
+            # A label saved by a concurrent request since `existing` was read is kept
+            LabelPosition.objects.bulk_create(to_create, ignore_conflicts=True)
+            LabelPosition.objects.bulk_update(to_update, ['x_offset', 'y_offset', 'last_modified'])
+            # Bulk writes send no signals
+            bump_project(project.id)
+
+        return Response({
+            'success': True,
+            'zoom': zoom,
+            'created': len(to_create),
+            'updated': len(to_update),
+            'kept': len(labels) - len(to_create) - len(to_update),
+            'collisions': sum(placement['collides'] for placement in placements),
+            'results': placements,
+        }, status=status.HTTP_200_OK)
+
 
 
 
@@ -182,11 +324,23 @@ class ColorKeyViewSet(viewsets.ModelViewSet):
     serializer_class = ColorKeySerializer
     permission_classes = [IsAuthenticated]
 
+    def list(self, request, *args, **kwargs):
+        return catalog_response(request, COLOR_KEYS)
+
+    def retrieve(self, request, *args, **kwargs):
+        return catalog_response(request, COLOR_KEYS, kwargs['pk'])
+
 class TcgThemeViewSet(viewsets.ModelViewSet):
     queryset = TcgTheme.objects.all().order_by('theme_key')
     serializer_class = TcgThemeSerializer
     permission_classes = [IsAuthenticated]
 
+    def list(self, request, *args, **kwargs):
+        return catalog_response(request, TCG_THEMES)
+
+    def retrieve(self, request, *args, **kwargs):
+        return catalog_response(request, TCG_THEMES, kwargs['pk'])
+
 class CreateUserView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
@@ -453,14 +607,33 @@ class EnrichmentUsageViewSet(viewsets.ModelViewSet):
                 'details': str(e)
             }, status=status.HTTP_400_BAD_REQUEST)
 
-class ProjectViewSet(viewsets.ModelViewSet):
+# Endpoints that return market area geometry can also be rendered as TopoJSON
+GEOMETRY_RENDERER_CLASSES = [*api_settings.DEFAULT_RENDERER_CLASSES, TopoJSONRenderer]
+
+# Market area writes stream large geometries instead of loading the whole body
+MARKET_AREA_PARSER_CLASSES = [MarketAreaUploadParser, *api_settings.DEFAULT_PARSER_CLASSES]
+
+
+def order_market_areas(queryset, ordering=None):
+    # Sorting by size uses the stored area column, not the geometry
+    if ordering in ('area', '-area'):
+        return queryset.order_by(ordering, 'order')
+    return queryset.order_by('order', '-last_modified')
+
+
+class ProjectViewSet(ProjectResponseCacheMixin, viewsets.ModelViewSet):
     queryset = Project.objects.all().order_by('-last_modified')
     permission_classes = [IsAuthenticated]
+    renderer_classes = GEOMETRY_RENDERER_CLASSES
     
     def get_serializer_class(self):
         if self.action == 'list':
             return ProjectListSerializer
         return ProjectDetailSerializer
+
+    @cache_project_response(lambda view, request: view.kwargs.get('pk'))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
     
     def get_queryset(self):
         queryset = self.queryset
@@ -479,22 +652,142 @@ class ProjectViewSet(viewsets.ModelViewSet):
             )
         return queryset
 
-class ProjectDetail(generics.RetrieveUpdateDestroyAPIView):
+    @action(detail=True, methods=['get'])
+    def extent(self, request, pk=None):
+        """
+        Combined extent of the project's market areas from the stored bbox
+        columns. Pass ?wkid=102100 for Web Mercator instead of WGS84.
+        """
+        try:
+            wkid = int(request.query_params.get('wkid', 4326))
+        except ValueError:
+            return Response({'error': 'wkid must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        extent = MarketArea.objects.filter(project_id=pk).extent()
+        if extent['xmin'] is None:
+            if not Project.objects.filter(id=pk).exists():
+                raise Http404
+            return Response({'extent': None})
+
+        if wkid in WEB_MERCATOR_WKIDS:
+            xs, ys = lonlat_to_mercator(
+                [extent['xmin'], extent['xmax']], [extent['ymin'], extent['ymax']]
+            )
+            extent = {'xmin': float(xs[0]), 'ymin': float(ys[0]), 'xmax': float(xs[1]), 'ymax': float(ys[1])}
+
+        return Response({'extent': {**extent, 'spatialReference': {'wkid': wkid}}})
+
+    @action(detail=True, methods=['get'], url_path='in-view')
+    def in_view(self, request, pk=None):
+        """
+        IDs of market areas whose bounding boxes intersect the viewport given
+        as ?bbox=xmin,ymin,xmax,ymax (WGS84, or Web Mercator with ?wkid=102100).
+        """
+        try:
+            xmin, ymin, xmax, ymax = (float(value) for value in request.query_params['bbox'].split(','))
+            wkid = int(request.query_params.get('wkid', 4326))
+        except (KeyError, ValueError):
+            return Response({
+                'error': 'bbox must be given as xmin,ymin,xmax,ymax'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        if wkid in WEB_MERCATOR_WKIDS:
+            xs, ys = mercator_to_lonlat([xmin, xmax], [ymin, ymax])
+            xmin, xmax, ymin, ymax = float(xs[0]), float(xs[1]), float(ys[0]), float(ys[1])
+
+        ids = list(MarketArea.objects.filter(project_id=pk).intersecting(
+            xmin, ymin, xmax, ymax
+        ).order_by().values_list('id', flat=True))
+        if not ids and not Project.objects.filter(id=pk).exists():
+            raise Http404
+        return Response({'market_areas': [str(market_area_id) for market_area_id in ids]})
+
+    @action(detail=True, methods=['get'])
+    def overlap(self, request, pk=None):
+        """
+        Pairwise intersection area and percent overlap between all market
+        areas of the project.
+        """
+        project = self.get_object()
+        queryset = MarketArea.objects.filter(project=project, geometry__isnull=False)
+        try:
+            return Response(get_project_overlap(project.id, queryset))
+        except Exception as e:
+            return Response({
+                'error': 'Failed to compute market area overlap',
+                'details': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=True, methods=['post'])
+    def clone(self, request, pk=None):
+        """
+        Copy the project with its market areas, map configurations, label
+        positions and project presets. project_number, client, location and
+        description in the body override the copied values.
+        """
+        source = self.get_object()
+        overrides = {
+            field: request.data[field]
+            for field in ('project_number', 'client', 'location', 'description')
+            if field in request.data
+        }
+        try:
+            project, copied = clone_project(source, overrides, request.user)
+        except Exception as e:
+            return Response({
+                'error': 'Failed to clone project',
+                'details': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'id': str(project.id),
+            'project_number': project.project_number,
+            'client': project.client,
+            'location': project.location,
+            'copied': copied,
+        }, status=status.HTTP_201_CREATED)
+
+class ProjectDetail(ProjectResponseCacheMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = ProjectDetailSerializer
     permission_classes = [IsAuthenticated]
+    renderer_classes = GEOMETRY_RENDERER_CLASSES
 
     def get_queryset(self):
         return Project.objects.all()
 
-class MarketAreaList(generics.ListCreateAPIView):
+    @cache_project_response(lambda view, request: view.kwargs.get('pk'))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+class MarketAreaList(ProjectResponseCacheMixin, generics.ListCreateAPIView):
     serializer_class = MarketAreaSerializer
     permission_classes = [IsAuthenticated]
+    renderer_classes = GEOMETRY_RENDERER_CLASSES
+    parser_classes = MARKET_AREA_PARSER_CLASSES
+
+    @cache_project_response(lambda view, request: view.kwargs.get('project_id'))
+    def list(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if accepts_raw_json(request) and renderer.get_indent(request.accepted_media_type, {}) is None:
+            # Plain JSON is rendered straight from values() rows, streamed when long
+            project_id = self.kwargs.get('project_id')
+            project_number = Project.objects.filter(id=project_id).values_list('project_number', flat=True).first()
+            queryset = self.order_queryset(MarketArea.objects.filter(project_id=project_id))
+            return market_area_list_response(queryset, project_number, renderer.media_type)
+        return super().list(request, *args, **kwargs)
 
     def get_queryset(self):
         project_id = self.kwargs.get('project_id')
-        return MarketArea.objects.filter(
+        queryset = MarketArea.objects.filter(
             project_id=project_id
-        ).select_related('project').order_by('order', '-last_modified')
+        ).select_related('project')
+        if self.request.method == 'GET' and accepts_raw_json(self.request):
+            # Geometry goes out as stored, without a decode/encode round trip
+            queryset = with_raw_json(queryset, 'geometry')
+        return self.order_queryset(queryset)
+
+    def order_queryset(self, queryset):
+        return order_market_areas(queryset, self.request.query_params.get('ordering'))
 
     def perform_create(self, serializer):
         project_id = self.kwargs.get('project_id')
@@ -504,6 +797,8 @@ class MarketAreaList(generics.ListCreateAPIView):
     def create(self, request, *args, **kwargs):
         try:
             return super().create(request, *args, **kwargs)
+        except UploadTooLarge:
+            raise
         except Exception as e:
             return Response(
                 {"detail": str(e)},
@@ -513,6 +808,8 @@ class MarketAreaList(generics.ListCreateAPIView):
 class MarketAreaDetail(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = MarketAreaSerializer
     permission_classes = [IsAuthenticated]
+    renderer_classes = GEOMETRY_RENDERER_CLASSES
+    parser_classes = MARKET_AREA_PARSER_CLASSES
 
     def get_queryset(self):
         project_id = self.kwargs.get('project_id')
@@ -523,6 +820,8 @@ class MarketAreaDetail(generics.RetrieveUpdateDestroyAPIView):
     def update(self, request, *args, **kwargs):
         try:
             return super().update(request, *args, **kwargs)
+        except UploadTooLarge:
+            raise
         except Exception as e:
             return Response(
                 {"detail": str(e)},
@@ -587,6 +886,150 @@ class MarketAreaReorder(generics.GenericAPIView):
                 {'error': str(e)}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+class MarketAreaPointClassification(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, project_id=None):
+        """
+        Classify points against every market area in the project.
+
+        Points come from an uploaded CSV ('file'), a JSON 'points' list of
+        records, or an existing custom/site_location market area
+        ('source_market_area'). Returns the containing market areas per point
+        and per-area counts and sums of numeric fields.
+        """
+        try:
+            source_id = request.data.get('source_market_area')
+            if 'file' in request.FILES:
+                records = records_from_csv(request.FILES['file'])
+            elif source_id:
+                try:
+                    source = MarketArea.objects.get(id=source_id, project_id=project_id)
+                except MarketArea.DoesNotExist:
+                    return Response({
+                        'error': f'Market area with ID {source_id} does not exist in this project'
+                    }, status=status.HTTP_404_NOT_FOUND)
+                records = records_from_market_area(source)
+            else:
+                records = request.data.get('points', [])
+
+            if not records or not isinstance(records, list):
+                return Response({
+                    'error': 'No points supplied',
+                    'required': ['file', 'points', 'source_market_area']
+                }, status=status.HTTP_400_BAD_REQUEST)
+            if not all(isinstance(record, dict) for record in records):
+                return Response({
+                    'error': 'Every point must be an object of field values'
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            sum_fields = request.data.get('sum_fields')
+            if isinstance(sum_fields, str):
+                sum_fields = [field for field in sum_fields.split(',') if field]
+
+            market_areas = MarketArea.objects.filter(
+                project_id=project_id, geometry__isnull=False
+            ).exclude(id=source_id)
+
+            result = classify_points(
+                records,
+                market_areas,
+                latitude_field=request.data.get('latitude_field'),
+                longitude_field=request.data.get('longitude_field'),
+                sum_fields=sum_fields or None,
+            )
+            return Response(result)
+
+        except ValueError as e:
+            return Response({
+                'error': 'Failed to classify points',
+                'details': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+
+class MarketAreaVectorTile(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, project_id=None, z=None, x=None, y=None):
+        """
+        Mapbox Vector Tile of the project's market areas, clipped and
+        simplified for the requested zoom, with style settings as feature
+        attributes. Tiles are cached on disk per project version.
+        """
+        if not vector_tiles.is_valid_tile(z, x, y):
+            return Response({'error': 'Invalid tile coordinates'}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = MarketArea.objects.filter(project_id=project_id)
+        version = vector_tiles.project_tile_version(queryset)
+        # Each encoding is its own representation with an ETag of its own
+        encoding = negotiate(request)
+        etags = [f'"{version}"'] + ([f'"{version}-{encoding}"'] if encoding is not None else [])
+        if any(etag_matches(request, etag) for etag in etags):
+            return HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+
+        path = vector_tiles.tile_cache_path(project_id, version, z, x, y)
+        content = vector_tiles.read_cached_tile(path)
+        if content is None:
+            if not Project.objects.filter(id=project_id).exists():
+                raise Http404
+
+            # Pad the lookup by the tile buffer so clipped edges stay seamless
+            xmin, ymin, xmax, ymax = vector_tiles.tile_bounds_lonlat(z, x, y)
+            pad_x = (xmax - xmin) * vector_tiles.BUFFER / vector_tiles.EXTENT
+            pad_y = (ymax - ymin) * vector_tiles.BUFFER / vector_tiles.EXTENT
+            market_areas = queryset.filter(geometry__isnull=False).intersecting(
+                xmin - pad_x, ymin - pad_y, xmax + pad_x, ymax + pad_y
+            ).only('id', 'name', 'short_name', 'ma_type', 'order', 'style_settings', 'geometry')
+
+            content = vector_tiles.encode_tile(market_areas, z, x, y)
+            vector_tiles.write_cached_tile(path, content)
+
+        # Compressed copies are stored next to the tile, so hits never recompress
+        if encoding is not None and not worth_compressing(content):
+            encoding = None
+        if encoding is not None:
+            content = vector_tiles.cached_tile_variant(path, content, encoding)
+        response = HttpResponse(content, content_type='application/vnd.mapbox-vector-tile')
+        response['ETag'] = f'"{version}-{encoding}"' if encoding is not None else f'"{version}"'
+        response['Cache-Control'] = 'private, no-cache'
+        return mark_encoded(response, encoding) if encoding is not None else response
+
+
+class ProjectThumbnail(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, project_id=None):
+        """
+        PNG preview of the project's market areas. Requests carrying the
+        current ?v= version (as in the project list's thumbnail_url) may be
+        cached indefinitely, once that version is up to date with the
+        market areas.
+        """
+        try:
+            with open(thumbnails.thumbnail_path(project_id), 'rb') as f:
+                content = f.read()
+                # The version of the file read, even if a redraw replaces it meanwhile
+                version = os.fstat(f.fileno()).st_mtime_ns
+        except FileNotFoundError:
+            if not Project.objects.filter(id=project_id).exists():
+                raise Http404
+            content = thumbnails.regenerate_thumbnail(project_id)
+            if content is None:
+                return Response({'error': 'Project has no market areas to draw'}, status=status.HTTP_404_NOT_FOUND)
+            version = thumbnails.thumbnail_version(project_id)
+
+        if etag_matches(request, f'"{version}"'):
+            return HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+
+        response = HttpResponse(content, content_type='image/png')
+        response['ETag'] = f'"{version}"'
+        if request.query_params.get('v') == str(version) and thumbnails.thumbnail_is_current(project_id, version):
+            response['Cache-Control'] = 'private, max-age=31536000, immutable'
+        else:
+            response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
 class StylePresetViewSet(viewsets.ModelViewSet):
     serializer_class = StylePresetSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -601,6 +1044,20 @@ class StylePresetViewSet(viewsets.ModelViewSet):
             )
         return queryset.filter(is_global=True)
 
+    def list(self, request, *args, **kwargs):
+        """
+        Global presets come pre-serialized from the catalog cache; only the
+        project's own presets are queried.
+        """
+        project_id = request.query_params.get('project')
+        if not project_id:
+            return catalog_response(request, GLOBAL_STYLE_PRESETS)
+        project_presets = StylePresetSerializer(
+            StylePreset.objects.filter(project_id=project_id, is_global=False).select_related('created_by', 'project'),
+            many=True
+        ).data
+        return Response(merge_by_last_modified(project_presets, GLOBAL_STYLE_PRESETS.get().payload))
+
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
@@ -636,6 +1093,20 @@ class VariablePresetViewSet(viewsets.ModelViewSet):
             )
         return queryset.filter(is_global=True)
 
+    def list(self, request, *args, **kwargs):
+        """
+        Global presets come pre-serialized from the catalog cache; only the
+        project's own presets are queried.
+        """
+        project_id = request.query_params.get('project')
+        if not project_id:
+            return catalog_response(request, GLOBAL_VARIABLE_PRESETS)
+        project_presets = VariablePresetSerializer(
+            VariablePreset.objects.filter(project_id=project_id, is_global=False).select_related('created_by', 'project'),
+            many=True
+        ).data
+        return Response(merge_by_last_modified(project_presets, GLOBAL_VARIABLE_PRESETS.get().payload))
+
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
@@ -648,6 +1119,37 @@ class VariablePresetViewSet(viewsets.ModelViewSet):
             preset.save()
         return Response({'status': 'preset is now global'})
 
+    @action(detail=True, methods=['post'])
+    def calculate(self, request, pk=None):
+        """
+        Evaluate the preset's formulas over an (areas x variables) matrix of
+        enriched 'values' whose columns are given by 'variables'.
+        """
+        preset = self.get_object()
+        variables = request.data.get('variables')
+        matrix = request.data.get('values')
+        if not isinstance(variables, list) or not isinstance(matrix, list):
+            return Response({
+                'error': 'Missing required fields',
+                'required': ['variables', 'values']
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            compiled = get_compiled_formulas(preset)
+            result = compiled.evaluate(variables, [
+                [value if value is not None else float('nan') for value in row] for row in matrix
+            ], request.data.get('geography', 'USA'))
+        except (TypeError, ValueError) as e:
+            return Response({
+                'error': 'Failed to calculate derived metrics',
+                'details': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'metrics': compiled.keys,
+            'values': [to_json_values(row) for row in result],
+        })
+
     def destroy(self, request, *args, **kwargs):
         try:
             return super().destroy(request, *args, **kwargs)
@@ -658,10 +1160,14 @@ class VariablePresetViewSet(viewsets.ModelViewSet):
             )
         
 
-class MapConfigurationViewSet(viewsets.ModelViewSet):
+class MapConfigurationViewSet(ProjectResponseCacheMixin, viewsets.ModelViewSet):
     serializer_class = MapConfigurationSerializer
     permission_classes = [IsAuthenticated]
 
+    @cache_project_response(lambda view, request: request.query_params.get('project'))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     def get_queryset(self):
         # Debugging: Print request parameters
         print(f"[Backend View] MapConfigurationViewSet: Action = {self.action}")
@@ -756,4 +1262,347 @@ class MapConfigurationViewSet(viewsets.ModelViewSet):
              return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             print(f"[Backend View] Error deleting configuration {kwargs.get('pk')}: {str(e)}")
-            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class DriveTimePolygonView(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        """
+        Resolve drive time polygons for a batch of points. Accepts the same
+        point shape the frontend stores in drive_time_points.
+        """
+        batch, error = drive_time_batch(request.data.get('points', []))
+        if error is not None:
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            results = get_drive_time_service().get_polygons(batch)
+        except RoutingError as e:
+            return Response({
+                'error': 'Failed to calculate drive time polygons',
+                'details': str(e)
+            }, status=status.HTTP_502_BAD_GATEWAY)
+
+        return Response(drive_time_polygons_body(batch, results))
+
+
+def drive_time_batch(points):
+    """(batch, None) for the request's points, or (None, error body) when they are invalid."""
+    if not points or not isinstance(points, list):
+        return None, {
+            'error': 'Missing required fields',
+            'required': ['points']
+        }
+    config = get_drive_time_settings()
+    if len(points) > config['MAX_BATCH_SIZE']:
+        return None, {
+            'error': f"At most {config['MAX_BATCH_SIZE']} points per request",
+            'count': len(points)
+        }
+
+    batch = []
+    for point in points:
+        if not isinstance(point, dict):
+            return None, {
+                'error': 'Each point must be an object',
+                'point': point
+            }
+        center = point.get('center', point)
+        try:
+            longitude = float(center['longitude'])
+            latitude = float(center['latitude'])
+            minutes = float(point.get('travelTimeMinutes', point.get('minutes')))
+        except (KeyError, TypeError, ValueError):
+            return None, {
+                'error': 'Each point needs longitude, latitude and travelTimeMinutes',
+                'point': point
+            }
+        if not (-180 <= longitude <= 180 and -90 <= latitude <= 90):
+            return None, {
+                'error': 'Coordinates must be WGS84 longitude and latitude',
+                'point': point
+            }
+        # Comparisons are False for NaN, so it is rejected too
+        if not 0 < minutes <= config['MAX_MINUTES']:
+            return None, {
+                'error': f"travelTimeMinutes must be above 0 and at most {config['MAX_MINUTES']}",
+                'point': point
+            }
+        travel_mode = point.get('travelMode', 'driving')
+        if not isinstance(travel_mode, str) or travel_mode not in TRAVEL_MODES:
+            return None, {
+                'error': 'Unsupported travelMode',
+                'supported': sorted(TRAVEL_MODES),
+                'point': point
+            }
+        batch.append((longitude, latitude, minutes, travel_mode))
+    return batch, None
+
+
+def drive_time_polygons_body(batch, results):
+    return {
+        'polygons': [
+            {
+                'center': {'longitude': longitude, 'latitude': latitude},
+                'travelTimeMinutes': minutes,
+                'travelMode': travel_mode,
+                'polygon': geometry,
+                'source': source,
+            }
+            for (longitude, latitude, minutes, travel_mode), (geometry, source)
+            in zip(batch, results)
+        ]
+    }
+
+
+class DotDensityView(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        """
+        Generate dot-density points for a layer config (as edited in
+        DotDensityEditor). Polygons come either as 'features' with geometry
+        and attributes, or as a 'project' whose market areas are paired with
+        per-area attribute 'values'. Pass 'vintage' to tie cached results to
+        a data release.
+        """
+        config = request.data.get('config')
+        if not isinstance(config, dict):
+            return Response({
+                'error': 'Missing required fields',
+                'required': ['config']
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            seed = int(request.data.get('seed', 0))
+        except (TypeError, ValueError):
+            return Response({'error': 'seed must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        vintage = request.data.get('vintage')
+
+        project_id = request.data.get('project')
+        if project_id:
+            values = request.data.get('values') or {}
+            if not isinstance(values, dict) or not all(isinstance(value, dict) for value in values.values()):
+                return Response({
+                    'error': 'values must map market area ids to attribute objects'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            market_areas = MarketArea.objects.filter(
+                project_id=project_id, geometry__isnull=False
+            ).order_by('order', 'id').only('id', 'geometry', 'last_modified')
+            features = [
+                {'id': str(area.id), 'geometry': area.geometry, 'attributes': values.get(str(area.id), {})}
+                for area in market_areas
+            ]
+            if vintage is None:
+                vintage = max((area.last_modified for area in market_areas), default=None)
+        else:
+            features = request.data.get('features', [])
+
+        if not features or not isinstance(features, list):
+            return Response({
+                'error': 'No polygons supplied',
+                'required': ['features', 'project']
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if not all(isinstance(feature, dict) and isinstance(feature.get('attributes') or {}, dict)
+                   for feature in features):
+            return Response({
+                'error': 'Each feature must be an object with an attributes object'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            return Response(get_dot_density(features, config, seed=seed, vintage=vintage))
+        except ValueError as e:
+            return Response({
+                'error': 'Failed to generate dot density points',
+                'details': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ClassBreaksView(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        """
+        Class breaks for a variable over an area type and extent, shared by
+        everyone requesting the same map and data. With a 'vintage' naming
+        the data release, 'values' are only needed when the breaks are not
+        cached yet. With 'map_configuration' (and its
+        'project') the breaks are also written into that configuration's
+        renderer spec.
+        """
+        variable = request.data.get('variable')
+        area_type = request.data.get('area_type')
+        if not variable or not area_type:
+            return Response({
+                'error': 'Missing required fields',
+                'required': ['variable', 'area_type']
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        extent = request.data.get('extent')
+        if isinstance(extent, dict):
+            extent = [extent.get(key) for key in ('xmin', 'ymin', 'xmax', 'ymax')]
+        values = request.data.get('values')
+
+        try:
+            classes = int(request.data.get('classes', 7))
+            result = get_class_breaks(
+                variable, area_type, extent, request.data.get('method', 'natural-breaks'), classes, values,
+                vintage=request.data.get('vintage'),
+            )
+        except (TypeError, ValueError) as e:
+            return Response({
+                'error': 'Failed to compute class breaks',
+                'details': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        if result is None:
+            return Response({
+                'error': 'Class breaks are not cached yet; include values',
+                'required': ['values']
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        response = {**result, 'classBreakInfos': class_break_infos(result)}
+        map_configuration_id = request.data.get('map_configuration')
+        if map_configuration_id:
+            project_id = request.data.get('project')
+            if not project_id:
+                return Response({
+                    'error': 'Missing required fields',
+                    'required': ['project']
+                }, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                configuration = MapConfiguration.objects.get(id=map_configuration_id, project_id=project_id)
+            except (MapConfiguration.DoesNotExist, DjangoValidationError):
+                return Response({
+                    'error': f'Map configuration with ID {map_configuration_id} does not exist in this project'
+                }, status=status.HTTP_404_NOT_FOUND)
+            configuration.layer_configuration = apply_to_layer_configuration(
+                configuration.layer_configuration, variable, result
+            )
+            configuration.save(update_fields=['layer_configuration', 'last_modified'])
+            response['layer_configuration'] = configuration.layer_configuration
+
+        return Response(response)
+
+
+class BaselineView(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def unavailable(self):
+        return Response({
+            'error': 'No baseline data loaded',
+            'details': 'Run manage.py load_baseline'
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def get(self, request):
+        """
+        Baseline values for ?variables=KEY1,KEY2 (full ids or short keys)
+        and ?geography= (default USA).
+        """
+        variables = [key for key in request.query_params.get('variables', '').split(',') if key]
+        if not variables:
+            return Response({
+                'error': 'Missing required fields',
+                'required': ['variables']
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        store = get_baseline_store()
+        if store is None:
+            return self.unavailable()
+        geography = request.query_params.get('geography', 'USA')
+        values = to_json_values(store.lookup(variables, geography))
+        return Response({
+            'vintage': store.vintage,
+            'geography': geography,
+            'values': dict(zip(variables, values)),
+        })
+
+    def post(self, request):
+        """
+        Index an (areas x variables) matrix of enriched 'values' against the
+        baseline for 'variables': value / baseline * 100.
+        """
+        variables = request.data.get('variables')
+        matrix = request.data.get('values')
+        if not isinstance(variables, list) or not isinstance(matrix, list):
+            return Response({
+                'error': 'Missing required fields',
+                'required': ['variables', 'values']
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        store = get_baseline_store()
+        if store is None:
+            return self.unavailable()
+        try:
+            ratios = store.ratio(variables, [
+                [value if value is not None else float('nan') for value in row] for row in matrix
+            ], request.data.get('geography', 'USA'))
+        except (TypeError, ValueError) as e:
+            return Response({
+                'error': 'values must be a numeric matrix with one column per variable',
+                'details': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'vintage': store.vintage,
+            'variables': variables,
+            'ratios': [to_json_values(row) for row in ratios],
+        })
+
+
+class VariableCatalogSearch(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """
+        Ranked search of enrichment variables by label, full id or short key.
+        ?q= is required; ?category= and ?limit= (default 50, max 500) are optional.
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({
+                'error': 'Missing required fields',
+                'required': ['q']
+            }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 50)), 1), 500)
+        except ValueError as e:
+            return Response({
+                'error': 'limit must be an integer',
+                'details': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        results = get_variable_catalog().search(query, request.query_params.get('category'), limit)
+        return Response({'query': query, 'count': len(results), 'results': results})
+
+
+class VariableCatalogCategories(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, key=None):
+        """
+        Catalog categories with their groups, or the variables of one
+        category (optionally ?group=) when a key is given.
+        """
+        catalog = get_variable_catalog()
+        if key is None:
+            return Response([
+                {**category, 'count': len(catalog.category(category['key']))}
+                for category in catalog.categories
+            ])
+
+        category = next((category for category in catalog.categories if category['key'] == key), None)
+        if category is None:
+            return Response({'error': f'Unknown category: {key}'}, status=status.HTTP_404_NOT_FOUND)
+        variables = catalog.category(key, request.query_params.get('group'))
+        return Response({**category, 'count': len(variables), 'variables': variables})
+
+
+class ResponseCacheStats(generics.GenericAPIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        """Hit/miss counters of the per-project response cache."""
+        return Response(cache_stats())
@@ -2,6 +2,9 @@
 ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Production serves it with uvicorn workers under gunicorn when
+SERVER_INTERFACE=asgi (see gunicorn.conf.py); the async views in
+api/async_views.py then run on the workers' event loops.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
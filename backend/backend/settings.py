@@ -13,11 +13,21 @@ ALLOWED_HOSTS = ["*"]
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "api.authentication.CachedJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    # orjson-backed when installed, stdlib JSON otherwise
+    "DEFAULT_RENDERER_CLASSES": [
+        "api.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "api.parsers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
 }
 
 SIMPLE_JWT = {
@@ -37,6 +47,43 @@ SIMPLE_JWT = {
     "TOKEN_TYPE_CLAIM": "token_type",
 }
 
+# gzip, plus br when the brotli package is installed (api.compression)
+RESPONSE_COMPRESSION = {
+    "MIN_LENGTH": 1024,
+    "GZIP_LEVEL": 6,
+    "STORED_GZIP_LEVEL": 9,
+}
+
+# Checked while market area create/update bodies stream in (api.uploads)
+MARKET_AREA_UPLOAD_LIMITS = {
+    "MAX_BODY_BYTES": int(os.getenv("MARKET_AREA_MAX_BODY_BYTES", 64 * 1024 * 1024)),
+    "MAX_VERTICES": int(os.getenv("MARKET_AREA_MAX_VERTICES", 1_000_000)),
+    "MAX_RINGS": 50_000,
+}
+
+# Resolved JWT users are cached this long; user saves and deletes drop the entry
+AUTH_USER_CACHE = {
+    "TIMEOUT": 300,
+}
+
+DRIVE_TIME = {
+    "PROVIDER": os.getenv("DRIVE_TIME_PROVIDER", "api.drive_time.EsriServiceAreaProvider"),
+    "API_KEY": os.getenv("ARCGIS_API_KEY", ""),
+    "COORDINATE_PRECISION": 4,  # ~11 m, close enough to reuse a solved polygon
+    "MEMORY_CACHE_SIZE": 512,
+    "MAX_CONCURRENCY": 4,
+    "TIMEOUT": 30,
+}
+
+# Encoded Mapbox Vector Tiles, one directory per project and version
+VECTOR_TILE_CACHE_DIR = os.getenv("VECTOR_TILE_CACHE_DIR", str(BASE_DIR / "tile_cache"))
+
+# Memory-mapped national baseline vintages written by `manage.py load_baseline`
+BASELINE_DATA_DIR = os.getenv("BASELINE_DATA_DIR", str(BASE_DIR / "baseline_data"))
+
+# Project list thumbnails, one PNG per project, redrawn when market areas change
+PROJECT_THUMBNAIL_DIR = os.getenv("PROJECT_THUMBNAIL_DIR", str(BASE_DIR / "thumbnails"))
+
 INSTALLED_APPS = [
     "django.contrib.admin",
     "django.contrib.auth",
@@ -52,6 +99,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
+    # Early in the list so it sees the final body; cached bodies arrive pre-compressed
+    "api.compression.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -92,9 +141,35 @@ DATABASES = {
         'OPTIONS': {
             'sslmode': 'require',
         },
+        # Reuse each worker thread's TLS connection to Azure instead of reconnecting per request;
+        # that is one open connection per gunicorn thread (see gunicorn.conf.py)
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# One cache shared by every worker process, so invalidations (project response
+# versions, cached JWT users, catalog versions) reach all of them at once.
+# Redis when REDIS_URL is set. Without it each process gets a cache of its
+# own, which is only correct for a single process (runserver, tests);
+# gunicorn.conf.py refuses to start several workers without REDIS_URL. A
+# database-backed cache would cost more queries per hit than it saves.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'default',
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        }
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -0,0 +1,73 @@
+"""
+Gunicorn settings for the production web process (see Procfile).
+
+Requests mostly wait on the remote Postgres server and on Esri services, so
+each worker process runs a pool of threads: a slow export or enrichment
+call holds one thread, not the whole process. Processes give CPU-bound work
+(tile encoding, thumbnails, JSON rendering) real parallelism; threads cover
+the I/O waits. Every value can be overridden from the environment.
+
+SERVER_INTERFACE=asgi serves backend/asgi.py with uvicorn workers instead,
+for the async endpoints under /api/async/ (api/async_views.py): a request
+waiting on Postgres or Esri there holds no thread. Sync views still work
+under ASGI, each request on a thread of its own.
+
+Graceful reload: `kill -HUP <master pid>` starts workers on the new code and
+lets the old ones finish their requests (up to graceful_timeout).
+"""
+import multiprocessing
+import os
+
+
+def _int(name, default):
+    return int(os.getenv(name, default))
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+# Two processes per core plus one, capped so a large host doesn't exhaust
+# Postgres connections. Under WSGI every thread keeps its connection open for
+# DB_CONN_MAX_AGE seconds (settings.py), so a host holds up to workers x
+# threads connections: 9 x 4 = 36 with the defaults. Keep that times the
+# number of hosts below the server's max_connections, lowering
+# WEB_CONCURRENCY or GUNICORN_THREADS (or DB_CONN_MAX_AGE=0) if not.
+workers = _int('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 9))
+threads = _int('GUNICORN_THREADS', 4)
+
+# Response, auth and catalog caches are invalidated through the shared cache
+# (CACHES in settings); per-process caches would let workers serve stale data
+if workers > 1 and not os.getenv('REDIS_URL'):
+    raise RuntimeError('Set REDIS_URL to run more than one worker (or set WEB_CONCURRENCY=1)')
+
+if os.getenv('SERVER_INTERFACE', 'wsgi') == 'asgi':
+    try:
+        import uvicorn_worker  # noqa: F401
+    except ImportError:
+        raise RuntimeError('SERVER_INTERFACE=asgi needs the uvicorn-worker package (requirements.txt)')
+    wsgi_app = 'backend.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+    # Under ASGI every request runs its queries on a new thread, so a
+    # persistent connection would never be reused; connect per request
+    os.environ.setdefault('DB_CONN_MAX_AGE', '0')
+else:
+    wsgi_app = 'backend.wsgi:application'
+    worker_class = 'gthread'
+
+# Long enough for exports and drive-time batches; stuck workers are replaced
+timeout = _int('GUNICORN_TIMEOUT', 120)
+graceful_timeout = _int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = _int('GUNICORN_KEEPALIVE', 5)
+
+# Recycle workers after a number of requests (jittered so they don't all
+# restart together) to cap memory growth from large geometry payloads
+max_requests = _int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = _int('GUNICORN_MAX_REQUESTS_JITTER', 100)
+
+# Heartbeat files on tmpfs; a slow disk can otherwise make healthy workers look hung
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+# Only trust X-Forwarded-* headers from a proxy on the same host unless told otherwise
+forwarded_allow_ips = os.getenv('FORWARDED_ALLOW_IPS', '127.0.0.1')